@@ -1,11 +1,21 @@
 import os
 import logging
 from functools import wraps
+from datetime import date, timedelta
 
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, request, jsonify, render_template
 
-from app.models import db, Food, now_utc, safe_int, safe_float
+from app.models import db, Food, AIUsageDaily, now_utc, now_wib_date, safe_int, safe_float
 from app.routes import rate_limit, allowed_file, upload_to_supabase
+from app.ai_metrics import metrics, fastpath_stats
+from app.upstream_policy import gemini_breaker
+from app.ai_gateway import ai_gateway
+from app.ai_json import json_parse_stats
+from app.model_router import model_router
+from app.food_search import food_search_filter, food_search_order, food_cursor_page
+from app.pagination import InvalidCursorError
+from app.food_catalog import food_catalog, bump_catalog_version, find_global_by_name
+from app.food_autocomplete import food_autocomplete
 
 admin_bp = Blueprint('admin', __name__)
 logger   = logging.getLogger('nutriai.admin')
@@ -90,10 +100,20 @@ def admin_list_foods():
         Food.deleted_at.is_(None),
     )
     if q:
-        query = query.filter(Food.nama_makanan.ilike(f'%{q}%'))
+        query = query.filter(food_search_filter(q))
+
+    # cursor=... (kosong = halaman pertama) → keyset pagination, tanpa COUNT
+    # kecuali with_total=1. Tanpa cursor → page/limit lama (app versi lama).
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            return jsonify(food_cursor_page(query, q, limit, cursor, 'admin-foods',
+                                            with_total=request.args.get('with_total') == '1')), 200
+        except InvalidCursorError as e:
+            return jsonify({'error': str(e)}), 400
 
     total = query.count()
-    foods = query.order_by(Food.id.desc()).offset((page - 1) * limit).limit(limit).all()
+    foods = query.order_by(*food_search_order(q)).offset((page - 1) * limit).limit(limit).all()
 
     return jsonify({
         'data':        [f.to_dict() for f in foods],
@@ -111,8 +131,10 @@ def admin_create_food():
     if not nama_makanan:
         return jsonify({'error': 'Nama makanan wajib diisi'}), 400
 
-    # Cek duplikat khusus di scope makanan master saja
-    existing = Food.query.filter(
+    # Cek duplikat khusus di scope makanan master saja. Nama dibandingkan
+    # setelah dinormalisasi ("Nasi Putih" = "Nasi"); query persis ke DB tetap
+    # ada karena snapshot worker ini bisa tertinggal dari admin lain.
+    existing = find_global_by_name(nama_makanan) or Food.query.filter(
         Food.nama_makanan.ilike(nama_makanan),
         Food.user_id.is_(None),
         Food.deleted_at.is_(None),
@@ -144,7 +166,9 @@ def admin_create_food():
         is_verified    = True,   # data master dianggap sudah terverifikasi admin
     )
     db.session.add(food)
+    bump_catalog_version()
     db.session.commit()
+    food_catalog.invalidate()
     return jsonify(food.to_dict()), 201
 
 
@@ -179,7 +203,9 @@ def admin_update_food(food_id):
             if new_url:
                 food.image = new_url
 
+    bump_catalog_version()
     db.session.commit()
+    food_catalog.invalidate()
     return jsonify(food.to_dict()), 200
 
 
@@ -196,5 +222,81 @@ def admin_delete_food(food_id):
 
     # Soft-delete, konsisten dengan cara /api/foods (user biasa) menghapus data.
     food.deleted_at = now_utc()
+    bump_catalog_version()
     db.session.commit()
-    return jsonify({'status': 'success'}), 200
\ No newline at end of file
+    food_catalog.invalidate()
+    return jsonify({'status': 'success'}), 200
+
+
+# ─────────────────────────────────────────────────────────
+#  METRIK AI
+#  Angka per worker gunicorn (in-memory, reset saat restart) —
+#  lihat app/ai_metrics.py.
+# ─────────────────────────────────────────────────────────
+@admin_bp.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def admin_metrics():
+    # ?format=prometheus → teks exposition untuk di-scrape Prometheus.
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify({
+        'pid':               os.getpid(),
+        'jarvis_fastpath':   fastpath_stats(),
+        'circuit_breaker':   gemini_breaker.snapshot(),
+        'ai_gateway':        ai_gateway.snapshot(),
+        'ai_json':           json_parse_stats(),
+        'model_router':      model_router.snapshot(),
+        'food_catalog':      food_catalog.snapshot(),
+        'food_autocomplete': food_autocomplete.snapshot(),
+        'counters':          metrics.snapshot(),
+    }), 200
+
+
+# ─────────────────────────────────────────────────────────
+#  PEMAKAIAN AI PER USER PER HARI
+#  Dari tabel ai_usage_daily (lihat app/ai_usage.py) — tahan restart,
+#  gabungan semua worker.
+# ─────────────────────────────────────────────────────────
+@admin_bp.route('/api/admin/ai-usage', methods=['GET'])
+@admin_required
+def admin_ai_usage():
+    """
+    Query: ?date=YYYY-MM-DD (default hari ini WIB) &days=1..31 &user_id=
+    Return ringkasan per user per hari (diurut token terbanyak) + total per endpoint.
+    """
+    try:
+        end = date.fromisoformat(request.args['date']) if request.args.get('date') else now_wib_date()
+    except ValueError:
+        return jsonify({'error': 'Format date harus YYYY-MM-DD'}), 400
+    days  = max(1, min(safe_int(request.args.get('days', 1), 1), 31))
+    start = end - timedelta(days=days - 1)
+
+    q = AIUsageDaily.query.filter(AIUsageDaily.tanggal.between(start, end))
+    if request.args.get('user_id'):
+        q = q.filter(AIUsageDaily.user_id == safe_int(request.args.get('user_id')))
+    rows = q.all()
+
+    per_user, per_endpoint = {}, {}
+    for r in rows:
+        u = per_user.setdefault((r.user_id, r.tanggal), {
+            'user_id': r.user_id, 'tanggal': r.tanggal.isoformat(), 'calls': 0, 'errors': 0,
+            'prompt_tokens': 0, 'output_tokens': 0, 'endpoints': {},
+        })
+        e = per_endpoint.setdefault(r.endpoint, {
+            'calls': 0, 'errors': 0, 'attempts': 0, 'prompt_tokens': 0, 'output_tokens': 0, 'latency_ms': 0,
+        })
+        for k in ('calls', 'errors', 'prompt_tokens', 'output_tokens'):
+            u[k] += getattr(r, k)
+        for k in e:
+            e[k] += getattr(r, k)
+        u['endpoints'][r.endpoint] = r.to_dict()
+
+    for e in per_endpoint.values():
+        e['avg_latency_ms'] = round(e.pop('latency_ms') / e['calls']) if e['calls'] else 0
+
+    return jsonify({
+        'from':         start.isoformat(),
+        'to':           end.isoformat(),
+        'per_endpoint': per_endpoint,
+        'per_user_day': sorted(per_user.values(), key=lambda u: -(u['prompt_tokens'] + u['output_tokens'])),
+    }), 200
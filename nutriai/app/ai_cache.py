@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  CACHE HASIL AI (LRU + TTL, opsional tier disk)
+# ─────────────────────────────────────────────────────────
+# Dipakai untuk hasil yang murni bergantung pada input (mis. analisis foto
+# makanan — foto yang sama = jawaban yang sama), jadi key-nya hash konten,
+# bukan user. Tier memori per-proses; tier disk (kalau diset direktorinya)
+# dibagi antar worker gunicorn di mesin yang sama dan selamat dari restart.
+
+class LRUTTLCache:
+    def __init__(self, maxsize: int, ttl: float, disk_dir: str = None, disk_max_entries: int = 0):
+        self.maxsize          = max(int(maxsize), 0)
+        self.ttl              = ttl
+        self.disk_dir         = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self._data            = OrderedDict()   # key -> (expires_at, value)
+        self._lock            = threading.Lock()
+        self._disk_writes     = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # ── memori ──────────────────────────────────────────
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item:
+                if item[0] > now:
+                    self._data.move_to_end(key)
+                    return item[1]
+                del self._data[key]
+        value, expires_at = self._disk_get(key, now)
+        if value is not None:
+            self._mem_set(key, value, expires_at)
+        return value
+
+    def set(self, key: str, value):
+        expires_at = time.time() + self.ttl
+        self._mem_set(key, value, expires_at)
+        self._disk_set(key, value, expires_at)
+
+    def _mem_set(self, key, value, expires_at):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    # ── disk ────────────────────────────────────────────
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _disk_get(self, key: str, now: float):
+        if not self.disk_dir:
+            return None, 0
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None, 0
+        if item.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, 0
+        return item.get('value'), item['expires_at']
+
+    def _disk_set(self, key: str, value, expires_at: float):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp  = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp, path)   # atomic — worker lain tidak pernah baca file setengah jadi
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('[AICache] gagal tulis cache disk %s: %s', path, e)
+            return
+        self._disk_writes += 1
+        if self.disk_max_entries and self._disk_writes % 100 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        """Buang file paling lama kalau jumlah entry disk melebihi batas."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        excess = len(files) - self.disk_max_entries
+        if excess <= 0:
+            return
+        for _, path in sorted(files)[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Cache hasil /api/ai/analyze-image, key = sha256 byte gambar.
+image_analysis_cache = LRUTTLCache(
+    maxsize          = int(os.environ.get('AI_IMAGE_CACHE_SIZE', 512)),
+    ttl              = float(os.environ.get('AI_IMAGE_CACHE_TTL', 7 * 24 * 3600)),
+    disk_dir         = os.environ.get('AI_IMAGE_CACHE_DIR', ''),
+    disk_max_entries = int(os.environ.get('AI_IMAGE_CACHE_DISK_MAX', 10000)),
+)
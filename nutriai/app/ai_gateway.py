@@ -0,0 +1,289 @@
+import os
+import time
+import bisect
+import logging
+import itertools
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from app.ai_metrics import metrics
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  AI GATEWAY (executor terbatas untuk panggilan upstream)
+# ─────────────────────────────────────────────────────────
+# Semua panggilan ke Gemini (termasuk sleep di antara retry) dijalankan di
+# thread pool khusus yang ukurannya DIBATASI (AI_MAX_INFLIGHT), bukan
+# langsung di thread request. Dikombinasikan dengan worker gthread di
+# gunicorn (lihat gunicorn.conf.py), efeknya:
+#   - Paling banyak AI_MAX_INFLIGHT thread request per proses yang sedang
+#     menunggu Gemini; sisa thread selalu bebas melayani /api/dashboard dkk.
+#   - Paling banyak AI_MAX_QUEUE request boleh menunggu slot (maks
+#     AI_QUEUE_TIMEOUT detik). Lebih dari itu langsung ditolak (429) —
+#     request yang menunggu slot juga memakan thread, jadi antrean panjang
+#     sama saja dengan menyumbat worker.
+#   - Thread request berhenti menunggu setelah AI_REQUEST_DEADLINE detik
+#     walaupun upstream masih jalan (hasilnya dibuang begitu selesai).
+#
+# Penjadwalan slot:
+#   - Per user: maks AI_USER_MAX_INFLIGHT panggilan jalan bersamaan dan
+#     AI_USER_MAX_QUEUE yang menunggu. Beberapa user yang spam /api/ai/chat
+#     tidak bisa menghabiskan semua slot.
+#   - Prioritas: 'interactive' (voice, chat, foto, saran menu) selalu dapat
+#     slot kosong duluan dibanding 'batch' (weekly-analysis, ringkasan
+#     memori, job scheduler). Batch juga dibatasi AI_BATCH_MAX_INFLIGHT slot
+#     supaya selalu ada sisa untuk interactive, dan kalau antrean penuh,
+#     batch yang sedang menunggu digeser keluar oleh request interactive.
+#   - Pekerjaan background (scheduler, ringkasan memori) tidak memegang
+#     thread request, jadi boleh menunggu lebih lama (AI_BACKGROUND_QUEUE_TIMEOUT).
+# Kedalaman antrean & in-flight per prioritas ada di gauge
+# ai_gateway_queue_depth / ai_gateway_inflight, lama menunggu di histogram
+# ai_gateway_queue_wait_ms, dan request yang ditolak di ai_gateway_shed_total.
+
+AI_MAX_INFLIGHT       = int(os.environ.get('AI_MAX_INFLIGHT', 8))
+AI_MAX_QUEUE          = int(os.environ.get('AI_MAX_QUEUE', AI_MAX_INFLIGHT // 2))
+AI_QUEUE_TIMEOUT      = float(os.environ.get('AI_QUEUE_TIMEOUT', 2))
+AI_REQUEST_DEADLINE   = float(os.environ.get('AI_REQUEST_DEADLINE', 90))
+AI_USER_MAX_INFLIGHT  = int(os.environ.get('AI_USER_MAX_INFLIGHT', 2))
+AI_USER_MAX_QUEUE     = int(os.environ.get('AI_USER_MAX_QUEUE', 2))
+AI_BATCH_MAX_INFLIGHT = int(os.environ.get('AI_BATCH_MAX_INFLIGHT', max(1, AI_MAX_INFLIGHT // 4)))
+AI_BACKGROUND_QUEUE_TIMEOUT = float(os.environ.get('AI_BACKGROUND_QUEUE_TIMEOUT', 30))
+
+INTERACTIVE = 'interactive'
+BATCH       = 'batch'
+PRIORITIES  = (INTERACTIVE, BATCH)
+
+# Endpoint (label UpstreamCall, lihat app/ai_usage.py) → prioritas. Yang
+# tidak disebut = interactive.
+BATCH_ENDPOINTS      = {'weekly-analysis', 'weekly-analysis/stream', 'weekly-analysis/scheduled', 'conversation-summary'}
+BACKGROUND_ENDPOINTS = {'weekly-analysis/scheduled', 'conversation-summary'}
+
+QUEUE_WAIT_BUCKETS_MS = (5, 25, 100, 250, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+def priority_for(endpoint: str) -> str:
+    return BATCH if endpoint in BATCH_ENDPOINTS else INTERACTIVE
+
+
+class AIGatewayBusy(RuntimeError):
+    """Semua slot upstream sedang terpakai — request di-shed, bukan diantrekan."""
+    retry_after = 2
+
+
+class AIUserBusy(AIGatewayBusy):
+    """User ini sudah memakai jatah panggilan AI paralelnya."""
+    retry_after = 5
+
+
+class AIGatewayTimeout(RuntimeError):
+    """Upstream tidak selesai dalam batas waktu request."""
+
+
+class _Waiter:
+    __slots__ = ('rank', 'priority', 'user_id', 'evicted')
+
+    def __init__(self, rank: tuple, priority: str, user_id):
+        self.rank     = rank
+        self.priority = priority
+        self.user_id  = user_id
+        self.evicted  = False
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+
+class Ticket:
+    """1 slot upstream yang sudah didapat. release() boleh dipanggil berkali-kali."""
+
+    def __init__(self, gateway, priority: str, user_id):
+        self._gateway = gateway
+        self.priority = priority
+        self.user_id  = user_id
+        self._held    = True
+
+    def release(self):
+        self._gateway._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AIGateway:
+    def __init__(self, max_inflight: int = AI_MAX_INFLIGHT, max_queue: int = AI_MAX_QUEUE,
+                 queue_timeout: float = AI_QUEUE_TIMEOUT, deadline: float = AI_REQUEST_DEADLINE,
+                 user_max_inflight: int = AI_USER_MAX_INFLIGHT, user_max_queue: int = AI_USER_MAX_QUEUE,
+                 batch_max_inflight: int = AI_BATCH_MAX_INFLIGHT,
+                 background_queue_timeout: float = AI_BACKGROUND_QUEUE_TIMEOUT):
+        self.max_inflight             = max_inflight
+        self.max_queue                = max_queue
+        self.queue_timeout            = queue_timeout
+        self.deadline                 = deadline
+        self.user_max_inflight        = user_max_inflight
+        self.user_max_queue           = user_max_queue
+        self.batch_max_inflight       = batch_max_inflight
+        self.background_queue_timeout = background_queue_timeout
+        self._executor     = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='ai-upstream')
+        self._cond         = threading.Condition()
+        self._seq          = itertools.count()
+        self._waiters      = []                   # urut prioritas lalu waktu datang
+        self._inflight_by  = dict.fromkeys(PRIORITIES, 0)
+        self._user_running = defaultdict(int)
+        self._user_waiting = defaultdict(int)
+
+    @property
+    def inflight(self) -> int:
+        return sum(self._inflight_by.values())
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'inflight':           self.inflight,
+                'waiting':            self.waiting,
+                'max_inflight':       self.max_inflight,
+                'max_queue':          self.max_queue,
+                'per_priority':       {
+                    p: {'inflight': self._inflight_by[p], 'waiting': sum(w.priority == p for w in self._waiters)}
+                    for p in PRIORITIES
+                },
+                'active_users':       len(self._user_running),
+                'user_max_inflight':  self.user_max_inflight,
+                'batch_max_inflight': self.batch_max_inflight,
+            }
+
+    # ── Penjadwalan (semua dipanggil dengan self._cond dipegang) ──────────────
+    def _can_start(self, w: _Waiter) -> bool:
+        return (self.inflight < self.max_inflight
+                and (w.user_id is None or self._user_running.get(w.user_id, 0) < self.user_max_inflight)
+                and (w.priority != BATCH or self._inflight_by[BATCH] < self.batch_max_inflight))
+
+    def _next_runnable(self):
+        """Waiter paling depan (prioritas, lalu FIFO) yang boleh jalan sekarang."""
+        return next((w for w in self._waiters if self._can_start(w)), None)
+
+    def _start(self, w: _Waiter) -> Ticket:
+        self._inflight_by[w.priority] += 1
+        if w.user_id is not None:
+            self._user_running[w.user_id] += 1
+        self._update_gauges()
+        return Ticket(self, w.priority, w.user_id)
+
+    def _update_gauges(self):
+        for p in PRIORITIES:
+            metrics.set_gauge('ai_gateway_inflight', self._inflight_by[p], priority=p)
+            metrics.set_gauge('ai_gateway_queue_depth', sum(w.priority == p for w in self._waiters), priority=p)
+
+    def _shed(self, w: _Waiter, reason: str, exc_type=AIGatewayBusy):
+        metrics.inc('ai_gateway_shed_total', priority=w.priority, reason=reason)
+        logger.warning('[AIGateway] request %s user=%s di-shed (%s): %d in-flight, %d antre',
+                       w.priority, w.user_id, reason, self.inflight, len(self._waiters))
+        if exc_type is AIUserBusy:
+            return AIUserBusy('Permintaan AI kamu masih diproses, tunggu sebentar lalu coba lagi')
+        return AIGatewayBusy('Server AI sedang sibuk, coba lagi sebentar lagi')
+
+    def admit(self, user_id=None, endpoint: str = None) -> Ticket:
+        """
+        Ambil 1 slot upstream untuk user/endpoint ini (menunggu kalau perlu),
+        atau raise AIGatewayBusy / AIUserBusy. Slot wajib di-release().
+        Streaming (SSE) memanggil ini langsung sebelum mengirim 200, lalu
+        memegang ticket-nya selama membaca response upstream.
+        """
+        priority   = priority_for(endpoint)
+        timeout    = self.background_queue_timeout if endpoint in BACKGROUND_ENDPOINTS else self.queue_timeout
+        w          = _Waiter((PRIORITIES.index(priority), next(self._seq)), priority, user_id)
+        started_at = time.monotonic()
+
+        with self._cond:
+            if self._can_start(w) and self._next_runnable() is None:
+                metrics.observe('ai_gateway_queue_wait_ms', 0, buckets=QUEUE_WAIT_BUCKETS_MS, priority=priority)
+                return self._start(w)
+
+            if user_id is not None and self._user_waiting[user_id] >= self.user_max_queue:
+                raise self._shed(w, 'user_limit', AIUserBusy)
+            if len(self._waiters) >= self.max_queue:
+                victim = self._waiters[-1] if self._waiters else None
+                if priority == INTERACTIVE and victim is not None and victim.priority == BATCH:
+                    # Geser batch yang paling belakang — request interactive didahulukan.
+                    victim.evicted = True
+                    self._waiters.remove(victim)
+                else:
+                    raise self._shed(w, 'queue_full')
+
+            bisect.insort(self._waiters, w)
+            if user_id is not None:
+                self._user_waiting[user_id] += 1
+            self._update_gauges()
+            self._cond.notify_all()
+            try:
+                while True:
+                    if w.evicted:
+                        raise self._shed(w, 'evicted')
+                    if self._next_runnable() is w:
+                        break
+                    remaining = started_at + timeout - time.monotonic()
+                    if remaining <= 0:
+                        raise self._shed(w, 'queue_timeout', AIUserBusy if self._user_capped(w) else AIGatewayBusy)
+                    self._cond.wait(remaining)
+            finally:
+                if w in self._waiters:
+                    self._waiters.remove(w)
+                if user_id is not None:
+                    self._user_waiting[user_id] -= 1
+                    if not self._user_waiting[user_id]:
+                        del self._user_waiting[user_id]
+                self._update_gauges()
+                self._cond.notify_all()
+
+            metrics.observe('ai_gateway_queue_wait_ms', (time.monotonic() - started_at) * 1000,
+                            buckets=QUEUE_WAIT_BUCKETS_MS, priority=priority)
+            return self._start(w)
+
+    def _user_capped(self, w: _Waiter) -> bool:
+        """True kalau yang menahan waiter ini adalah jatah per user-nya sendiri."""
+        return w.user_id is not None and self._user_running.get(w.user_id, 0) >= self.user_max_inflight
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            if not ticket._held:
+                return
+            ticket._held = False
+            self._inflight_by[ticket.priority] -= 1
+            if ticket.user_id is not None:
+                self._user_running[ticket.user_id] -= 1
+                if not self._user_running[ticket.user_id]:
+                    del self._user_running[ticket.user_id]
+            self._update_gauges()
+            self._cond.notify_all()
+
+    # ── API untuk pemanggil ───────────────────────────────────────────────────
+    def _run_slot(self, ticket: Ticket, fn, args, kwargs):
+        with ticket:
+            return fn(*args, **kwargs)
+
+    def run(self, fn, *args, timeout: float = None, user_id=None, endpoint: str = None, **kwargs):
+        """
+        Jalankan fn(*args, **kwargs) di executor upstream dan tunggu hasilnya.
+        Exception dari fn diteruskan apa adanya ke pemanggil.
+        """
+        ticket = self.admit(user_id, endpoint)
+        try:
+            future = self._executor.submit(self._run_slot, ticket, fn, args, kwargs)
+        except RuntimeError:
+            ticket.release()
+            raise
+        try:
+            return future.result(timeout=timeout or self.deadline)
+        except FutureTimeout:
+            raise AIGatewayTimeout(f'AI tidak merespons dalam {timeout or self.deadline:g} detik')
+
+
+ai_gateway = AIGateway()
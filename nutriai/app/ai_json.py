@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import logging
+
+from app.ai_metrics import metrics
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  OUTPUT JSON DARI GEMINI: SCHEMA + PARSER TOLERAN
+# ─────────────────────────────────────────────────────────
+# voice-command & analyze-image minta balasan JSON. Dulu cuma lewat
+# instruksi di prompt, lalu code fence dibuang pakai regex (beda-beda per
+# endpoint) dan langsung json.loads — 1 trailing comma atau jawaban yang
+# kepotong maxOutputTokens = "AI response tidak valid", user harus ulang
+# dan Gemini dibayar dua kali.
+#
+# Sekarang:
+#   1. Request ke Gemini pakai responseMimeType=application/json +
+#      responseSchema (lihat json_generation_config) — model dipaksa
+#      mengeluarkan JSON sesuai schema. Matikan dengan AI_JSON_SCHEMA=0
+#      kalau model yang dipakai belum mendukung.
+#   2. Balasan tetap diparse toleran (parse_ai_json): kalau json.loads
+#      gagal, cacat yang umum diperbaiki lokal TANPA panggil Gemini lagi:
+#      code fence / teks di luar JSON, trailing comma, literal Python
+#      (True/False/None), karakter kontrol di dalam string, dan JSON yang
+#      kepotong di tengah (kurung ditutup, elemen terakhir yang belum
+#      lengkap dibuang). Angka/string yang kepotong TIDAK pernah "ditutup"
+#      apa adanya — "jumlah_ml":50 bisa saja potongan dari 500 — tapi
+#      dibuang, mundur ke elemen lengkap terakhir.
+#      parse_ai_json juga mengembalikan status 'ok' | 'repaired' |
+#      'truncated', supaya handler yang MENULIS data (voice-command) bisa
+#      menolak balasan yang tidak utuh.
+#   3. Hasil tiap parse dicatat: ai_json_parse_total{endpoint, outcome}
+#      dengan outcome ok | repaired | failed — ringkasannya (failure rate
+#      per endpoint) ada di /api/admin/metrics → 'ai_json'.
+
+AI_JSON_SCHEMA = os.environ.get('AI_JSON_SCHEMA', '1') == '1'
+
+_FENCE_RE    = re.compile(r'^\s*```[a-zA-Z]*\s*|\s*```\s*$')
+_NUMBER_TAIL = re.compile(r'[:\[,]\s*-?[\d.eE+-]+$')   # teks berakhir di tengah angka
+
+
+class AIJSONError(ValueError):
+    """Balasan AI bukan JSON yang bisa dipakai, bahkan setelah diperbaiki."""
+
+
+def json_generation_config(schema: dict) -> dict:
+    """Tambahan generationConfig supaya Gemini membalas JSON sesuai schema."""
+    if not AI_JSON_SCHEMA or not schema:
+        return {}
+    return {'responseMimeType': 'application/json', 'responseSchema': schema}
+
+
+def parse_ai_json(text: str, endpoint: str, required: tuple = ()) -> tuple:
+    """
+    Parse balasan JSON dari Gemini → (dict, status). status: 'ok' (JSON
+    valid apa adanya), 'repaired' (cacat format diperbaiki, isi utuh), atau
+    'truncated' (kepotong — elemen terakhir yang belum lengkap dibuang).
+    Raise AIJSONError kalau tetap tidak bisa dipakai (bukan object, atau
+    field `required` hilang). `required` = field yang benar-benar
+    dibutuhkan handler — biasanya lebih longgar dari 'required' di
+    responseSchema, supaya jawaban yang kepotong di bagian belakang masih
+    bisa dipakai.
+    """
+    outcome, status = 'ok', 'ok'
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        (data, truncated), outcome = _repair(text or ''), 'repaired'
+        status = 'truncated' if truncated else 'repaired'
+
+    error = _validate(data, required)
+    if error:
+        metrics.inc('ai_json_parse_total', endpoint=endpoint, outcome='failed')
+        logger.warning('[AIJSON] %s: %s | raw: %.300s', endpoint, error, text)
+        raise AIJSONError(error)
+
+    metrics.inc('ai_json_parse_total', endpoint=endpoint, outcome=outcome)
+    if outcome == 'repaired':
+        logger.info('[AIJSON] %s: balasan diperbaiki lokal (%s) | raw: %.200s', endpoint, status, text)
+    return data, status
+
+
+def _validate(data, required: tuple):
+    """Return pesan error, atau None kalau data bisa dipakai."""
+    if data is None:
+        return 'bukan JSON'
+    if not isinstance(data, dict):
+        return f'JSON bukan object ({type(data).__name__})'
+    missing = [k for k in required if k not in data]
+    if missing:
+        return f'field wajib hilang: {", ".join(missing)}'
+    return None
+
+
+def _repair(text: str) -> tuple:
+    """
+    Perbaiki cacat umum JSON dari LLM. Return (hasil parse atau None,
+    kepotong?).
+    """
+    text  = _FENCE_RE.sub('', text.strip())
+    start = min((i for i in (text.find('{'), text.find('[')) if i >= 0), default=-1)
+    if start < 0:
+        return None, False
+    text = text[start:]
+
+    cleaned, cut_points, closed_at = _scan(text)
+    if closed_at is not None:
+        # JSON lengkap (mungkin ada teks penjelasan di belakangnya).
+        return _loads(cleaned[:closed_at]), False
+
+    # Kepotong di tengah: tutup apa adanya HANYA kalau teks tidak berhenti
+    # di tengah angka/string (nilainya belum tentu utuh), lalu mundur ke
+    # pemisah elemen sebelumnya sampai ketemu yang valid.
+    cuts = cut_points[::-1][:20]
+    if not _unfinished_value(cleaned):
+        cuts.insert(0, len(cleaned))
+    for cut in cuts:
+        data = _loads(_close(cleaned[:cut]))
+        if data is not None:
+            return data, True
+    return None, True
+
+
+def _unfinished_value(text: str) -> bool:
+    """Teks kepotong berakhir di dalam string atau angka (nilai mungkin terpotong)."""
+    return _close_state(text)[1] or bool(_NUMBER_TAIL.search(text))
+
+
+def _scan(text: str) -> tuple:
+    """
+    Jalan sekali di teks: buang trailing comma & ganti literal Python di luar
+    string. Return (teks bersih, posisi koma pemisah di luar string, posisi
+    akhir object/array terluar atau None kalau belum ditutup).
+    """
+    out, cut_points = [], []
+    depth, in_str, escape, i = 0, False, False, 0
+    while i < len(text):
+        ch = text[i]
+        if in_str:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_str = False
+            elif ch in '\n\r\t':
+                ch = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}[ch]
+            out.extend(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_str = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            # trailing comma: ", }" / ", ]"
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            depth -= 1
+            out.append(ch)
+            if depth == 0:
+                return ''.join(out), cut_points, len(out)
+            i += 1
+            continue
+        elif ch == ',':
+            cut_points.append(len(out))
+        else:
+            for py, js in (('True', 'true'), ('False', 'false'), ('None', 'null')):
+                if text.startswith(py, i) and not (text[i + len(py):i + len(py) + 1].isalnum()):
+                    out.extend(js)
+                    i += len(py)
+                    break
+            else:
+                out.append(ch)
+                i += 1
+            continue
+        out.append(ch)
+        i += 1
+    return ''.join(out), cut_points, None
+
+
+def _close_state(text: str) -> tuple:
+    """(kurung penutup yang masih kurang, masih di dalam string?) di akhir teks."""
+    stack, in_str, escape = [], False, False
+    for ch in text:
+        if in_str:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]' and stack:
+            stack.pop()
+    return stack, in_str
+
+
+def _close(text: str) -> str:
+    """Tutup string & kurung yang masih terbuka di akhir teks yang kepotong."""
+    stack, in_str = _close_state(text)
+    if in_str:
+        text += '"'
+    text = text.rstrip().rstrip(',')
+    return text + ''.join(reversed(stack))
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def json_parse_stats() -> dict:
+    """Ringkasan parse JSON per endpoint (untuk /api/admin/metrics)."""
+    per_endpoint = {}
+    for labels, n in metrics.counters('ai_json_parse_total').items():
+        labels = dict(labels)
+        stats  = per_endpoint.setdefault(labels['endpoint'], {'ok': 0, 'repaired': 0, 'failed': 0})
+        stats[labels['outcome']] = int(n)
+    for stats in per_endpoint.values():
+        total = sum(stats.values())
+        stats['failure_rate'] = round(stats['failed'] / total, 4) if total else 0
+        stats['repair_rate']  = round(stats['repaired'] / total, 4) if total else 0
+    return per_endpoint
@@ -0,0 +1,140 @@
+import threading
+from collections import defaultdict
+
+
+# ─────────────────────────────────────────────────────────
+#  METRIK AI (in-memory, per-proses)
+# ─────────────────────────────────────────────────────────
+# Counter + histogram sederhana tanpa dependency baru (JSON atau format teks
+# Prometheus, lihat /api/admin/metrics). Sama seperti rate limiter di
+# routes.py: angkanya per worker dan reset saat restart — cukup untuk
+# melihat tren / rasio, bukan untuk billing.
+
+# Batas bucket histogram (inklusif, seperti "le" di Prometheus).
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKEN_BUCKETS      = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._counters = defaultdict(float)   # (name, (label, value)...) -> total
+        self._gauges   = {}                   # (name, (label, value)...) -> nilai terakhir
+        self._hists    = {}                   # (name, (label, value)...) -> {'buckets', 'counts', 'sum', 'count'}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name,) + tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS_MS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            i = 0
+            while i < len(buckets) and value > buckets[i]:
+                i += 1
+            h['counts'][i] += 1
+            h['sum']       += value
+            h['count']     += 1
+
+    def counter(self, name: str, **labels) -> float:
+        return self._counters.get(self._key(name, labels), 0)
+
+    def counters(self, name: str) -> dict:
+        """Semua seri untuk 1 nama counter: {(label, value)...: total}."""
+        with self._lock:
+            return {k[1:]: v for k, v in self._counters.items() if k[0] == name}
+
+    @staticmethod
+    def _quantile(h: dict, q: float):
+        """Perkiraan kuantil dari bucket (batas atas bucket tempat kuantil jatuh)."""
+        if not h['count']:
+            return None
+        target, seen = q * h['count'], 0
+        for bound, n in zip(h['buckets'], h['counts']):
+            seen += n
+            if seen >= target:
+                return bound
+        return '+Inf'
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = list(self._counters.items()) + list(self._gauges.items())
+            hists = [(k, dict(h, counts=list(h['counts']))) for k, h in self._hists.items()]
+        out = defaultdict(list)
+        for (name, *labels), value in items:
+            out[name].append({'labels': dict(labels), 'value': value})
+        for (name, *labels), h in hists:
+            out[name].append({
+                'labels': dict(labels),
+                'count':  h['count'],
+                'sum':    round(h['sum'], 1),
+                'p50':    self._quantile(h, 0.5),
+                'p95':    self._quantile(h, 0.95),
+                'p99':    self._quantile(h, 0.99),
+            })
+        return dict(out)
+
+    def prometheus(self) -> str:
+        """Format teks exposition Prometheus (counter + gauge + histogram)."""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{str(v)}"' for k, v in pairs) + '}'
+
+        with self._lock:
+            items  = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            hists = sorted((k, dict(h, counts=list(h['counts']))) for k, h in self._hists.items())
+        lines, typed = [], set()
+        for (name, *labels), value in items:
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{fmt_labels(labels)} {value:g}')
+        for (name, *labels), value in gauges:
+            if name not in typed:
+                lines.append(f'# TYPE {name} gauge')
+                typed.add(name)
+            lines.append(f'{name}{fmt_labels(labels)} {value:g}')
+        for (name, *labels), h in hists:
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(list(h['buckets']) + ['+Inf'], h['counts']):
+                cumulative += n
+                lines.append(f'{name}_bucket{fmt_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{fmt_labels(labels)} {h["sum"]:g}')
+            lines.append(f'{name}_count{fmt_labels(labels)} {h["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def fastpath_stats() -> dict:
+    """Hit rate fast-path Jarvis per intent (dibanding semua input teks yang dicoba)."""
+    attempts = metrics.counter('jarvis_fastpath_attempts_total')
+    hits     = {dict(k).get('intent'): v for k, v in metrics.counters('jarvis_fastpath_hits_total').items()}
+    total    = sum(hits.values())
+    return {
+        'attempts':      int(attempts),
+        'hits':          int(total),
+        'hit_rate':      round(total / attempts, 4) if attempts else 0,
+        'per_intent':    {
+            intent: {'hits': int(n), 'hit_rate': round(n / attempts, 4) if attempts else 0}
+            for intent, n in sorted(hits.items())
+        },
+    }
@@ -2,25 +2,48 @@ import os
 import re
 import json
 import time
-import urllib.request as urlreq
-import urllib.error   as urlerr
+import base64
+import binascii
+import hashlib
+import logging
+import itertools
 from collections import defaultdict
 from datetime import timedelta
 
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from app.models import (
     db, User, Food, WaktuMakan, Laporan,
-    WeightHistory, WaterLog, MealTemplate, StreakLog,
+    WeightHistory, WaterLog, MealTemplate, StreakLog, WeeklyAnalysis, Conversation,
     now_utc,
 )
 from app.routes import (
     get_current_user, get_targets, hitung_bmr_tdee,
-    record_streak, calc_streak,
+    record_streak,
 )
-
-ai_bp = Blueprint('ai', __name__)
+from app.gemini_client import gemini_client, GeminiHTTPError, GeminiConnectionError
+from app.food_retrieval import retrieve_food_candidates, resolve_voice_items, VOICE_MATCH_MIN_SCORE
+from app.food_catalog import find_visible_by_name
+from app.food_matcher import FoodMatcher
+from app.food_autocomplete import food_autocomplete
+from app.day_snapshot import get_day_snapshot, invalidate_day_snapshot
+from app.ai_json import parse_ai_json, json_generation_config, AIJSONError
+from app.prompt_cache import context_cache
+from app.ai_gateway import ai_gateway, AIGatewayBusy
+from app.ai_cache import image_analysis_cache
+from app.image_preprocess import preprocess_image, InvalidImageError, PREPROCESS_TAG
+from app.ai_metrics import metrics
+from app.jarvis_fastpath import parse_fast_intent, compose_fast_reply, normalize_command
+from app.upstream_policy import gemini_policy, gemini_breaker, CircuitOpenError, is_retryable
+from app.model_router import model_router
+from app.ai_usage import UpstreamCall, record_call
+from app.single_flight import ai_single_flight
+from app.conversation_memory import load_memory, render_history, remember, clear_memory, CHANNELS
+
+ai_bp  = Blueprint('ai', __name__)
+logger = logging.getLogger('nutriai.ai')
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 
@@ -29,26 +52,38 @@ GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 #  CORE GEMINI HELPER
 # ─────────────────────────────────────────────────────────
 
-def call_gemini(prompt: str, image_base64: str = None) -> dict:
+def call_gemini(prompt: str, image_base64: str = None, image_mime: str = 'image/jpeg',
+                endpoint: str = 'other', user_id: int = None, response_schema: dict = None) -> dict:
     """
     Panggil Gemini API dengan retry otomatis.
     Return dict dengan 'text' dan 'tts_text' (bersih untuk TTS).
+    Panggilan upstream (termasuk jeda retry) jalan di ai_gateway, bukan di
+    thread request — lihat app/ai_gateway.py. endpoint & user_id hanya
+    untuk pencatatan pemakaian (app/ai_usage.py). response_schema → balasan
+    dipaksa JSON sesuai schema (parse dengan app/ai_json.parse_ai_json).
+    Model dipilih per endpoint oleh app/model_router.py (plus failover).
     """
     if not GEMINI_API_KEY:
         raise RuntimeError('GEMINI_API_KEY belum diset di file .env')
+    call = UpstreamCall(endpoint, model_router.primary(endpoint).model, user_id)
+    try:
+        result = ai_gateway.run(_call_gemini_upstream, call, prompt, image_base64, image_mime, response_schema,
+                                user_id=user_id, endpoint=endpoint)
+    except Exception as e:
+        record_call(call, e)
+        raise
+    record_call(call)
+    return result
 
-    model    = os.environ.get('GEMINI_MODEL',   'gemini-2.5-flash-preview-04-17')
-    api_ver  = os.environ.get('GEMINI_API_VER', 'v1alpha')
-    endpoint = (
-        f'https://generativelanguage.googleapis.com/{api_ver}'
-        f'/models/{model}:generateContent?key={GEMINI_API_KEY}'
-    )
 
+def _gemini_payload(prompt: str, image_base64: str = None, image_mime: str = 'image/jpeg',
+                    response_schema: dict = None) -> dict:
+    """Payload generateContent untuk prompt teks (+ foto opsional)."""
     parts = [{'text': prompt}]
     if image_base64:
-        parts.append({'inline_data': {'mime_type': 'image/jpeg', 'data': image_base64}})
+        parts.append({'inline_data': {'mime_type': image_mime, 'data': image_base64}})
 
-    payload = json.dumps({
+    return {
         'contents': [{'parts': parts}],
         # FIX: model gemini-2.5-flash (termasuk varian -preview) punya "thinking"
         # (internal reasoning) yang NYALA SECARA DEFAULT, dan token buat mikir itu
@@ -59,55 +94,242 @@ def call_gemini(prompt: str, image_base64: str = None) -> dict:
         # kebagian 1). thinkingBudget: 0 matiin proses mikir itu (gak perlu buat
         # chat nutrisi/saran menu yang sifatnya singkat & langsung), dan
         # maxOutputTokens dinaikkan sebagai jaga-jaga.
-        # CATATAN: thinkingBudget: 0 cuma didukung model Flash. Kalau GEMINI_MODEL
-        # di .env diganti ke model Pro, ganti nilainya ke minimal 128 (Pro selalu
+        # CATATAN: thinkingBudget: 0 cuma didukung model Flash. Kalau daftar
+        # model di app/model_router.py (AI_MODELS_*) diisi model Pro, ganti nilainya ke minimal 128 (Pro selalu
         # butuh sedikit "thinking", gak bisa 0).
         'generationConfig': {
             'temperature':      0.7,
             'maxOutputTokens':  2048,
             'thinkingConfig':   {'thinkingBudget': 0},
+            **json_generation_config(response_schema),
         },
-    }).encode()
+    }
 
-    RETRY_DELAYS = [2, 5, 10]
-    gemini_result = None
-    last_error    = None
 
-    for attempt in range(3):
-        try:
-            req = urlreq.Request(endpoint, data=payload, headers={'Content-Type': 'application/json'})
-            with urlreq.urlopen(req, timeout=55) as resp:
-                gemini_result = json.loads(resp.read())
-            break
-
-        except urlerr.HTTPError as http_err:
-            err_body   = http_err.read().decode('utf-8', errors='replace')
-            last_error = f'HTTP error {http_err.code}: {err_body[:300]}'
-            if http_err.code in (503, 429, 500) and attempt < 2:
-                time.sleep(RETRY_DELAYS[attempt])
-                continue
-            raise RuntimeError(f'Gemini HTTP {http_err.code}: {err_body[:300]}')
-
-        except urlerr.URLError as url_err:
-            last_error = str(url_err)
-            if attempt < 2:
-                time.sleep(RETRY_DELAYS[attempt])
-                continue
-            raise RuntimeError(f'Gemini koneksi gagal: {str(url_err.reason)}')
-
-    if gemini_result is None:
-        raise RuntimeError(last_error or 'Semua retry gagal')
+def _call_gemini_upstream(call: UpstreamCall, prompt: str, image_base64: str = None,
+                          image_mime: str = 'image/jpeg', response_schema: dict = None) -> dict:
+
+    payload = _gemini_payload(prompt, image_base64, image_mime, response_schema)
+
+    gemini_result = model_router.run(call.endpoint, call, lambda route, deadline: gemini_policy.call(call.wrap(
+        lambda timeout: gemini_client.generate_content(route.model, route.api_ver, payload, GEMINI_API_KEY, timeout=timeout)
+    ), deadline))
+    call.stop()
+    call.add_usage(gemini_result)
 
     try:
         raw_text = gemini_result['candidates'][0]['content']['parts'][0]['text']
     except (KeyError, IndexError):
         raise RuntimeError(f'Gemini response tidak valid: {str(gemini_result)[:200]}')
 
-    tts_text = re.sub(r'[*_`#\-•]', '', raw_text)
+    return {'text': raw_text, 'tts_text': clean_tts(raw_text)}
+
+
+def clean_tts(text: str) -> str:
+    """Buang markdown & emoji supaya enak dibacakan TTS."""
+    tts_text = re.sub(r'[*_`#\-•]', '', text)
     tts_text = re.sub(r'[\U00010000-\U0010ffff]', '', tts_text, flags=re.UNICODE)
-    tts_text = re.sub(r'\s+', ' ', tts_text).strip()
+    return re.sub(r'\s+', ' ', tts_text).strip()
+
+
+def _busy_response(e: AIGatewayBusy):
+    """429 saat slot AI penuh / jatah paralel user habis (lihat app/ai_gateway.py)."""
+    resp = jsonify({'error': f'AI error: {str(e)}', 'code': 'AI_BUSY'})
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp, 429
+
+
+# ─────────────────────────────────────────────────────────
+#  JAWABAN DEGRADED (breaker OPEN)
+# ─────────────────────────────────────────────────────────
+# Saat Gemini dianggap down (lihat app/upstream_policy.py), endpoint tidak
+# menunggu timeout: langsung menjawab versi sederhana yang dibangun dari data
+# lokal, ditandai 'degraded': True supaya app bisa menampilkannya berbeda.
+
+DEGRADED_CHAT_REPLY  = ('Maaf, NutriAI lagi nggak bisa terhubung ke server AI. '
+                        'Coba tanya lagi beberapa menit lagi ya 🙏')
+DEGRADED_VOICE_REPLY = ('Jarvis lagi nggak bisa terhubung ke server AI. Perintah simpel seperti '
+                        '"minum 2 gelas" atau "rekap hari ini" tetap bisa, yang lain coba lagi sebentar ya.')
+
+
+def _degraded(key: str, text: str, **extra) -> dict:
+    return {key: text, 'tts_text': clean_tts(text), **extra, 'degraded': True}
 
-    return {'text': raw_text, 'tts_text': tts_text}
+
+def _degraded_meal_suggestion(context: dict) -> dict:
+    text = (
+        f"Server AI lagi gangguan, jadi ini saran umum dulu ya. Sisa target kamu hari ini "
+        f"{context['sisa_kalori']} kcal dan {context['sisa_protein']}g protein.\n"
+        f"1. Dada ayam panggang + nasi merah = tinggi protein, lemak rendah\n"
+        f"2. Tempe atau tahu bacem + sayur bening = protein nabati yang murah dan mudah didapat\n"
+        f"3. Telur rebus + buah = camilan praktis, sekitar 6g protein per butir"
+    )
+    return _degraded('suggestion', text, context=context)
+
+
+def _degraded_weekly_analysis(stats: dict) -> dict:
+    text = (
+        f"Rata-rata minggu ini {stats['avg_kalori']} kcal dan {stats['avg_protein']}g protein per hari, "
+        f"dari target {stats['target_kalori']} kcal dan {stats['target_protein']}g protein "
+        f"({stats['hari_input']} hari tercatat). Analisis lengkap dari AI belum tersedia, coba lagi nanti ya."
+    )
+    return _degraded('analysis', text, stats=stats)
+
+
+# ─────────────────────────────────────────────────────────
+#  STREAMING (SSE)
+# ─────────────────────────────────────────────────────────
+# Buat user, waktu sampai kata pertama muncul jauh lebih penting daripada
+# total waktu selesai. Endpoint /stream meneruskan token dari
+# streamGenerateContent ke client sebagai server-sent events:
+#   event: delta → {"text": potongan teks baru}
+#   event: tts   → {"tts_text": kalimat yang SUDAH lengkap, bersih untuk TTS}
+#                  (app bisa mulai bicara sebelum jawaban selesai)
+#   event: done  → body yang sama persis dengan versi non-streaming
+#   event: error → {"error": "AI error: ..."}
+
+# Akhir kalimat = tanda baca + spasi, atau baris baru. "1. " di list bernomor
+# bukan akhir kalimat (angka di depan titik).
+_SENTENCE_END = re.compile(r'(?<!\d)[.!?]+(?=\s)|\n')
+
+
+def _split_sentences(buffer: str) -> tuple:
+    """Pisah buffer jadi (kalimat-kalimat yang sudah lengkap, sisa yang belum selesai)."""
+    last = None
+    for last in _SENTENCE_END.finditer(buffer):
+        pass
+    if last is None:
+        return '', buffer
+    return buffer[:last.end()], buffer[last.end():]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _chunk_text(chunk: dict) -> str:
+    try:
+        parts = chunk['candidates'][0]['content']['parts']
+    except (KeyError, IndexError):
+        return ''   # chunk terakhir kadang cuma berisi finishReason / usageMetadata
+    return ''.join(p.get('text', '') for p in parts)
+
+
+def _open_stream(call: UpstreamCall, payload: dict) -> tuple:
+    """
+    Buka stream lewat gemini_policy sampai chunk PERTAMA diterima — error
+    sebelum itu masih aman di-retry (atau dipindah ke model cadangan, lihat
+    app/model_router.py). Return (sisa_chunks, chunk_pertama).
+    """
+    def open_on(route, deadline):
+        def attempt(timeout):
+            chunks = gemini_client.stream_generate_content(route.model, route.api_ver, payload, GEMINI_API_KEY, timeout=timeout)
+            return chunks, next(chunks, None)
+        return gemini_policy.call(call.wrap(attempt), deadline)
+    return model_router.run(call.endpoint, call, open_on)
+
+
+def _stream_gemini(prompt: str, done_body, degraded, call: UpstreamCall, ticket):
+    """
+    Generator event SSE untuk 1 prompt. done_body(text, tts_text) → data event
+    'done'; degraded() → body 'done' pengganti saat breaker OPEN. ticket = slot
+    ai_gateway yang sudah didapat _stream_response, dilepas begitu upstream selesai.
+    """
+    payload = _gemini_payload(prompt)
+
+    text    = ''
+    pending = ''
+    error   = None
+    try:
+        with ticket:
+            chunks, first = _open_stream(call, payload)
+            for chunk in itertools.chain([first] if first else [], chunks):
+                call.add_usage(chunk)
+                delta = _chunk_text(chunk)
+                if not delta:
+                    continue
+                text    += delta
+                pending += delta
+                yield _sse('delta', {'text': delta})
+                ready, pending = _split_sentences(pending)
+                if clean_tts(ready):
+                    yield _sse('tts', {'tts_text': clean_tts(ready)})
+        call.stop()
+        if clean_tts(pending):
+            yield _sse('tts', {'tts_text': clean_tts(pending)})
+        yield _sse('done', done_body(text, clean_tts(text)))
+    except CircuitOpenError as e:
+        error = e
+        metrics.inc('ai_degraded_responses_total', endpoint='stream')
+        body = degraded()
+        yield _sse('tts', {'tts_text': body['tts_text']})
+        yield _sse('done', body)
+    except RuntimeError as e:
+        error = e
+        if is_retryable(e):
+            gemini_breaker.record_failure()   # putus di tengah stream juga tanda upstream bermasalah
+        logger.warning('[Stream] gagal setelah %d karakter: %s', len(text), e)
+        yield _sse('error', {'error': f'AI error: {str(e)}'})
+    except GeneratorExit as e:
+        error = e
+        raise
+    finally:
+        record_call(call, error)
+
+
+def _stream_response(prompt: str, done_body, degraded, endpoint: str, user_id: int):
+    if not GEMINI_API_KEY:
+        return jsonify({'error': 'AI error: GEMINI_API_KEY belum diset di file .env'}), 503
+    call = UpstreamCall(endpoint, model_router.primary(endpoint).model, user_id)
+    # Slot diambil SEBELUM response 200 dikirim, supaya beban berlebih masih
+    # bisa ditolak dengan 429 biasa (bukan event error di tengah stream).
+    try:
+        ticket = ai_gateway.admit(user_id, endpoint)
+    except AIGatewayBusy as e:
+        record_call(call, e)
+        return _busy_response(e)
+    resp = Response(stream_with_context(_stream_gemini(prompt, done_body, degraded, call, ticket)), mimetype='text/event-stream', headers={
+        'Cache-Control':     'no-cache',
+        'X-Accel-Buffering': 'no',   # jangan di-buffer reverse proxy (nginx)
+    })
+    resp.call_on_close(ticket.release)   # client putus sebelum generator sempat jalan
+    return resp
+
+
+# ─────────────────────────────────────────────────────────
+#  DEDUPE REQUEST IDENTIK (lihat app/single_flight.py)
+# ─────────────────────────────────────────────────────────
+
+def _coalesced(key: tuple, fn):
+    """
+    Jalankan handler fn() sekali untuk request identik yang datang bersamaan
+    (key = (endpoint, user_id, input...)). Request duplikat menerima body &
+    status yang sama tanpa memanggil Gemini / menjalankan action lagi.
+    """
+    def run():
+        rv           = fn()
+        resp, status = rv if isinstance(rv, tuple) else (rv, rv.status_code)
+        return resp.get_json(), status, resp.headers.get('Retry-After')
+
+    # 429 (slot AI penuh) & balasan Jarvis yang kepotong (action tidak
+    # dijalankan) tidak disimpan — retry berikutnya memang harus dicoba ulang.
+    def remember(result):
+        body, status, _ = result
+        incomplete      = ((body or {}).get('action_result') or {}).get('status') == 'incomplete'
+        return status < 500 and status != 429 and not incomplete
+
+    try:
+        (body, status, retry_after), shared = ai_single_flight.do(key, run, remember=remember)
+    except AIGatewayBusy as e:   # request yang sama masih jalan lebih lama dari antrean gateway
+        metrics.inc('ai_dedupe_wait_timeout_total', endpoint=key[0])
+        return _busy_response(e)
+    if shared:
+        metrics.inc('ai_dedupe_shared_total', endpoint=key[0])
+        logger.info('[Dedupe] %s user=%s memakai hasil request yang sama', key[0], key[1])
+    resp = jsonify(body)
+    if retry_after:
+        resp.headers['Retry-After'] = retry_after
+    return resp, status
 
 
 # ─────────────────────────────────────────────────────────
@@ -125,24 +347,19 @@ def ai_test():
             'solusi':  'Tambahkan GEMINI_API_KEY=AIza... di file .env',
         }), 200
 
-    model    = os.environ.get('GEMINI_MODEL',   'gemini-2.5-flash-preview-04-17')
-    api_ver  = os.environ.get('GEMINI_API_VER', 'v1alpha')
-    endpoint = f'https://generativelanguage.googleapis.com/{api_ver}/models/{model}:generateContent?key={key}'
-    payload  = json.dumps({
+    model, api_ver = model_router.primary('chat')
+    payload        = {
         'contents': [{'parts': [{'text': 'Halo, jawab dengan satu kata: OK'}]}]
-    }).encode()
+    }
 
     try:
-        req = urlreq.Request(endpoint, data=payload, headers={'Content-Type': 'application/json'})
-        with urlreq.urlopen(req, timeout=15) as resp:
-            result = json.loads(resp.read())
-            text   = result['candidates'][0]['content']['parts'][0]['text']
-            return jsonify({'status': 'OK', 'model': model, 'key_prefix': key[:8] + '...', 'gemini_reply': text}), 200
-    except urlerr.HTTPError as e:
-        body = e.read().decode('utf-8', errors='replace')
-        return jsonify({'status': 'ERROR', 'http_code': e.code, 'error_detail': body[:500], 'key_prefix': key[:8] + '...'}), 200
-    except urlerr.URLError as e:
-        return jsonify({'status': 'ERROR', 'masalah': 'Tidak bisa konek ke Gemini API', 'detail': str(e.reason)}), 200
+        result = gemini_client.generate_content(model, api_ver, payload, key, timeout=15)
+        text   = result['candidates'][0]['content']['parts'][0]['text']
+        return jsonify({'status': 'OK', 'model': model, 'key_prefix': key[:8] + '...', 'gemini_reply': text}), 200
+    except GeminiHTTPError as e:
+        return jsonify({'status': 'ERROR', 'http_code': e.code, 'error_detail': e.body[:500], 'key_prefix': key[:8] + '...'}), 200
+    except GeminiConnectionError as e:
+        return jsonify({'status': 'ERROR', 'masalah': 'Tidak bisa konek ke Gemini API', 'detail': e.reason}), 200
     except Exception as e:
         return jsonify({'status': 'ERROR', 'detail': str(e)}), 200
 
@@ -156,41 +373,34 @@ def ai_debug():
 
     available_models = []
     try:
-        list_url  = f'https://generativelanguage.googleapis.com/v1beta/models?key={key}'
-        req_list  = urlreq.Request(list_url)
-        with urlreq.urlopen(req_list, timeout=10) as r:
-            models_data = json.loads(r.read())
-            for m in models_data.get('models', []):
-                if 'generateContent' in m.get('supportedGenerationMethods', []):
-                    available_models.append(m['name'].replace('models/', ''))
+        models_data = gemini_client.list_models(key, timeout=10)
+        for m in models_data.get('models', []):
+            if 'generateContent' in m.get('supportedGenerationMethods', []):
+                available_models.append(m['name'].replace('models/', ''))
     except Exception as le:
         return jsonify({'status': 'ERROR', 'error': f'ListModels gagal: {str(le)}'}), 200
 
     if not available_models:
         return jsonify({'status': 'ERROR', 'error': 'Tidak ada model tersedia untuk key ini'}), 200
 
-    payload = json.dumps({'contents': [{'parts': [{'text': 'Halo, balas dengan: OK'}]}]}).encode()
+    payload = {'contents': [{'parts': [{'text': 'Halo, balas dengan: OK'}]}]}
     results = []
     for model in available_models:
         for api_ver in ['v1beta', 'v1']:
-            url = f'https://generativelanguage.googleapis.com/{api_ver}/models/{model}:generateContent?key={key}'
-            req = urlreq.Request(url, data=payload, headers={'Content-Type': 'application/json'})
             try:
-                with urlreq.urlopen(req, timeout=10) as resp:
-                    r    = json.loads(resp.read())
-                    text = r['candidates'][0]['content']['parts'][0]['text']
-                    return jsonify({
-                        'status':     '✅ BERHASIL',
-                        'model':      model,
-                        'api_ver':    api_ver,
-                        'response':   text[:80],
-                        'TINDAKAN':   'Tambahkan 2 baris ini ke .env backend lalu restart Flask:',
-                        'ENV_LINE_1': f'GEMINI_MODEL={model}',
-                        'ENV_LINE_2': f'GEMINI_API_VER={api_ver}',
-                    }), 200
-            except urlerr.HTTPError as e:
-                body = e.read().decode('utf-8', errors='replace')[:80]
-                results.append({'model': model, 'api_ver': api_ver, 'code': e.code, 'err': body})
+                r    = gemini_client.generate_content(model, api_ver, payload, key, timeout=10)
+                text = r['candidates'][0]['content']['parts'][0]['text']
+                return jsonify({
+                    'status':     '✅ BERHASIL',
+                    'model':      model,
+                    'api_ver':    api_ver,
+                    'response':   text[:80],
+                    'TINDAKAN':   'Tambahkan 2 baris ini ke .env backend lalu restart Flask:',
+                    'ENV_LINE_1': f'GEMINI_MODEL={model}',
+                    'ENV_LINE_2': f'GEMINI_API_VER={api_ver}',
+                }), 200
+            except GeminiHTTPError as e:
+                results.append({'model': model, 'api_ver': api_ver, 'code': e.code, 'err': e.body[:80]})
                 if e.code == 429:
                     break
             except Exception as e:
@@ -203,20 +413,11 @@ def ai_debug():
 #  AI ENDPOINTS
 # ─────────────────────────────────────────────────────────
 
-@ai_bp.route('/api/ai/meal-suggestion', methods=['GET'])
-@jwt_required()
-def ai_meal_suggestion():
-    """Saran menu berdasarkan sisa kalori & protein hari ini."""
-    user  = get_current_user()
-    today = (now_utc() + timedelta(hours=7)).date()  # FIX: pakai tanggal WIB, bukan UTC
-    entries = WaktuMakan.query.filter(
-        WaktuMakan.user_id    == user.id,
-        WaktuMakan.tanggal    == today,
-        WaktuMakan.deleted_at.is_(None),
-    ).all()
-
-    total_protein            = sum((e.protein or 0) for e in entries)
-    total_kalori             = sum((e.kalori  or 0) for e in entries)
+def _meal_suggestion_prompt(user) -> tuple:
+    """Prompt saran menu + konteks sisa target (dipakai versi biasa & stream)."""
+    day                      = get_day_snapshot(user.id)
+    total_protein            = day['total_protein']
+    total_kalori             = day['total_kalori']
     target_cal, target_prot  = get_targets(user)
     sisa_kal                 = max(target_cal  - total_kalori,  0)
     sisa_prot                = max(target_prot - total_protein, 0)
@@ -232,82 +433,148 @@ def ai_meal_suggestion():
         f"ditampilkan apa adanya di app. Format list bernomor PERSIS begini: "
         f"'1. nama_menu = penjelasan singkat', '2. nama_menu = penjelasan singkat', dst."
     )
+    return prompt, {'sisa_kalori': sisa_kal, 'sisa_protein': sisa_prot}
+
+
+@ai_bp.route('/api/ai/meal-suggestion', methods=['GET'])
+@jwt_required()
+def ai_meal_suggestion():
+    """Saran menu berdasarkan sisa kalori & protein hari ini."""
+    user = get_current_user()
+    return _coalesced(('meal-suggestion', user.id), lambda: _meal_suggestion(user))
+
+
+def _meal_suggestion(user):
+    prompt, context = _meal_suggestion_prompt(user)
 
     try:
-        result = call_gemini(prompt)
+        result = call_gemini(prompt, endpoint='meal-suggestion', user_id=user.id)
         return jsonify({
             'suggestion': result['text'],
             'tts_text':   result['tts_text'],
-            'context':    {'sisa_kalori': sisa_kal, 'sisa_protein': sisa_prot},
+            'context':    context,
         }), 200
+    except CircuitOpenError:
+        metrics.inc('ai_degraded_responses_total', endpoint='meal-suggestion')
+        return jsonify(_degraded_meal_suggestion(context)), 200
+    except AIGatewayBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'error': f'AI error: {str(e)}'}), 503
 
 
+@ai_bp.route('/api/ai/meal-suggestion/stream', methods=['GET'])
+@jwt_required()
+def ai_meal_suggestion_stream():
+    """Versi SSE dari /api/ai/meal-suggestion."""
+    user            = get_current_user()
+    prompt, context = _meal_suggestion_prompt(user)
+    return _stream_response(prompt, lambda text, tts: {'suggestion': text, 'tts_text': tts, 'context': context},
+                            lambda: _degraded_meal_suggestion(context), 'meal-suggestion/stream', user.id)
+
+
+# Versi prompt ikut masuk key cache — kalau prompt di bawah diubah, hasil
+# lama otomatis tidak dipakai lagi.
+ANALYZE_IMAGE_PROMPT = (
+    "Analisis foto makanan ini. Identifikasi makanan yang terlihat dan estimasikan "
+    "kandungan nutrisi per porsi dalam Bahasa Indonesia. "
+    "Jawab HANYA dalam format JSON seperti ini (tanpa markdown): "
+    '{"nama_makanan": "...", "estimasi_kalori": 0, "estimasi_protein": 0, '
+    '"estimasi_karbo": 0, "estimasi_lemak": 0, "catatan": "..."}'
+)
+_ANALYZE_IMAGE_PROMPT_TAG = hashlib.sha256(ANALYZE_IMAGE_PROMPT.encode()).hexdigest()[:8]
+
+ANALYZE_IMAGE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'nama_makanan':     {'type': 'STRING'},
+        'estimasi_kalori':  {'type': 'NUMBER'},
+        'estimasi_protein': {'type': 'NUMBER'},
+        'estimasi_karbo':   {'type': 'NUMBER'},
+        'estimasi_lemak':   {'type': 'NUMBER'},
+        'catatan':          {'type': 'STRING'},
+    },
+    'required':         ['nama_makanan', 'estimasi_kalori', 'estimasi_protein'],
+    'propertyOrdering': ['nama_makanan', 'estimasi_kalori', 'estimasi_protein',
+                         'estimasi_karbo', 'estimasi_lemak', 'catatan'],
+}
+
+
+def _decode_image_base64(value: str) -> bytes | None:
+    """base64 dari JSON → byte mentah (buang prefix data URL & whitespace)."""
+    if not value:
+        return None
+    if value.startswith('data:') and ',' in value:
+        value = value.split(',', 1)[1]
+    try:
+        return base64.b64decode(''.join(value.split()), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
 @ai_bp.route('/api/ai/analyze-image', methods=['POST'])
 @jwt_required()
 def ai_analyze_image():
     """Analisis foto makanan → estimasi kalori & protein."""
-    import base64
-
-    image_b64 = None
+    image_bytes = None
     if 'image' in request.files:
-        image_b64 = base64.b64encode(request.files['image'].read()).decode('utf-8')
+        image_bytes = request.files['image'].read()
     elif request.is_json:
-        image_b64 = (request.get_json() or {}).get('image_base64')
+        image_bytes = _decode_image_base64((request.get_json() or {}).get('image_base64'))
 
-    if not image_b64:
+    if not image_bytes:
         return jsonify({'error': 'Gambar wajib dikirim'}), 400
 
-    prompt = (
-        "Analisis foto makanan ini. Identifikasi makanan yang terlihat dan estimasikan "
-        "kandungan nutrisi per porsi dalam Bahasa Indonesia. "
-        "Jawab HANYA dalam format JSON seperti ini (tanpa markdown): "
-        '{"nama_makanan": "...", "estimasi_kalori": 0, "estimasi_protein": 0, '
-        '"estimasi_karbo": 0, "estimasi_lemak": 0, "catatan": "..."}'
-    )
+    # Foto yang sama (retry dari app / scan ulang piring yang sama) tidak
+    # perlu ke Gemini lagi — key = hash isi gambar, bukan nama file/user.
+    cache_key = f'{hashlib.sha256(image_bytes).hexdigest()}-{_ANALYZE_IMAGE_PROMPT_TAG}-{PREPROCESS_TAG}'
+    cached    = image_analysis_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({**cached, 'cached': True}), 200
 
     try:
-        result   = call_gemini(prompt, image_b64)
-        raw_text = re.sub(r'```json|```', '', result['text'].strip()).strip()
-        nutrisi  = json.loads(raw_text)
-        return jsonify({
+        image_bytes, image_mime = preprocess_image(image_bytes)
+    except InvalidImageError:
+        return jsonify({'error': 'File bukan gambar yang valid'}), 400
+    image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+
+    try:
+        result   = call_gemini(ANALYZE_IMAGE_PROMPT, image_b64, image_mime,
+                               endpoint='analyze-image', user_id=int(get_jwt_identity()),
+                               response_schema=ANALYZE_IMAGE_SCHEMA)
+        nutrisi  = parse_ai_json(result['text'], 'analyze-image', ('nama_makanan', 'estimasi_kalori'))[0]
+        body     = {
             'result':   nutrisi,
             'tts_text': (
                 f"Makanan terdeteksi: {nutrisi.get('nama_makanan','tidak diketahui')}. "
                 f"Estimasi kalori {nutrisi.get('estimasi_kalori', 0)} kilokalori, "
                 f"protein {nutrisi.get('estimasi_protein', 0)} gram."
             ),
-        }), 200
-    except json.JSONDecodeError:
-        return jsonify({'result': None, 'raw': result['text'], 'tts_text': result['tts_text']}), 200
+        }
+        image_analysis_cache.set(cache_key, body)
+        return jsonify({**body, 'cached': False}), 200
+    except AIJSONError:
+        return jsonify({'result': None, 'raw': result['text'], 'tts_text': result['tts_text'], 'cached': False}), 200
+    except AIGatewayBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'error': f'AI error: {str(e)}'}), 503
 
 
-@ai_bp.route('/api/ai/chat', methods=['POST'])
-@jwt_required()
-def ai_chat():
-    """Tanya jawab nutrisi personal dengan riwayat percakapan."""
-    user = get_current_user()
-    data = request.get_json() or {}
-    msg  = (data.get('message') or '').strip()
-
-    if not msg:
-        return jsonify({'error': 'Pesan tidak boleh kosong'}), 400
-
-    today = (now_utc() + timedelta(hours=7)).date()  # FIX: pakai tanggal WIB, bukan UTC
+def _chat_prompt(user, msg: str, history: list) -> str:
+    """
+    Prompt chat lengkap (konteks user + riwayat), dipakai versi biasa & stream.
+    Riwayat diambil dari memori server (app/conversation_memory.py); history
+    dari client hanya dipakai kalau memori masih kosong.
+    """
     target_cal, target_prot = get_targets(user)
 
     # Status hari ini untuk konteks
-    entries_today = WaktuMakan.query.filter(
-        WaktuMakan.user_id    == user.id,
-        WaktuMakan.tanggal    == today,
-        WaktuMakan.deleted_at.is_(None),
-    ).all()
-    total_kal_chat  = sum(e.kalori  or 0 for e in entries_today)
-    total_prot_chat = sum(e.protein or 0 for e in entries_today)
-    makanan_chat    = ', '.join(e.nama_makanan or '?' for e in entries_today) or 'belum ada'
+    day             = get_day_snapshot(user.id)
+    today           = day['today']
+    total_kal_chat  = day['total_kalori']
+    total_prot_chat = day['total_protein']
+    makanan_chat    = ', '.join(e.nama_makanan or '?' for e in day['entries']) or 'belum ada'
 
     system_context = (
         f"Kamu adalah NutriAI, asisten nutrisi personal yang cerdas, hangat, dan peka konteks. "
@@ -341,25 +608,86 @@ def ai_chat():
         f"Jawab spesifik dan personal sesuai data user di atas KALAU relevan sama pertanyaan."
     )
 
-    history      = data.get('history', [])
-    history_text = '\n'.join(
-        f"{'User' if h['role'] == 'user' else 'NutriAI'}: {h['text']}"
-        for h in history[-10:]  # naik dari 6 ke 10
-    )
+    summary, turns = load_memory(user.id, 'chat', history)
+    history_text   = render_history(summary, turns, 'NutriAI')
     full_prompt = f"{system_context}\n\n{history_text}\nUser: {msg}\nNutriAI:"
+    return full_prompt
+
+
+@ai_bp.route('/api/ai/chat', methods=['POST'])
+@jwt_required()
+def ai_chat():
+    """Tanya jawab nutrisi personal dengan riwayat percakapan."""
+    user = get_current_user()
+    data = request.get_json() or {}
+    msg  = (data.get('message') or '').strip()
+
+    if not msg:
+        return jsonify({'error': 'Pesan tidak boleh kosong'}), 400
+
+    history     = data.get('history', [])
+    full_prompt = _chat_prompt(user, msg, history)
 
     try:
-        result = call_gemini(full_prompt)
+        result = call_gemini(full_prompt, endpoint='chat', user_id=user.id)
+        remember(user.id, 'chat', msg, result['text'], seed=history)
         return jsonify({'reply': result['text'], 'tts_text': result['tts_text']}), 200
+    except CircuitOpenError:
+        metrics.inc('ai_degraded_responses_total', endpoint='chat')
+        return jsonify(_degraded('reply', DEGRADED_CHAT_REPLY)), 200
+    except AIGatewayBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'error': f'AI error: {str(e)}'}), 503
 
 
-@ai_bp.route('/api/ai/weekly-analysis', methods=['GET'])
+@ai_bp.route('/api/ai/chat/stream', methods=['POST'])
 @jwt_required()
-def ai_weekly_analysis():
-    """Analisis otomatis laporan 7 hari terakhir oleh AI."""
-    user     = get_current_user()
+def ai_chat_stream():
+    """Versi SSE dari /api/ai/chat."""
+    user = get_current_user()
+    data = request.get_json() or {}
+    msg  = (data.get('message') or '').strip()
+
+    if not msg:
+        return jsonify({'error': 'Pesan tidak boleh kosong'}), 400
+
+    history     = data.get('history', [])
+    full_prompt = _chat_prompt(user, msg, history)
+
+    def done(text, tts):
+        remember(user.id, 'chat', msg, text, seed=history)
+        return {'reply': text, 'tts_text': tts}
+
+    return _stream_response(full_prompt, done, lambda: _degraded('reply', DEGRADED_CHAT_REPLY), 'chat/stream', user.id)
+
+
+@ai_bp.route('/api/ai/conversation', methods=['GET'])
+@jwt_required()
+def ai_conversation():
+    """Memori percakapan tersimpan (ringkasan + pesan terbaru) per channel."""
+    user  = get_current_user()
+    convs = Conversation.query.filter_by(user_id=user.id).all()
+    return jsonify({c.channel: c.to_dict() for c in convs}), 200
+
+
+@ai_bp.route('/api/ai/conversation', methods=['DELETE'])
+@jwt_required()
+def ai_conversation_clear():
+    """Mulai percakapan baru. ?channel=chat|jarvis (default: semua)."""
+    user    = get_current_user()
+    channel = request.args.get('channel')
+    if channel and channel not in CHANNELS:
+        return jsonify({'error': f"channel harus salah satu dari: {', '.join(CHANNELS)}"}), 400
+    clear_memory(user.id, (channel,) if channel else CHANNELS)
+    return jsonify({'status': 'success'}), 200
+
+
+def _weekly_analysis_prompt(user) -> tuple:
+    """
+    Prompt analisis 7 hari + statistiknya + id Laporan terbaru yang ikut.
+    (None, None, None) kalau belum ada laporan.
+    """
     week_ago = now_utc() - timedelta(days=7)
 
     # FIX: baris "Laporan.user_id >= user.id" sebelumnya dihapus karena mubazir
@@ -371,7 +699,7 @@ def ai_weekly_analysis():
     ).order_by(Laporan.tanggal.asc()).all()
 
     if not laporan:
-        return jsonify({'error': 'Belum ada laporan minggu ini'}), 404
+        return None, None, None
 
     target_cal, target_prot = get_targets(user)
     avg_kal  = round(sum(l.total_kalori  for l in laporan) / len(laporan))
@@ -385,126 +713,140 @@ def ai_weekly_analysis():
         f"Detail per hari: {', '.join(f'{l.tanggal.strftime(chr(37)+chr(100)+chr(47)+chr(37)+chr(109))}: {l.total_kalori}kcal/{l.total_protein}gP' for l in laporan)}.\n"
         f"Buat ringkasan 3-4 kalimat: pencapaian, kekurangan, dan 1 saran konkret untuk minggu depan."
     )
+    stats = {
+        'avg_kalori':    avg_kal,
+        'avg_protein':   avg_prot,
+        'hari_input':    len(laporan),
+        'target_kalori': target_cal,
+        'target_protein':target_prot,
+    }
+    return prompt, stats, max(l.id for l in laporan)
+
+
+def _fresh_weekly_analysis(user_id: int):
+    """
+    Hasil tersimpan yang masih berlaku: tidak ada Laporan baru sejak dibuat,
+    dan jendela 7 harinya belum bergeser melewati Laporan yang ikut dianalisis.
+    None kalau belum ada / basi / user tidak punya laporan 7 hari terakhir.
+    """
+    week_ago  = now_utc() - timedelta(days=7)
+    latest_id = db.session.query(db.func.max(Laporan.id)).filter(
+        Laporan.user_id == user_id,
+        Laporan.tanggal >= week_ago,
+    ).scalar()
+    if latest_id is None:
+        return None
+    stored = WeeklyAnalysis.query.filter_by(user_id=user_id).first()
+    if not stored or stored.last_laporan_id < latest_id or stored.generated_at is None:
+        return None
+    # Tanpa Laporan baru pun hasilnya bisa basi: Laporan yang dulu masuk
+    # jendela [generated_at - 7 hari, generated_at] sekarang sudah lewat
+    # 7 hari, jadi statistik & sarannya bukan lagi "minggu ini".
+    dropped = db.session.query(Laporan.id).filter(
+        Laporan.user_id == user_id,
+        Laporan.id      <= stored.last_laporan_id,
+        Laporan.tanggal >= stored.generated_at - timedelta(days=7),
+        Laporan.tanggal <  week_ago,
+    ).first()
+    return None if dropped else stored
+
+
+def _store_weekly_analysis(user_id: int, last_laporan_id: int, text: str, tts_text: str, stats: dict):
+    stored = WeeklyAnalysis.query.filter_by(user_id=user_id).first() or WeeklyAnalysis(user_id=user_id)
+    stored.analysis        = text
+    stored.tts_text        = tts_text
+    stored.stats           = dict(stats)
+    stored.last_laporan_id = last_laporan_id
+    stored.generated_at    = now_utc()
+    db.session.add(stored)
+    db.session.commit()
+    return stored
+
+
+def refresh_weekly_analysis(user):
+    """
+    Generate & simpan analisis mingguan user kalau yang tersimpan sudah basi.
+    Dipakai job terjadwal (app/scheduler.py). Return WeeklyAnalysis atau None.
+    """
+    stored = _fresh_weekly_analysis(user.id)
+    if stored:
+        return stored
+    prompt, stats, last_id = _weekly_analysis_prompt(user)
+    if prompt is None:
+        return None
+    result = call_gemini(prompt, endpoint='weekly-analysis/scheduled', user_id=user.id)
+    return _store_weekly_analysis(user.id, last_id, result['text'], result['tts_text'], stats)
+
+
+@ai_bp.route('/api/ai/weekly-analysis', methods=['GET'])
+@jwt_required()
+def ai_weekly_analysis():
+    """
+    Analisis otomatis laporan 7 hari terakhir oleh AI. Biasanya sudah
+    disiapkan job malam (app/scheduler.py) — Gemini cuma dipanggil kalau
+    ada Laporan baru sejak analisis terakhir.
+    """
+    user   = get_current_user()
+    stored = _fresh_weekly_analysis(user.id)
+    if stored:
+        return jsonify({**stored.to_dict(), 'cached': True}), 200
+
+    prompt, stats, last_id = _weekly_analysis_prompt(user)
+    if prompt is None:
+        return jsonify({'error': 'Belum ada laporan minggu ini'}), 404
 
     try:
-        result = call_gemini(prompt)
-        return jsonify({
-            'analysis': result['text'],
-            'tts_text': result['tts_text'],
-            'stats': {
-                'avg_kalori':    avg_kal,
-                'avg_protein':   avg_prot,
-                'hari_input':    len(laporan),
-                'target_kalori': target_cal,
-                'target_protein':target_prot,
-            },
-        }), 200
+        result = call_gemini(prompt, endpoint='weekly-analysis', user_id=user.id)
+        stored = _store_weekly_analysis(user.id, last_id, result['text'], result['tts_text'], stats)
+        return jsonify({**stored.to_dict(), 'cached': False}), 200
+    except CircuitOpenError:
+        metrics.inc('ai_degraded_responses_total', endpoint='weekly-analysis')
+        return jsonify(_degraded_weekly_analysis(stats)), 200
+    except AIGatewayBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'error': f'AI error: {str(e)}'}), 503
 
 
-# ─────────────────────────────────────────────────────────
-#  VOICE COMMAND (endpoint terbesar)
-# ─────────────────────────────────────────────────────────
-
-@ai_bp.route('/api/ai/voice-command', methods=['POST'])
+@ai_bp.route('/api/ai/weekly-analysis/stream', methods=['GET'])
 @jwt_required()
-def ai_voice_command():
-    user = get_current_user()
-    data = request.get_json() or {}
+def ai_weekly_analysis_stream():
+    """Versi SSE dari /api/ai/weekly-analysis (hasil tersimpan dikirim langsung sekaligus)."""
+    user   = get_current_user()
+    stored = _fresh_weekly_analysis(user.id)
+    if stored:
+        body = {**stored.to_dict(), 'cached': True}
+        return Response(
+            _sse('delta', {'text': body['analysis']}) + _sse('tts', {'tts_text': body['tts_text']}) + _sse('done', body),
+            mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'},
+        )
 
-    text_input = (data.get('text')         or '').strip()
-    audio_b64  = (data.get('audio_base64') or '').strip()
-    mime_type  = (data.get('mime_type')    or 'audio/mp4').strip()
-    # Riwayat percakapan dari client (max 6 pesan terakhir)
-    history    = data.get('history', [])
+    prompt, stats, last_id = _weekly_analysis_prompt(user)
+    if prompt is None:
+        return jsonify({'error': 'Belum ada laporan minggu ini'}), 404
 
-    if not text_input and not audio_b64:
-        return jsonify({'error': 'Kirim text atau audio_base64'}), 400
-    if audio_b64 and len(audio_b64) > 10_000_000:
-        return jsonify({'error': 'Audio terlalu panjang, coba bicara lebih singkat'}), 400
+    def done(text, tts):
+        stored = _store_weekly_analysis(user.id, last_id, text, tts, stats)
+        return {**stored.to_dict(), 'cached': False}
 
-    # ── Konteks user ──────────────────────────────────────────────────────────
-    target_cal, target_prot = get_targets(user)
-    # FIX: sebelumnya `today = now_utc().date()` pakai tanggal UTC langsung.
-    # Antara jam 00:00-06:59 WIB, tanggal UTC masih "kemarin" (WIB = UTC+7),
-    # jadi data yang dicatat Jarvis dini hari nyasar ke tanggal kemarin dan
-    # gak nongol di dashboard (yang pakai tanggal WIB / hari ini beneran).
-    now_wib = now_utc() + timedelta(hours=7)
-    today   = now_wib.date()
-    jam_wib = now_wib.hour
-    if   5  <= jam_wib < 10: waktu_default = 'Pagi'
-    elif 10 <= jam_wib < 15: waktu_default = 'Siang'
-    elif 15 <= jam_wib < 18: waktu_default = 'Sore'
-    else:                    waktu_default = 'Malam'
+    return _stream_response(prompt, done, lambda: _degraded_weekly_analysis(stats), 'weekly-analysis/stream', user.id)
 
-    today_entries = db.session.query(WaktuMakan).filter(
-        WaktuMakan.user_id    == user.id,
-        WaktuMakan.tanggal    == today,
-        WaktuMakan.deleted_at.is_(None),
-    ).all()
-    total_kal_hari  = sum(e.kalori  or 0 for e in today_entries)
-    total_prot_hari = sum(e.protein or 0 for e in today_entries)
-
-    food_db   = Food.query.filter(
-        Food.deleted_at.is_(None),
-    ).order_by(Food.nama_makanan).all()
-    food_list = '\n'.join(
-        f"- id:{f.id} | {f.nama_makanan} | {f.kalori}kcal | {f.protein}g protein"
-        f" | karbo:{f.karbo or 0}g | lemak:{f.lemak or 0}g | {f.gram_per_porsi or 100}g/porsi"
-        for f in food_db
-    ) or '(belum ada makanan di database)'
 
-    makanan_hari = ', '.join(
-        f"{e.nama_makanan or '?'}({e.porsi or 1}porsi, {e.waktu_makan})"
-        for e in today_entries
-    ) or 'belum ada'
+# ─────────────────────────────────────────────────────────
+#  VOICE COMMAND (endpoint terbesar)
+# ─────────────────────────────────────────────────────────
 
-    total_air  = db.session.query(db.func.sum(WaterLog.jumlah_ml)).filter(
-        WaterLog.user_id == user.id,
-        WaterLog.tanggal == today,
-    ).scalar() or 0
-    target_air = int(user.bb * 33)
-
-    streak     = calc_streak(user.id)
-    templates  = MealTemplate.query.filter_by(user_id=user.id)\
-        .all()
-    template_list = ', '.join(f"id:{t.id}|{t.nama}" for t in templates) or 'belum ada'
-
-    # Bangun riwayat percakapan untuk konteks
-    history_text = ''
-    if history:
-        lines = []
-        for h in history[-8:]:  # max 8 pesan terakhir
-            role = 'User' if h.get('role') == 'user' else 'Jarvis'
-            lines.append(f"{role}: {h.get('text', '')}")
-        history_text = '\n'.join(lines)
-
-    system_prompt = f"""Kamu adalah NutriAI Jarvis, asisten nutrisi voice pribadi yang cerdas, hangat, dan peka konteks.
+# Prefix statis system prompt Jarvis — dibangun SEKALI saat modul di-load
+# (bukan f-string per request). Semua data per-user dikirim terpisah lewat
+# _jarvis_context_block() di dalam contents, supaya prefix ini bisa di-cache
+# di sisi Gemini (lihat app/prompt_cache.py).
+JARVIS_STATIC_PROMPT = """Kamu adalah NutriAI Jarvis, asisten nutrisi voice pribadi yang cerdas, hangat, dan peka konteks.
 Kamu berbicara seperti teman dekat yang peduli kesehatan — tidak kaku, tidak robotik, tetapi tetap akurat dan informatif.
 SELALU balas dalam Bahasa Indonesia yang natural. Gunakan nama user sesekali agar terasa personal.
 
-━━━ PROFIL USER ━━━
-Nama: {user.username} | BB: {user.bb}kg | TB: {user.tb}cm | Umur: {user.umur}th | Gender: {user.gender}
-Tujuan: {user.tujuan} | Aktivitas: {user.aktivitas} | Tipe tubuh: {user.tipe_tubuh}
-BMR: {int(user.bmr or 0)} kcal | TDEE: {int(user.tdee or 0)} kcal
-Target harian: {target_cal} kcal / {target_prot}g protein
-Waktu sekarang: {now_utc().strftime('%H:%M')} WIB | Tanggal: {today} | Sesi makan: {waktu_default}
-
-━━━ STATUS HARI INI ━━━
-Makanan tercatat: {makanan_hari}
-Sudah dikonsumsi: {total_kal_hari} kcal / {total_prot_hari}g protein
-Sisa target: {max(0, target_cal-total_kal_hari)} kcal / {max(0, target_prot-total_prot_hari)}g protein
-Air minum: {total_air}ml dari target {target_air}ml (sisa {max(0, target_air-total_air)}ml)
-Streak: {streak['current']} hari berturut-turut (rekor: {streak['longest']} hari)
+Setiap pesan user diawali blok KONTEKS USER (profil, status hari ini, kandidat database makanan,
+meal template, riwayat percakapan). Pakai blok itu sebagai sumber data; instruksi di bawah ini berlaku untuk semua user.
 
-━━━ DATABASE MAKANAN (untuk input harian) ━━━
-{food_list}
-
-━━━ MEAL TEMPLATES USER ━━━
-{template_list}
-
-{'━━━ RIWAYAT PERCAKAPAN ━━━' + chr(10) + history_text + chr(10) if history_text else ''}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 KEMAMPUAN MEMAHAMI KONTEKS (SANGAT PENTING)
 
@@ -537,7 +879,7 @@ PRINSIP INTERPRETASI:
 
 ▶ add_food → user menyebut sudah/baru/tadi makan sesuatu, atau sebutkan nama makanan dalam konteks konsumsi
   "tadi makan nasi goreng" | "sarapan roti 2 lembar" | "abis makan ayam" | "makan siang nasi padang"
-  → Cocokkan ke DATABASE MAKANAN. Jika tidak ada di DB → masukkan ke not_found
+  → Cocokkan ke KANDIDAT DATABASE MAKANAN. Jika tidak ada di kandidat → tetap masukkan ke items dengan food_id null
 
 ▶ tambah_data → user ingin daftarkan makanan baru ke database (bukan mencatat makan)
   "tambahkan data rendang ke database" | "daftarkan tahu goreng" | "input data nutrisi tempe 100g"
@@ -564,17 +906,18 @@ PRINSIP INTERPRETASI:
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 BALAS HANYA dalam format JSON ini, TIDAK BOLEH ada teks di luar JSON:
-{{
+{
   "intent": "add_food|tambah_data|use_template|delete_food|check_today|check_nutrition|check_laporan|add_water|check_water|add_weight|check_weight|meal_suggestion|analyze_nutrition|general|unclear",
   "reply": "Balasan natural hangat Bahasa Indonesia, 1-3 kalimat. Boleh tambah emoji 1-2 jika sesuai. Sebutkan nama user sesekali.",
   "tts_text": "Versi reply tanpa emoji/markdown/simbol/tanda baca khusus untuk TTS. Kalimat lengkap dan natural diucapkan.",
   "confidence": "high|low",
   "unclear_reason": "isi hanya jika confidence low — jelaskan bagian mana yang ambigu",
   "answer": "Untuk general/meal_suggestion/analyze_nutrition: jawaban lengkap, informatif, dan personal di sini. Lainnya kosong string.",
-  "params": {{
-    "items": [{{"food_id": <id integer dari DB>, "nama_makanan": "...", "porsi": <integer≥1>, "waktu_makan": "Pagi|Siang|Sore|Malam"}}],
+  "transcript": "Untuk input audio: transkrip persis ucapan user. Untuk input teks: kosong string.",
+  "params": {
+    "items": [{"food_id": <id integer dari kandidat, atau null>, "nama_makanan": "...", "porsi": <integer≥1>, "waktu_makan": "Pagi|Siang|Sore|Malam"}],
     "not_found": ["nama makanan yg tidak ada di database"],
-    "new_food": {{
+    "new_food": {
       "nama_makanan": "...",
       "kalori": <integer>,
       "protein": <integer>,
@@ -582,7 +925,7 @@ BALAS HANYA dalam format JSON ini, TIDAK BOLEH ada teks di luar JSON:
       "lemak": <integer>,
       "serat": <integer>,
       "gram_per_porsi": <integer, default 100>
-    }},
+    },
     "template_id": <integer id template, untuk use_template>,
     "waktu_makan_override": "Pagi|Siang|Sore|Malam",
     "waktu_makan_id": <integer id WaktuMakan yg mau dihapus>,
@@ -591,125 +934,245 @@ BALAS HANYA dalam format JSON ini, TIDAK BOLEH ada teks di luar JSON:
     "berat": <float kg, untuk add_weight>,
     "periode": "7_hari|30_hari|minggu_ini|bulan_ini",
     "catatan": "opsional"
-  }}
-}}
+  }
+}
 
 ATURAN TEKNIS:
-- add_food: WAJIB cocokkan nama ke DATABASE MAKANAN. Fuzzy match diperbolehkan (misal "nasi putih" cocok "Nasi"). Tidak ada di DB → not_found, JANGAN masukkan ke items
+- add_food: cocokkan nama ke KANDIDAT DATABASE MAKANAN dan isi food_id-nya. Fuzzy match diperbolehkan (misal "nasi putih" cocok "Nasi"). Tidak ada di kandidat → masukkan ke items dengan food_id null dan nama_makanan sesuai ucapan user (server akan mencari di database lengkap). not_found hanya untuk yang jelas bukan makanan/minuman
 - tambah_data: isi new_food dengan estimasi gizi terbaik dari pengetahuanmu. Semua nilai integer. Jika tidak tahu → 0
 - Konversi satuan: "centong/piring"=1 porsi nasi | "potong/iris/biji"=1 porsi lauk | "gelas"=250ml | "botol"=600ml | "mangkok/bowl"=1 porsi | "sendok makan"=15g | "sdm"=15g | "sdt"=5g
-- Waktu makan: "pagi/sarapan"→Pagi | "siang/makan siang/lunch"→Siang | "sore/snack sore"→Sore | "malam/dinner/makan malam"→Malam. Jika tidak disebutkan → gunakan {waktu_default}
+- Waktu makan: "pagi/sarapan"→Pagi | "siang/makan siang/lunch"→Siang | "sore/snack sore"→Sore | "malam/dinner/makan malam"→Malam. Jika tidak disebutkan → gunakan "Sesi makan" di KONTEKS USER
 - Jika audio tidak jelas/noise → intent "unclear", bukan general
 - JSON harus valid: tidak ada trailing comma, tidak ada teks di luar kurung kurawal terluar"""
 
-    # ── Panggil Gemini ────────────────────────────────────────────────────────
-    raw = ''
-    try:
-        parts = []
-        if audio_b64:
-            parts.append({'inline_data': {'mime_type': mime_type, 'data': audio_b64}})
-            parts.append({'text': (
-                f'Transkrip dan pahami perintah voice user di atas. '
-                f'Konteks: user bernama {user.username}, sekarang {waktu_default}, '
-                f'sudah makan {total_kal_hari} kcal dari target {target_cal} kcal hari ini. '
-                f'Balas sesuai instruksi system dalam format JSON.'
-            )})
-        else:
-            parts.append({'text': f'Perintah user: "{text_input}"'})
+# Schema balasan Jarvis (responseSchema Gemini) — sama dengan format JSON di
+# JARVIS_STATIC_PROMPT. Field params yang tidak relevan untuk intent boleh kosong.
+_JARVIS_INTENTS = [
+    'add_food', 'tambah_data', 'use_template', 'delete_food', 'check_today', 'check_nutrition',
+    'check_laporan', 'add_water', 'check_water', 'add_weight', 'check_weight', 'meal_suggestion',
+    'analyze_nutrition', 'general', 'unclear',
+]
+_WAKTU_MAKAN = ['Pagi', 'Siang', 'Sore', 'Malam']
+# Intent yang menulis ke DB — tidak dijalankan kalau balasan JSON-nya
+# kepotong (nilai seperti porsi/jumlah_ml belum tentu utuh).
+_WRITE_INTENTS          = ('add_food', 'add_water', 'add_weight', 'delete_food')
+_INCOMPLETE_VOICE_REPLY = 'Maaf, jawabanku tadi kepotong jadi belum aku catat. Coba ulangi perintahnya ya.'
+JARVIS_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'intent':         {'type': 'STRING', 'enum': _JARVIS_INTENTS},
+        'reply':          {'type': 'STRING'},
+        'tts_text':       {'type': 'STRING'},
+        'confidence':     {'type': 'STRING', 'enum': ['high', 'low']},
+        'unclear_reason': {'type': 'STRING'},
+        'answer':         {'type': 'STRING'},
+        'transcript':     {'type': 'STRING'},
+        'params': {
+            'type': 'OBJECT',
+            'properties': {
+                'items': {'type': 'ARRAY', 'items': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'food_id':      {'type': 'INTEGER', 'nullable': True},
+                        'nama_makanan': {'type': 'STRING'},
+                        'porsi':        {'type': 'INTEGER'},
+                        'waktu_makan':  {'type': 'STRING', 'enum': _WAKTU_MAKAN},
+                    },
+                    'required': ['nama_makanan'],
+                }},
+                'not_found': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+                'new_food':  {
+                    'type': 'OBJECT', 'nullable': True,
+                    'properties': {
+                        'nama_makanan':   {'type': 'STRING'},
+                        'kalori':         {'type': 'INTEGER'},
+                        'protein':        {'type': 'INTEGER'},
+                        'karbo':          {'type': 'INTEGER'},
+                        'lemak':          {'type': 'INTEGER'},
+                        'serat':          {'type': 'INTEGER'},
+                        'gram_per_porsi': {'type': 'INTEGER'},
+                    },
+                },
+                'template_id':          {'type': 'INTEGER', 'nullable': True},
+                'waktu_makan_override': {'type': 'STRING', 'enum': _WAKTU_MAKAN, 'nullable': True},
+                'waktu_makan_id':       {'type': 'INTEGER', 'nullable': True},
+                'nama_makanan_hapus':   {'type': 'STRING'},
+                'jumlah_ml':            {'type': 'INTEGER', 'nullable': True},
+                'berat':                {'type': 'NUMBER', 'nullable': True},
+                'periode':              {'type': 'STRING', 'enum': ['7_hari', '30_hari', 'minggu_ini', 'bulan_ini'],
+                                         'nullable': True},
+                'catatan':              {'type': 'STRING'},
+            },
+        },
+    },
+    'required':         ['intent', 'reply', 'tts_text', 'confidence', 'params'],
+    'propertyOrdering': ['intent', 'reply', 'tts_text', 'confidence', 'unclear_reason', 'answer',
+                         'transcript', 'params'],
+}
+
+
+def _jarvis_context_block(user, now_wib, waktu_default, target_cal, target_prot,
+                          makanan_hari, total_kal_hari, total_prot_hari, total_air, target_air,
+                          streak, food_list, template_list, history_text) -> str:
+    """Bagian dinamis prompt Jarvis (per user, per request) — kecil dibanding prefix statis."""
+    return f"""━━━ KONTEKS USER ━━━
+Nama: {user.username} | BB: {user.bb}kg | TB: {user.tb}cm | Umur: {user.umur}th | Gender: {user.gender}
+Tujuan: {user.tujuan} | Aktivitas: {user.aktivitas} | Tipe tubuh: {user.tipe_tubuh}
+BMR: {int(user.bmr or 0)} kcal | TDEE: {int(user.tdee or 0)} kcal
+Target harian: {target_cal} kcal / {target_prot}g protein
+Waktu sekarang: {now_wib.strftime('%H:%M')} WIB | Tanggal: {now_wib.date()} | Sesi makan: {waktu_default}
 
-        model    = os.environ.get('GEMINI_MODEL',   'gemini-2.5-flash')
-        api_ver  = os.environ.get('GEMINI_API_VER', 'v1beta')
-        endpoint = (
-            f'https://generativelanguage.googleapis.com/{api_ver}'
-            f'/models/{model}:generateContent?key={GEMINI_API_KEY}'
-        )
-        payload = json.dumps({
-            'system_instruction': {'parts': [{'text': system_prompt}]},
-            'contents':           [{'parts': parts}],
-            'generationConfig':   {'temperature': 0.4, 'maxOutputTokens': 1800},
-        }).encode()
+━━━ STATUS HARI INI ━━━
+Makanan tercatat: {makanan_hari}
+Sudah dikonsumsi: {total_kal_hari} kcal / {total_prot_hari}g protein
+Sisa target: {max(0, target_cal-total_kal_hari)} kcal / {max(0, target_prot-total_prot_hari)}g protein
+Air minum: {total_air}ml dari target {target_air}ml (sisa {max(0, target_air-total_air)}ml)
+Streak: {streak['current']} hari berturut-turut (rekor: {streak['longest']} hari)
 
-        current_app.logger.info(f'[VoiceCmd] model={model} audio={bool(audio_b64)} len={len(audio_b64)}')
+━━━ KANDIDAT DATABASE MAKANAN (untuk input harian) ━━━
+Ini cuma makanan yang paling relevan dengan ucapan user, BUKAN isi database lengkap.
+{food_list}
 
-        gemini_result = None
-        last_error    = None
-        for attempt in range(3):
-            try:
-                req = urlreq.Request(endpoint, data=payload, headers={'Content-Type': 'application/json'})
-                with urlreq.urlopen(req, timeout=55) as resp:
-                    gemini_result = json.loads(resp.read())
-                break
-            except urlerr.HTTPError as http_err:
-                err_body   = http_err.read().decode('utf-8', errors='replace')
-                last_error = f'HTTP error {http_err.code}: {err_body[:200]}'
-                current_app.logger.error(f'[VoiceCmd] HTTPError {http_err.code} (attempt {attempt+1}/3): {err_body[:300]}')
-                if http_err.code in (503, 429, 500) and attempt < 2:
-                    time.sleep([3, 7, 15][attempt]); continue
-                raise RuntimeError(last_error)
-            except urlerr.URLError as url_err:
-                last_error = str(url_err.reason)
-                current_app.logger.error(f'[VoiceCmd] URLError (attempt {attempt+1}/3): {url_err.reason}')
-                if attempt < 2:
-                    time.sleep([3, 7, 15][attempt]); continue
-                raise RuntimeError(f'Koneksi gagal: {last_error}')
-
-        if gemini_result is None:
-            raise RuntimeError(last_error or 'Semua retry gagal')
+━━━ MEAL TEMPLATES USER ━━━
+{template_list}
+{chr(10) + '━━━ RIWAYAT PERCAKAPAN ━━━' + chr(10) + history_text + chr(10) if history_text else ''}"""
+
+
+def _jarvis_upstream(call: UpstreamCall, contents: list, gen_cfg: dict) -> dict:
+    """Panggilan Gemini untuk voice-command (jalan di thread ai_gateway, tanpa app context)."""
+    result = model_router.run('voice-command', call, lambda route, deadline: gemini_policy.call(
+        call.wrap(_jarvis_attempt(*route, contents, gen_cfg)), deadline,
+    ))
+    call.stop()
+    call.add_usage(result)
+    return result
+
+
+def _jarvis_attempt(model: str, api_ver: str, contents: list, gen_cfg: dict):
+    """fn(timeout) untuk gemini_policy: 1 model, prefix statis lewat context_cache."""
+    payload, used_cache = None, False
+
+    def attempt(timeout):
+        nonlocal payload, used_cache
+        if payload is None:
+            # Dibangun di dalam policy (bukan sebelumnya) supaya saat breaker
+            # OPEN tidak ada panggilan cachedContents yang ikut terkirim.
+            # Membuat cache memakai budget percobaan ini juga — generateContent
+            # cuma dapat sisanya.
+            started = time.monotonic()
+            payload, used_cache = context_cache.build_payload(
+                model, api_ver, JARVIS_STATIC_PROMPT, GEMINI_API_KEY, contents, gen_cfg, timeout=timeout,
+            )
+            timeout = max(timeout - (time.monotonic() - started), 1)
+            logger.info('[VoiceCmd] cached_prefix=%s', used_cache)
+        try:
+            return gemini_client.generate_content(model, api_ver, payload, GEMINI_API_KEY, timeout=timeout)
+        except GeminiHTTPError as http_err:
+            if not (used_cache and http_err.code in (400, 403, 404)):
+                raise
+            # Cache di sisi Gemini kedaluwarsa/ditolak → kirim ulang prefix inline
+            # (bukan retry karena upstream gangguan, jadi tidak lewat backoff).
+            logger.warning('[VoiceCmd] cachedContent ditolak (HTTP %s), kirim ulang inline', http_err.code)
+            context_cache.invalidate(model, api_ver, JARVIS_STATIC_PROMPT)
+            payload, used_cache = context_cache.build_payload(
+                model, api_ver, JARVIS_STATIC_PROMPT, GEMINI_API_KEY, contents, gen_cfg, inline=True,
+            )
+            return gemini_client.generate_content(model, api_ver, payload, GEMINI_API_KEY, timeout=timeout)
+
+    return attempt
+
+
+def _jarvis_day_context(user) -> dict:
+    """Konteks 'hari ini' user yang dipakai prompt Jarvis DAN eksekusi action."""
+    target_cal, target_prot = get_targets(user)
+    # FIX: sebelumnya `today = now_utc().date()` pakai tanggal UTC langsung.
+    # Antara jam 00:00-06:59 WIB, tanggal UTC masih "kemarin" (WIB = UTC+7),
+    # jadi data yang dicatat Jarvis dini hari nyasar ke tanggal kemarin dan
+    # gak nongol di dashboard (yang pakai tanggal WIB / hari ini beneran).
+    now_wib = now_utc() + timedelta(hours=7)
+    today   = now_wib.date()
+    jam_wib = now_wib.hour
+    if   5  <= jam_wib < 10: waktu_default = 'Pagi'
+    elif 10 <= jam_wib < 15: waktu_default = 'Siang'
+    elif 15 <= jam_wib < 18: waktu_default = 'Sore'
+    else:                    waktu_default = 'Malam'
 
-        raw = gemini_result['candidates'][0]['content']['parts'][0]['text'].strip()
-        raw = re.sub(r'^```[a-zA-Z]*\s*', '', raw)
-        raw = re.sub(r'\s*```$',           '', raw).strip()
-        current_app.logger.info(f'[VoiceCmd] Gemini OK: {raw[:100]}')
-        ai_data = json.loads(raw)
+    # Entri makan, air, streak & template dari snapshot (lihat app/day_snapshot.py)
+    # — giliran Jarvis berturut-turut tidak query ulang DB.
+    day = get_day_snapshot(user.id)
+
+    return {
+        'now_wib':         now_wib,
+        'today':           today,
+        'waktu_default':   waktu_default,
+        'target_cal':      target_cal,
+        'target_prot':     target_prot,
+        'today_entries':   day['entries'],
+        'total_kal_hari':  day['total_kalori'],
+        'total_prot_hari': day['total_protein'],
+        'total_air':       day['total_air'],
+        'target_air':      int(user.bb * 33),
+        'streak':          day['streak'],
+        'templates':       day['templates'],
+    }
+
+
+def _jarvis_response(intent, reply, tts_text, confidence, unclear_reason, action_result):
+    return jsonify({
+        'intent':         intent,
+        'reply':          reply,
+        'tts_text':       tts_text,
+        'confidence':     confidence,
+        'unclear_reason': unclear_reason,
+        'action_result':  action_result,
+        # Riwayat sekarang disimpan server (app/conversation_memory.py); field ini
+        # tetap dikirim untuk app versi lama yang masih mengirim 'history'.
+        'history_entry':  {'role': 'assistant', 'text': reply},
+    }), 200
 
-    except RuntimeError as e:
-        return jsonify({'error': f'AI tidak tersedia: {str(e)}'}), 503
-    except json.JSONDecodeError as e:
-        current_app.logger.error(f'[VoiceCmd] JSON error: {e} | raw: {raw[:300]}')
-        return jsonify({'error': 'AI response tidak valid, coba ulangi'}), 500
-    except Exception as e:
-        current_app.logger.error(f'[VoiceCmd] Unexpected: {e}', exc_info=True)
-        return jsonify({'error': f'Error: {str(e)}'}), 500
 
-    intent         = ai_data.get('intent', 'general')
-    reply          = ai_data.get('reply', '')
-    tts_text       = ai_data.get('tts_text', reply)
-    answer         = ai_data.get('answer', '')
-    params         = ai_data.get('params') or {}
-    confidence     = ai_data.get('confidence', 'high')
-    unclear_reason = ai_data.get('unclear_reason', '')
-    action_result  = {'intent': intent, 'status': 'ok'}
+# Intent yang mengubah data "hari ini" → snapshot user dibuang (app/day_snapshot.py).
+_DAY_WRITE_INTENTS = {'add_food', 'use_template', 'delete_food', 'add_water'}
 
-    if intent == 'unclear':
-        return jsonify({
-            'intent': 'unclear', 'reply': reply, 'tts_text': tts_text,
-            'confidence': 'low', 'unclear_reason': unclear_reason,
-            'action_result': {'intent': 'unclear', 'status': 'ok'},
-        }), 200
 
-    # ── Eksekusi action ───────────────────────────────────────────────────────
+def _execute_jarvis_action(user, intent: str, params: dict, answer: str,
+                           reply: str, tts_text: str, ctx: dict) -> tuple:
+    """
+    Jalankan intent Jarvis ke DB. Dipakai hasil Gemini maupun fast-path lokal.
+    Return (action_result, reply, tts_text) — reply/tts ditimpa kalau hasil
+    eksekusi tidak sesuai dengan yang sudah dijanjikan reply.
+    """
+    today           = ctx['today']
+    waktu_default   = ctx['waktu_default']
+    target_cal      = ctx['target_cal']
+    target_prot     = ctx['target_prot']
+    today_entries   = ctx['today_entries']
+    total_kal_hari  = ctx['total_kal_hari']
+    total_prot_hari = ctx['total_prot_hari']
+    total_air       = ctx['total_air']
+    target_air      = ctx['target_air']
+    streak          = ctx['streak']
+    action_result   = {'intent': intent, 'status': 'ok'}
+
     try:
 
         if intent == 'add_food':
             items     = params.get('items', [])
             not_found = list(params.get('not_found', []))
             added     = []
-            for item in items:
-                food_id     = item.get('food_id')
-                food_master = db.session.get(Food, food_id) if food_id else None
-                if not food_master:
-                    name = (item.get('nama_makanan') or '').strip().lower()
-                    if name:
-                        food_master = Food.query.filter(
-                            Food.deleted_at.is_(None),
-                            Food.nama_makanan.ilike(f'%{name}%'),
-                        ).first()
+            rows      = []
+            items     = [it for it in items if isinstance(it, dict)]
+            # 1 query untuk semua food_id + 1 query untuk semua nama fallback
+            # (lihat resolve_voice_items), lalu 1 INSERT untuk semua baris.
+            # food_id tebakan AI tetap di-scope ke makanan yang boleh dilihat
+            # user — jangan sampai menunjuk makanan pribadi milik user lain.
+            for item, food_master in zip(items, resolve_voice_items(user.id, items)):
                 if food_master:
                     porsi = max(1, int(item.get('porsi') or 1))
                     wkt   = item.get('waktu_makan') or waktu_default
                     if wkt not in ('Pagi', 'Siang', 'Sore', 'Malam'):
                         wkt = waktu_default
-                    db.session.add(WaktuMakan(
+                    rows.append(dict(
                         waktu_makan  = wkt,
                         food_id      = food_master.id,
                         user_id      = user.id,
@@ -730,7 +1193,8 @@ ATURAN TEKNIS:
                     nama = item.get('nama_makanan', '')
                     if nama and nama not in not_found:
                         not_found.append(nama)
-            if added:
+            if rows:
+                db.session.execute(db.insert(WaktuMakan), rows)
                 db.session.commit()
                 record_streak(user.id, today)
             action_result.update({'added': added, 'not_found': not_found, 'count': len(added)})
@@ -753,11 +1217,7 @@ ATURAN TEKNIS:
             if not nama:
                 action_result.update({'status': 'error', 'error': 'Nama makanan tidak ditemukan dari perintah'})
             else:
-                existing = Food.query.filter(
-                    Food.nama_makanan.ilike(nama),
-                    Food.deleted_at.is_(None),
-                    db.or_(Food.user_id.is_(None), Food.user_id == user.id),
-                ).first()
+                existing = find_visible_by_name(user.id, nama)
                 if existing:
                     action_result.update({
                         'status': 'duplicate', 'nama': existing.nama_makanan,
@@ -834,14 +1294,20 @@ ATURAN TEKNIS:
                 entry = WaktuMakan.query.filter_by(id=wm_id, user_id=user.id)\
                     .filter(WaktuMakan.deleted_at.is_(None)).first()
             if not entry:
-                nama_hapus = (params.get('nama_makanan_hapus') or '').strip().lower()
+                nama_hapus = (params.get('nama_makanan_hapus') or '').strip()
                 if nama_hapus:
-                    entry = db.session.query(WaktuMakan).filter(
+                    # FIX: dulu ILIKE ke Food.nama_makanan tanpa join (cross
+                    # join ke seluruh tabel food). Sekarang nama yang dicatat
+                    # di log hari ini dicocokkan lewat FoodMatcher; skor
+                    # tertinggi menang, seri → entri paling baru.
+                    entries = WaktuMakan.query.filter(
                         WaktuMakan.user_id    == user.id,
                         WaktuMakan.tanggal    == today,
                         WaktuMakan.deleted_at.is_(None),
-                        Food.nama_makanan.ilike(f'%{nama_hapus}%'),
-                    ).order_by(WaktuMakan.id.desc()).first()
+                    ).all()
+                    hits = FoodMatcher(entries).match(nama_hapus, limit=0, min_score=VOICE_MATCH_MIN_SCORE)
+                    if hits:
+                        entry = max((e for sc, e in hits if sc == hits[0][0]), key=lambda e: e.id)
             if entry:
                 nama_deleted     = entry.nama_makanan or '?'
                 entry.deleted_at = now_utc()
@@ -1001,16 +1467,216 @@ ATURAN TEKNIS:
         reply    = 'Waduh, ada masalah pas nyimpan ke database. Coba ulangi beberapa saat lagi ya.'
         tts_text = reply
 
-    return jsonify({
-        'intent':         intent,
-        'reply':          reply,
-        'tts_text':       tts_text,
-        'confidence':     confidence,
-        'unclear_reason': unclear_reason,
-        'action_result':  action_result,
-        # Client harus simpan ini dan kirim balik sebagai 'history' di request berikutnya
-        'history_entry':  {'role': 'assistant', 'text': reply},
-    }), 200
+    if intent in _DAY_WRITE_INTENTS:
+        invalidate_day_snapshot(user.id)
+
+    return action_result, reply, tts_text
+
+
+# Batas audio upload multipart (byte mentah). Setara batas lama 10 juta
+# karakter base64 di jalur JSON.
+AI_AUDIO_MAX_BYTES = int(os.environ.get('AI_AUDIO_MAX_BYTES', 7_500_000))
+
+
+def _read_voice_multipart() -> tuple:
+    """
+    Baca body multipart voice-command. Return (fields, audio_b64, error) —
+    error = (pesan, status) atau None.
+    File > 500 KB di-spool Werkzeug ke file temporary (bukan ditahan di RAM),
+    dan batas ukuran dicek SAAT parsing lewat request.max_content_length,
+    jadi upload kebesaran ditolak sebelum selesai dibaca. Audio di-encode
+    base64 tepat sekali, langsung dari file itu.
+    """
+    request.max_content_length = AI_AUDIO_MAX_BYTES + 64 * 1024   # + ruang untuk field teks
+    try:
+        form  = request.form
+        audio = request.files.get('audio')
+    except RequestEntityTooLarge:
+        return None, None, ('Audio terlalu panjang, coba bicara lebih singkat', 413)
+
+    fields = {k: form.get(k) for k in ('text', 'mime_type')}
+    try:
+        fields['history'] = json.loads(form.get('history') or '[]')
+    except ValueError:
+        fields['history'] = []
+    if not isinstance(fields['history'], list):
+        fields['history'] = []
+
+    audio_b64 = ''
+    if audio:
+        audio.stream.seek(0, os.SEEK_END)
+        size = audio.stream.tell()
+        audio.stream.seek(0)
+        if size > AI_AUDIO_MAX_BYTES:
+            return None, None, ('Audio terlalu panjang, coba bicara lebih singkat', 413)
+        if size:
+            audio_b64 = base64.b64encode(audio.stream.read()).decode('ascii')
+        if not fields['mime_type'] and audio.mimetype.startswith('audio/'):
+            fields['mime_type'] = audio.mimetype
+    return fields, audio_b64, None
+
+
+@ai_bp.route('/api/ai/voice-command', methods=['POST'])
+@jwt_required()
+def ai_voice_command():
+    """
+    Perintah Jarvis lewat teks atau audio. Dua format body:
+      - JSON: {text | audio_base64, mime_type, history}  (format lama, tetap didukung)
+      - multipart/form-data: file 'audio' (biner mentah) + field text / mime_type /
+        history (string JSON). Hemat ~33% uplink dan tanpa parse JSON multi-MB.
+    """
+    user = get_current_user()
+
+    if request.mimetype == 'multipart/form-data':
+        data, audio_b64, error = _read_voice_multipart()
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        mime_type = (data.get('mime_type') or 'audio/mp4').strip()
+    else:
+        data      = request.get_json(silent=True) or {}
+        audio_b64 = (data.get('audio_base64') or '').strip()
+        mime_type = (data.get('mime_type')    or 'audio/mp4').strip()
+        if audio_b64 and len(audio_b64) > 10_000_000:
+            return jsonify({'error': 'Audio terlalu panjang, coba bicara lebih singkat'}), 400
+
+    text_input = (data.get('text') or '').strip()
+    # Riwayat dari client (app versi lama) — cuma dipakai kalau memori server masih kosong
+    history    = data.get('history', [])
+
+    if not text_input and not audio_b64:
+        return jsonify({'error': 'Kirim text, audio_base64, atau file audio'}), 400
+
+    # Retry dari app (timeout di sisi client) untuk perintah yang sama tidak
+    # boleh memanggil Gemini lagi / mencatat makanan & air dua kali.
+    audio_key = hashlib.sha256(audio_b64.encode()).hexdigest() if audio_b64 else ''
+    return _coalesced(
+        ('voice-command', user.id, normalize_command(text_input), audio_key),
+        lambda: _voice_command(user, text_input, audio_b64, mime_type, history),
+    )
+
+
+def _voice_command(user, text_input: str, audio_b64: str, mime_type: str, history: list):
+    """Isi ai_voice_command setelah input dibaca & lolos validasi."""
+    ctx = _jarvis_day_context(user)
+
+    # ── Fast-path lokal ───────────────────────────────────────────────────────
+    # Perintah teks berpola tetap ("minum 2 gelas", "rekap hari ini") dieksekusi
+    # langsung tanpa Gemini — lihat app/jarvis_fastpath.py. Audio selalu ke Gemini.
+    if text_input and not audio_b64:
+        metrics.inc('jarvis_fastpath_attempts_total')
+        fast = parse_fast_intent(text_input)
+        if fast:
+            intent = fast['intent']
+            metrics.inc('jarvis_fastpath_hits_total', intent=intent)
+            current_app.logger.info(f'[VoiceCmd] fast-path intent={intent}')
+            action_result, reply, _ = _execute_jarvis_action(user, intent, fast['params'], '', '', '', ctx)
+            reply = reply or compose_fast_reply(intent, action_result, user.username)
+            remember(user.id, 'jarvis', text_input, reply, seed=history)
+            return _jarvis_response(intent, reply, clean_tts(reply), 'high', '', action_result)
+
+    # ── Konteks user ──────────────────────────────────────────────────────────
+    # Cuma kandidat top-K (scope global + milik user), bukan seluruh tabel food —
+    # lihat app/food_retrieval.py.
+    summary, turns   = load_memory(user.id, 'jarvis', history)
+    recent_user_text = ' '.join(t['text'] for t in turns[-4:] if t['role'] == 'user')
+    food_db   = retrieve_food_candidates(user.id, text_input, recent_user_text)
+    food_list = '\n'.join(
+        f"- id:{f.id} | {f.nama_makanan} | {f.kalori}kcal | {f.protein}g protein"
+        f" | karbo:{f.karbo or 0}g | lemak:{f.lemak or 0}g | {f.gram_per_porsi or 100}g/porsi"
+        for f in food_db
+    ) or '(tidak ada kandidat yang cocok)'
+
+    makanan_hari = ', '.join(
+        f"{e.nama_makanan or '?'}({e.porsi or 1}porsi, {e.waktu_makan})"
+        for e in ctx['today_entries']
+    ) or 'belum ada'
+
+    template_list = ', '.join(f"id:{tid}|{nama}" for tid, nama in ctx['templates']) or 'belum ada'
+
+    # Riwayat percakapan dari memori server (ringkasan + pesan terbaru)
+    history_text = render_history(summary, turns, 'Jarvis')
+
+    context_block = _jarvis_context_block(
+        user, ctx['now_wib'], ctx['waktu_default'], ctx['target_cal'], ctx['target_prot'],
+        makanan_hari, ctx['total_kal_hari'], ctx['total_prot_hari'], ctx['total_air'], ctx['target_air'],
+        ctx['streak'], food_list, template_list, history_text,
+    )
+
+    # ── Panggil Gemini ────────────────────────────────────────────────────────
+    raw = ''
+    try:
+        parts = [{'text': context_block}]
+        if audio_b64:
+            parts.append({'inline_data': {'mime_type': mime_type, 'data': audio_b64}})
+            parts.append({'text': (
+                'Transkrip dan pahami perintah voice user di atas. '
+                'Balas sesuai instruksi system dalam format JSON.'
+            )})
+        else:
+            parts.append({'text': f'Perintah user: "{text_input}"'})
+
+        model    = model_router.primary('voice-command').model
+        contents = [{'role': 'user', 'parts': parts}]
+        gen_cfg  = {'temperature': 0.4, 'maxOutputTokens': 1800, **json_generation_config(JARVIS_RESPONSE_SCHEMA)}
+
+        current_app.logger.info(f'[VoiceCmd] model={model} audio={bool(audio_b64)} len={len(audio_b64)}')
+        call = UpstreamCall('voice-command', model, user.id)
+        try:
+            gemini_result = ai_gateway.run(_jarvis_upstream, call, contents, gen_cfg,
+                                           user_id=user.id, endpoint='voice-command')
+        except Exception as e:
+            record_call(call, e)
+            raise
+        record_call(call)
+
+        raw = gemini_result['candidates'][0]['content']['parts'][0]['text'].strip()
+        current_app.logger.info(f'[VoiceCmd] Gemini OK: {raw[:100]}')
+        ai_data, json_status = parse_ai_json(raw, 'voice-command', ('intent', 'reply'))
+
+    except CircuitOpenError:
+        metrics.inc('ai_degraded_responses_total', endpoint='voice-command')
+        return _jarvis_response('general', DEGRADED_VOICE_REPLY, clean_tts(DEGRADED_VOICE_REPLY), 'low', '',
+                                {'intent': 'general', 'status': 'degraded'})
+    except AIGatewayBusy as e:
+        return _busy_response(e)
+    except RuntimeError as e:
+        return jsonify({'error': f'AI tidak tersedia: {str(e)}'}), 503
+    except AIJSONError as e:
+        current_app.logger.error(f'[VoiceCmd] JSON error: {e} | raw: {raw[:300]}')
+        return jsonify({'error': 'AI response tidak valid, coba ulangi'}), 500
+    except Exception as e:
+        current_app.logger.error(f'[VoiceCmd] Unexpected: {e}', exc_info=True)
+        return jsonify({'error': f'Error: {str(e)}'}), 500
+
+    intent         = ai_data.get('intent', 'general')
+    reply          = ai_data.get('reply', '')
+    tts_text       = ai_data.get('tts_text', reply)
+    answer         = ai_data.get('answer', '')
+    params         = ai_data.get('params') or {}
+    confidence     = ai_data.get('confidence', 'high')
+    unclear_reason = ai_data.get('unclear_reason', '')
+
+    if intent == 'unclear':
+        return jsonify({
+            'intent': 'unclear', 'reply': reply, 'tts_text': tts_text,
+            'confidence': 'low', 'unclear_reason': unclear_reason,
+            'action_result': {'intent': 'unclear', 'status': 'ok'},
+        }), 200
+
+    # Balasan yang kepotong bisa kehilangan nilai (porsi, jumlah_ml,
+    # waktu_makan...) — jangan sampai itu yang ditulis ke DB. Balasan yang
+    # cuma diperbaiki (code fence, koma di akhir, ...) isinya utuh → jalan.
+    if json_status == 'truncated' and intent in _WRITE_INTENTS:
+        current_app.logger.warning(f'[VoiceCmd] balasan {json_status}, intent {intent} tidak dijalankan | raw: {raw[:300]}')
+        reply = _INCOMPLETE_VOICE_REPLY
+        return _jarvis_response(intent, reply, clean_tts(reply), 'low', 'incomplete_response',
+                                {'intent': intent, 'status': 'incomplete'})
+
+    action_result, reply, tts_text = _execute_jarvis_action(user, intent, params, answer, reply, tts_text, ctx)
+    # Input audio: teks user diambil dari transkrip yang dikembalikan Gemini.
+    user_said = text_input or (ai_data.get('transcript') or '').strip() or '(pesan suara)'
+    remember(user.id, 'jarvis', user_said, answer or reply, seed=history)
+    return _jarvis_response(intent, reply, tts_text, confidence, unclear_reason, action_result)
 
 
 # ─────────────────────────────────────────────────────────
@@ -1051,11 +1717,7 @@ def ai_confirm_tambah_data():
     # HANYA cek makanan yang bisa dilihat user ini (global + milik sendiri) —
     # jangan blokir gara-gara makanan pribadi user LAIN kebetulan nama sama,
     # karena itu tidak pernah kelihatan olehnya juga (pesan akan membingungkan).
-    existing = Food.query.filter(
-        Food.nama_makanan.ilike(nama),
-        Food.deleted_at.is_(None),
-        db.or_(Food.user_id.is_(None), Food.user_id == user.id),
-    ).first()
+    existing = find_visible_by_name(user.id, nama)
     if existing:
         return jsonify({
             'status': 'duplicate',
@@ -1102,6 +1764,7 @@ def ai_confirm_tambah_data():
     )
     db.session.add(food_baru)
     db.session.commit()
+    food_autocomplete.invalidate_user(user.id)
 
     return jsonify({
         'status': 'added',
@@ -0,0 +1,142 @@
+import time
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, AIUsageDaily, now_wib_date
+from app.ai_metrics import metrics, TOKEN_BUCKETS
+from app.ai_gateway import AIGatewayBusy, AIUserBusy, AIGatewayTimeout
+from app.gemini_client import GeminiHTTPError, GeminiConnectionError
+from app.upstream_policy import CircuitOpenError
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  INSTRUMENTASI PANGGILAN GEMINI
+# ─────────────────────────────────────────────────────────
+# Setiap panggilan upstream (call_gemini, stream, Jarvis) membawa satu
+# UpstreamCall: endpoint, model, jumlah attempt (termasuk retry),
+# token dari usageMetadata, latency upstream, dan outcome. Saat selesai,
+# record_call() menulisnya ke:
+#   - metrik in-memory (counter + histogram, lihat /api/admin/metrics),
+#   - tabel ai_usage_daily (ringkasan per user per hari, lihat
+#     /api/admin/ai-usage) — supaya kelihatan endpoint / user mana yang
+#     paling mahal.
+# Pencatatan tidak boleh menggagalkan request: error DB cukup di-log.
+
+
+class UpstreamCall:
+    def __init__(self, endpoint: str, model: str, user_id: int = None):
+        self.endpoint      = endpoint
+        self.model         = model
+        self.user_id       = user_id
+        self.attempts      = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.latency_ms    = 0
+        self._started      = None
+
+    def wrap(self, fn):
+        """Bungkus fn(timeout) milik gemini_policy.call: hitung attempt & mulai jam upstream."""
+        def attempt(timeout):
+            if self._started is None:
+                self._started = time.perf_counter()
+            self.attempts += 1
+            return fn(timeout)
+        return attempt
+
+    def add_usage(self, result: dict):
+        """
+        Ambil usageMetadata dari response (atau chunk stream). Di stream,
+        tiap chunk membawa total kumulatif — jadi nilainya ditimpa, bukan dijumlah.
+        """
+        usage = (result or {}).get('usageMetadata')
+        if not usage:
+            return
+        self.prompt_tokens = usage.get('promptTokenCount', 0) or 0
+        # Token "thinking" ikut ditagih sebagai output.
+        self.output_tokens = (usage.get('candidatesTokenCount', 0) or 0) + (usage.get('thoughtsTokenCount', 0) or 0)
+        self.cached_tokens = usage.get('cachedContentTokenCount', 0) or 0
+
+    def stop(self):
+        if self._started is not None and not self.latency_ms:
+            self.latency_ms = round((time.perf_counter() - self._started) * 1000)
+
+
+def outcome_of(exc: BaseException = None) -> str:
+    if exc is None:
+        return 'ok'
+    if isinstance(exc, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(exc, AIUserBusy):
+        return 'user_limit'
+    if isinstance(exc, AIGatewayBusy):
+        return 'busy'
+    if isinstance(exc, AIGatewayTimeout):
+        return 'timeout'
+    if isinstance(exc, GeminiHTTPError):
+        return f'http_{exc.code}'
+    if isinstance(exc, GeminiConnectionError):
+        return 'connection'
+    if isinstance(exc, GeneratorExit):
+        return 'client_closed'   # client menutup stream SSE di tengah jalan
+    return 'error'
+
+
+def record_call(call: UpstreamCall, exc: BaseException = None):
+    """Catat 1 panggilan yang sudah selesai (sukses atau gagal). Dipanggil di thread request."""
+    call.stop()
+    outcome = outcome_of(exc)
+    labels  = {'endpoint': call.endpoint, 'model': call.model}
+
+    metrics.inc('ai_upstream_calls_total', outcome=outcome, **labels)
+    metrics.inc('ai_upstream_attempts_total', call.attempts, **labels)
+    if call.attempts:
+        metrics.observe('ai_upstream_latency_ms', call.latency_ms, **labels)
+        metrics.observe('ai_upstream_attempts', call.attempts, buckets=(1, 2, 3, 5), **labels)
+    if call.prompt_tokens or call.output_tokens:
+        metrics.inc('ai_prompt_tokens_total', call.prompt_tokens, **labels)
+        metrics.inc('ai_output_tokens_total', call.output_tokens, **labels)
+        metrics.inc('ai_cached_tokens_total', call.cached_tokens, **labels)
+        metrics.observe('ai_prompt_tokens', call.prompt_tokens, buckets=TOKEN_BUCKETS, **labels)
+
+    logger.info('[AIUsage] endpoint=%s model=%s user=%s outcome=%s attempts=%d tokens=%d/%d latency=%dms',
+                call.endpoint, call.model, call.user_id, outcome, call.attempts,
+                call.prompt_tokens, call.output_tokens, call.latency_ms)
+
+    if call.user_id is not None and call.attempts:
+        try:
+            _add_daily_usage(call, error=outcome != 'ok')
+        except Exception as e:
+            logger.warning('[AIUsage] gagal simpan ringkasan harian: %s', e)
+
+
+def _add_daily_usage(call: UpstreamCall, error: bool):
+    """
+    Tambahkan ke baris ai_usage_daily (user, hari ini WIB, endpoint).
+    Pakai koneksi & transaksi sendiri, bukan db.session — jangan sampai ikut
+    meng-commit / me-rollback perubahan request yang belum selesai.
+    """
+    t     = AIUsageDaily.__table__
+    today = now_wib_date()
+    key   = (t.c.user_id == call.user_id) & (t.c.tanggal == today) & (t.c.endpoint == call.endpoint)
+    delta = {
+        'calls':         1,
+        'errors':        int(error),
+        'attempts':      call.attempts,
+        'prompt_tokens': call.prompt_tokens,
+        'output_tokens': call.output_tokens,
+        'latency_ms':    call.latency_ms,
+    }
+    bump  = t.update().where(key).values({t.c[k]: t.c[k] + v for k, v in delta.items()})
+
+    with db.engine.begin() as conn:
+        if conn.execute(bump).rowcount:
+            return
+        try:
+            with conn.begin_nested():
+                conn.execute(t.insert().values(user_id=call.user_id, tanggal=today, endpoint=call.endpoint, **delta))
+        except IntegrityError:
+            conn.execute(bump)   # worker lain baru saja insert baris yang sama
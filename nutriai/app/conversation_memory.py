@@ -0,0 +1,200 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Conversation
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  MEMORI PERCAKAPAN SERVER-SIDE (chat & Jarvis)
+# ─────────────────────────────────────────────────────────
+# Dulu client harus mengirim ulang 'history' tiap request (dipotong 8–10
+# pesan terakhir): boros uplink, ukuran prompt naik-turun, dan konteks yang
+# lebih lama hilang total. Sekarang riwayat disimpan per user per channel
+# di tabel ai_conversation:
+#   - Pesan terbaru dikirim ke prompt apa adanya, selama muat di budget
+#     AI_MEMORY_TURN_TOKENS (minimal AI_MEMORY_MIN_TURNS pesan terakhir).
+#   - Pesan yang lebih lama diringkas Gemini (di background, bukan di jalur
+#     request) ke dalam 'summary' berjalan, maksimal ±AI_MEMORY_SUMMARY_TOKENS.
+# Jadi bagian riwayat di prompt paling besar ≈ budget pesan + budget ringkasan.
+#
+# Client cukup kirim pesan baru. 'history' dari client (app versi lama)
+# hanya dipakai untuk mengisi memori yang masih kosong.
+
+AI_MEMORY_TURN_TOKENS    = int(os.environ.get('AI_MEMORY_TURN_TOKENS', 600))
+AI_MEMORY_SUMMARY_TOKENS = int(os.environ.get('AI_MEMORY_SUMMARY_TOKENS', 200))
+AI_MEMORY_MIN_TURNS      = int(os.environ.get('AI_MEMORY_MIN_TURNS', 2))
+# Batas simpan kalau ringkasan gagal terus (mis. Gemini down) — pesan
+# paling lama dibuang supaya baris tidak tumbuh tanpa batas.
+AI_MEMORY_MAX_TURNS      = int(os.environ.get('AI_MEMORY_MAX_TURNS', 40))
+AI_MEMORY_MAX_TURN_CHARS = 1500
+
+CHANNELS = ('chat', 'jarvis')
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-memory')
+_pending          = set()
+_pending_lock     = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Perkiraan kasar (±4 karakter per token) — cukup untuk menjaga budget."""
+    return len(text or '') // 4 + 1
+
+
+def _clean_turns(history) -> list:
+    """Validasi riwayat (dari client / DB) → [{role: user|assistant, text}]."""
+    turns = []
+    for h in history if isinstance(history, list) else []:
+        if not isinstance(h, dict) or not str(h.get('text') or '').strip():
+            continue
+        turns.append({
+            'role': 'user' if h.get('role') == 'user' else 'assistant',
+            'text': str(h['text']).strip()[:AI_MEMORY_MAX_TURN_CHARS],
+        })
+    return turns
+
+
+def _split_budget(turns: list) -> tuple:
+    """(pesan lama yang harus diringkas, pesan terbaru yang muat di budget)."""
+    used, keep = 0, 0
+    for t in reversed(turns):
+        cost = estimate_tokens(t['text'])
+        if keep >= AI_MEMORY_MIN_TURNS and used + cost > AI_MEMORY_TURN_TOKENS:
+            break
+        used += cost
+        keep += 1
+    return turns[:len(turns) - keep], turns[len(turns) - keep:]
+
+
+def load_memory(user_id: int, channel: str, client_history=None) -> tuple:
+    """Return (summary, turns) yang dipakai di prompt."""
+    conv = Conversation.query.filter_by(user_id=user_id, channel=channel).first()
+    if conv and (conv.turns or conv.summary):
+        summary, turns = conv.summary or '', _clean_turns(conv.turns)
+    else:
+        summary, turns = '', _clean_turns(client_history)
+    return summary, _split_budget(turns)[1]
+
+
+def render_history(summary: str, turns: list, assistant_label: str) -> str:
+    lines = [f'(Ringkasan percakapan sebelumnya: {summary})'] if summary else []
+    lines += [f"{'User' if t['role'] == 'user' else assistant_label}: {t['text']}" for t in turns]
+    return '\n'.join(lines)
+
+
+def remember(user_id: int, channel: str, user_text: str, assistant_text: str, seed=None):
+    """
+    Simpan 1 pasang pesan (user → asisten). Kalau riwayat melewati budget,
+    ringkasan dijadwalkan di background. Gagal simpan cukup di-log — balasan
+    ke user tidak boleh ikut gagal.
+    """
+    # Baris dikunci (SELECT ... FOR UPDATE, dibaca ulang walau sudah ada di
+    # session) selama read-modify-write: dua request paralel user yang sama
+    # tidak saling menimpa pesan. Baris baru yang keduluan request lain
+    # (IntegrityError) → ulangi sekali, kali ini lewat jalur kunci.
+    for attempt in range(2):
+        try:
+            conv = Conversation.query.filter_by(user_id=user_id, channel=channel).with_for_update().populate_existing().first()
+            if conv is None:
+                conv = Conversation(user_id=user_id, channel=channel, summary='', turns=[])
+                db.session.add(conv)
+            turns = _clean_turns(conv.turns)
+            if not turns and not conv.summary:
+                turns = _clean_turns(seed)
+            turns += _clean_turns([{'role': 'user', 'text': user_text}, {'role': 'assistant', 'text': assistant_text}])
+            conv.turns = turns[-AI_MEMORY_MAX_TURNS:]
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                return
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('[Memory] gagal simpan percakapan user=%s channel=%s: %s', user_id, channel, e)
+            return
+
+    if _split_budget(conv.turns)[0]:
+        _schedule_summary(current_app._get_current_object(), conv.id)
+
+
+def clear_memory(user_id: int, channels=CHANNELS) -> int:
+    n = Conversation.query.filter(
+        Conversation.user_id == user_id, Conversation.channel.in_(channels),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+
+def _schedule_summary(app, conv_id: int):
+    with _pending_lock:
+        if conv_id in _pending:
+            return
+        _pending.add(conv_id)
+    _summary_executor.submit(_summarize, app, conv_id)
+
+
+def _summary_prompt(channel: str, summary: str, turns: list) -> str:
+    assistant = 'Jarvis' if channel == 'jarvis' else 'NutriAI'
+    return (
+        f"Ringkas percakapan antara user dan asisten nutrisi {assistant} di bawah menjadi catatan singkat "
+        f"(maksimal {AI_MEMORY_SUMMARY_TOKENS * 3 // 4} kata) untuk konteks percakapan berikutnya. "
+        f"Simpan fakta penting tentang user (preferensi, keluhan, rencana, makanan yang disebut) dan topik "
+        f"yang sedang dibahas. Gabungkan dengan ringkasan lama kalau ada. Tulis sebagai kalimat pendek, "
+        f"tanpa markdown, tanpa pembuka.\n\n"
+        f"Ringkasan lama: {summary or '(belum ada)'}\n\n"
+        f"Percakapan:\n{render_history('', turns, assistant)}"
+    )
+
+
+def _trim_summary(text: str) -> str:
+    """Teks mentah Gemini: cukup rapikan spasi & potong ke budget (bukan clean_tts)."""
+    limit = AI_MEMORY_SUMMARY_TOKENS * 4
+    text  = ' '.join((text or '').split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = cut.rfind('. ')
+    return cut[:end + 1] if end > limit // 2 else cut.rsplit(' ', 1)[0]
+
+
+def _summarize(app, conv_id: int):
+    # Import di sini: app.ai_routes mengimpor modul ini.
+    from app.ai_routes import call_gemini
+
+    try:
+        with app.app_context():
+            try:
+                conv  = db.session.get(Conversation, conv_id)
+                older = _split_budget(_clean_turns(conv.turns))[0] if conv else []
+                if not older:
+                    return
+                result  = call_gemini(_summary_prompt(conv.channel, conv.summary, older),
+                                      endpoint='conversation-summary', user_id=conv.user_id)
+                summary = _trim_summary(result['text'])
+
+                # Baca ulang + kunci (bukan selama Gemini jalan): mungkin ada
+                # pesan baru / memori dihapus sementara itu.
+                db.session.refresh(conv, with_for_update=True)
+                turns = _clean_turns(conv.turns)
+                if turns[:len(older)] != older:
+                    return
+                conv.summary = summary
+                conv.turns   = turns[len(older):]
+                db.session.commit()
+                logger.info('[Memory] conv=%s: %d pesan lama diringkas (%d token)',
+                            conv_id, len(older), estimate_tokens(summary))
+            except Exception as e:
+                db.session.rollback()
+                logger.warning('[Memory] ringkasan conv=%s gagal, dicoba lagi di pesan berikutnya: %s', conv_id, e)
+            finally:
+                db.session.remove()
+    finally:
+        with _pending_lock:
+            _pending.discard(conv_id)
@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, WaktuMakan, WaterLog, MealTemplate, DayDataVersion, now_wib_date, now_utc
+from app.ai_metrics import metrics
+
+logger = logging.getLogger('nutriai.day_snapshot')
+
+
+# ─────────────────────────────────────────────────────────
+#  SNAPSHOT "HARI INI" PER USER (dipakai semua endpoint AI)
+# ─────────────────────────────────────────────────────────
+# meal-suggestion, chat, dan voice-command masing-masing query ulang
+# WaktuMakan hari ini; voice juga menghitung total air, calc_streak, dan
+# daftar template di SETIAP giliran. Percakapan Jarvis beberapa giliran
+# berturut-turut = query yang sama berulang-ulang.
+#
+# Di sini semua itu dibangun sekali jadi 1 snapshot per user, disimpan
+# DAY_SNAPSHOT_TTL detik, dan dibuang tepat saat datanya berubah:
+#   - endpoint tulis di routes.py (daily, water, templates, laporan/reset,
+#     record_streak) → invalidate_day_snapshot(user_id)
+#   - action Jarvis yang menulis (add_food, use_template, delete_food,
+#     add_water) → sama.
+# Snapshot berisi data biasa (namedtuple), bukan objek ORM, jadi aman
+# dipakai lintas request / session.
+#
+# Cache-nya per proses, tapi versinya dibagi lewat DB (seperti
+# CatalogVersion untuk katalog): invalidate menaikkan baris
+# day_data_version milik user, dan snapshot hanya dipakai kalau versinya
+# masih sama dengan di DB — 1 lookup primary key, jauh lebih murah dari
+# membangun snapshot. Tulisan yang masuk ke worker gunicorn lain pun
+# langsung terlihat. TTL tinggal jaring pengaman.
+
+DAY_SNAPSHOT_TTL = float(os.environ.get('DAY_SNAPSHOT_TTL', 30))
+
+DayEntry = namedtuple('DayEntry', 'id nama_makanan waktu_makan porsi kalori protein karbo lemak')
+
+
+class DaySnapshotCache:
+    def __init__(self, ttl: float = DAY_SNAPSHOT_TTL):
+        self.ttl         = ttl
+        self._snapshots  = {}   # user_id → (snapshot, version, expires_at)
+        self._lock       = threading.Lock()
+
+    def get(self, user_id: int) -> dict:
+        today = now_wib_date()
+        if self.ttl <= 0:
+            metrics.inc('day_snapshot_total', result='miss')
+            return build_day_snapshot(user_id, today)
+
+        # Versi dibaca SEBELUM membangun: tulisan selama build menaikkan
+        # versi di DB, jadi snapshot yang mungkin basi ini tidak akan
+        # dipakai lagi di request berikutnya.
+        version = _current_version(user_id)
+        with self._lock:
+            cached = self._snapshots.get(user_id)
+        if cached and cached[1] == version and cached[2] > time.monotonic() and cached[0]['today'] == today:
+            metrics.inc('day_snapshot_total', result='hit')
+            return cached[0]
+
+        metrics.inc('day_snapshot_total', result='miss')
+        snapshot = build_day_snapshot(user_id, today)
+        with self._lock:
+            self._snapshots[user_id] = (snapshot, version, time.monotonic() + self.ttl)
+            if len(self._snapshots) > 4096:
+                self._prune(time.monotonic())
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        """Buang snapshot user di worker ini saja (versi DB lihat bump_day_version)."""
+        with self._lock:
+            self._snapshots.pop(user_id, None)
+
+    def _prune(self, now: float):
+        for uid in [u for u, (_, _, exp) in self._snapshots.items() if exp <= now]:
+            del self._snapshots[uid]
+
+
+def _current_version(user_id: int) -> int:
+    return db.session.query(DayDataVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+
+def bump_day_version(user_id: int):
+    """Naikkan versi data hari ini milik user (commit sendiri, dipanggil sesudah commit tulisan)."""
+    for _ in range(2):
+        try:
+            updated = db.session.execute(
+                db.update(DayDataVersion)
+                .where(DayDataVersion.user_id == user_id)
+                .values(version=DayDataVersion.version + 1, updated_at=now_utc())
+            ).rowcount
+            if not updated:
+                db.session.add(DayDataVersion(user_id=user_id, version=1))
+            db.session.commit()
+            return
+        except IntegrityError:
+            db.session.rollback()   # worker lain barusan membuat barisnya → ulangi sebagai UPDATE
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('[DaySnapshot] gagal menaikkan versi user %s: %s', user_id, e)
+            return
+
+
+def build_day_snapshot(user_id: int, today) -> dict:
+    # Import di sini: app.routes mengimpor modul ini.
+    from app.routes import calc_streak
+
+    entries = tuple(
+        DayEntry(e.id, e.nama_makanan, e.waktu_makan, e.porsi, e.kalori, e.protein, e.karbo, e.lemak)
+        for e in WaktuMakan.query.filter(
+            WaktuMakan.user_id    == user_id,
+            WaktuMakan.tanggal    == today,
+            WaktuMakan.deleted_at.is_(None),
+        ).order_by(WaktuMakan.id)
+    )
+    total_air = db.session.query(db.func.sum(WaterLog.jumlah_ml)).filter(
+        WaterLog.user_id == user_id,
+        WaterLog.tanggal == today,
+    ).scalar() or 0
+    templates = tuple(
+        (t.id, t.nama)
+        for t in db.session.query(MealTemplate.id, MealTemplate.nama).filter_by(user_id=user_id).order_by(MealTemplate.id)
+    )
+
+    return {
+        'today':         today,
+        'entries':       entries,
+        'total_kalori':  sum(e.kalori  or 0 for e in entries),
+        'total_protein': sum(e.protein or 0 for e in entries),
+        'total_karbo':   sum(e.karbo   or 0 for e in entries),
+        'total_lemak':   sum(e.lemak   or 0 for e in entries),
+        'total_air':     total_air,
+        'streak':        calc_streak(user_id),
+        'templates':     templates,
+    }
+
+
+day_snapshots = DaySnapshotCache()
+
+
+def get_day_snapshot(user_id: int) -> dict:
+    """Snapshot hari ini (WIB) — JANGAN diubah, dipakai bersama request lain."""
+    return day_snapshots.get(user_id)
+
+
+def invalidate_day_snapshot(user_id: int):
+    """Panggil SESUDAH commit tulisan: snapshot user basi di semua worker."""
+    day_snapshots.invalidate(user_id)
+    bump_day_version(user_id)
@@ -0,0 +1,279 @@
+import os
+import time
+import heapq
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+from app.models import db, Food
+from app.ai_metrics import metrics
+from app.food_catalog import FOOD_CATALOG_CACHE, food_catalog
+from app.food_matcher import LIKE_ESCAPE, escape_like, normalize_name
+
+logger = logging.getLogger('nutriai.food')
+
+
+# ─────────────────────────────────────────────────────────
+#  AUTOCOMPLETE NAMA MAKANAN (PREFIX INDEX IN-MEMORY)
+# ─────────────────────────────────────────────────────────
+# Layar tambah makanan di mobile memanggil /api/foods?q= di setiap
+# ketikan: COUNT + LIKE + to_dict lengkap. /api/foods/autocomplete cuma
+# mengembalikan id, nama & kalori N teratas, dari index awalan in-memory:
+#
+#   - Tiap nama (ternormalisasi, app/food_matcher.py) dipecah jadi
+#     "akhiran per kata": "nasi goreng ayam" → "nasi goreng ayam",
+#     "goreng ayam", "ayam". Semua disimpan di 1 list terurut, jadi
+#     makanan yang nama/katanya berawalan q = 1 rentang (2x bisect).
+#   - Urutan: nama sama persis → nama berawalan q → kata berawalan q, lalu
+#     nama terpendek, id terbaru (sama dengan /api/foods).
+#   - Rentang kecil (≤ _SCAN_LIMIT entri) discan langsung. Awalan yang
+#     rentangnya besar ("n", "na", "nasi") top-N-nya dihitung sekali saat
+#     index dibangun (digabung dari top-N awalan anaknya), jadi query
+#     apa pun = O(log n + N) atau scan ≤ _SCAN_LIMIT entri.
+#   - Global: mengikuti versi snapshot katalog (app/food_catalog.py). Saat
+#     versi berubah index TIDAK dibangun ulang dari nol: makanan yang
+#     berubah dihapus/disisipkan ke list terurut dan cuma top-N awalan
+#     yang terdampak yang dihitung ulang (copy-on-write — request lain
+#     tetap membaca index lama sampai yang baru siap). Perubahan besar
+#     (> _PATCH_MAX_RATIO katalog) → bangun ulang penuh.
+#   - Pribadi: index kecil per user (LRU AUTOCOMPLETE_USER_CACHE user).
+#     Tambah/ubah/hapus makanan pribadi di worker ini langsung membuang
+#     index user itu (invalidate_user); perubahan dari worker lain
+#     ketahuan lewat 1 query agregat (jumlah + updated_at terakhir, pakai
+#     ix_food_user_id) paling sering sekali per
+#     AUTOCOMPLETE_PRIVATE_CHECK_SECONDS — bukan di setiap ketikan.
+# FOOD_CATALOG_CACHE=0 → fallback 1 query SQL LIKE 'q%' / '% q%'.
+
+AUTOCOMPLETE_MAX                   = 20
+AUTOCOMPLETE_USER_CACHE            = int(os.environ.get('AUTOCOMPLETE_USER_CACHE', 2000))
+AUTOCOMPLETE_PRIVATE_CHECK_SECONDS = float(os.environ.get('AUTOCOMPLETE_PRIVATE_CHECK_SECONDS', 2))
+
+_SCAN_LIMIT      = 64   # rentang ≤ ini discan langsung, di atas ini top-N dihitung di depan
+_PATCH_MAX_RATIO = 0.05
+_HIGH            = '\uffff'
+
+
+def _suffixes(name: str) -> set:
+    """Akhiran nama per kata: "nasi goreng ayam" → {"nasi goreng ayam", "goreng ayam", "ayam"}."""
+    keys, pos = set(), 0
+    for word in name.split(' '):
+        if word:
+            keys.add(name[pos:])
+        pos += len(word) + 1
+    return keys
+
+
+class PrefixIndex:
+    """Index awalan nama → top-N makanan. Read-only setelah dibangun (patch = objek baru)."""
+
+    def __init__(self, foods=(), norm: dict = None):
+        norm         = norm or {}   # id → nama ternormalisasi yang sudah ada (snapshot katalog)
+        self.version = None
+        self.names   = {}   # id → nama ternormalisasi
+        self.items   = {}   # id → (nama asli, kalori)
+        self.entries = []   # [(akhiran nama per kata, id)] terurut
+        self.top     = {}   # awalan "berat" → [id] top AUTOCOMPLETE_MAX
+        for f in foods:
+            self.items[f.id] = (f.nama_makanan, f.kalori)
+            self.names[f.id] = norm.get(f.id) or normalize_name(f.nama_makanan)
+            self.entries.extend((k, f.id) for k in _suffixes(self.names[f.id]))
+        self.entries.sort()
+        self._compute('', 0, len(self.entries))
+
+    def key(self, fid, q: str) -> tuple:
+        """Kunci urutan makanan `fid` untuk query q (kecil = lebih relevan)."""
+        name = self.names[fid]
+        rank = 0 if name == q else 1 if name.startswith(q) else 2
+        return rank, len(name), -fid
+
+    def _range(self, q: str, lo: int = 0, hi: int = None) -> tuple:
+        hi = len(self.entries) if hi is None else hi
+        return (bisect.bisect_left(self.entries, (q,), lo, hi),
+                bisect.bisect_left(self.entries, (q + _HIGH,), lo, hi))
+
+    def _compute(self, p: str, lo: int, hi: int):
+        """Hitung top-N awalan p (rentang entries[lo:hi]) kalau rentangnya besar."""
+        if hi - lo <= _SCAN_LIMIT:
+            self.top.pop(p, None)
+            return
+        fids, i, depth = [], lo, len(p)
+        while i < hi and len(self.entries[i][0]) == depth:   # akhiran = p persis
+            fids.append(self.entries[i][1])
+            i += 1
+        while i < hi:
+            child = p + self.entries[i][0][depth]
+            j     = bisect.bisect_left(self.entries, (child + _HIGH,), i, hi)
+            if j - i > _SCAN_LIMIT:
+                if child not in self.top:
+                    self._compute(child, i, j)
+                fids.extend(self.top[child])
+            else:
+                fids.extend(fid for _, fid in self.entries[i:j])
+            i = j
+        # Top-N awalan = gabungan top-N tiap anak: urutan di dalam 1 anak
+        # sama dengan urutan di awalannya (nama persis anak = nama terpendek).
+        self.top[p] = heapq.nsmallest(AUTOCOMPLETE_MAX, set(fids), key=lambda fid: self.key(fid, p))
+
+    def search(self, q: str, limit: int) -> list:
+        """[(kunci urutan, id)] maks `limit`, q sudah normalize_name."""
+        if not q:
+            return []
+        if q in self.top:
+            fids = self.top[q][:limit]
+        else:
+            lo, hi = self._range(q)
+            fids   = heapq.nsmallest(limit, {fid for _, fid in self.entries[lo:hi]}, key=lambda fid: self.key(fid, q))
+        return [(self.key(fid, q), fid) for fid in fids]
+
+    def patched(self, foods: dict, norm: dict = None):
+        """
+        Index baru untuk isi `foods` ({id: food}) dengan mengubah index ini
+        seperlunya: entri makanan yang hilang/berganti nama dibuang, yang
+        baru disisipkan, top-N awalan yang terdampak dihitung ulang. None
+        kalau yang berubah terlalu banyak.
+        """
+        changed = {fid for fid in self.names if fid not in foods}
+        changed.update(fid for fid, f in foods.items()
+                       if fid not in self.items or self.items[fid][0] != f.nama_makanan)
+        if len(changed) > max(_PATCH_MAX_RATIO * len(foods), 100):
+            return None   # perubahan besar → bangun ulang penuh lebih murah
+
+        new         = PrefixIndex.__new__(PrefixIndex)
+        new.version = self.version
+        new.names   = dict(self.names)
+        new.items   = {fid: (f.nama_makanan, f.kalori) for fid, f in foods.items()}
+        new.entries = list(self.entries)
+        new.top     = dict(self.top)
+        touched     = set()
+        for fid in changed:
+            if fid in self.names:
+                for k in _suffixes(new.names.pop(fid)):
+                    i = bisect.bisect_left(new.entries, (k, fid))
+                    if i < len(new.entries) and new.entries[i] == (k, fid):
+                        del new.entries[i]
+                    touched.add(k)
+            if fid in foods:
+                new.names[fid] = (norm or {}).get(fid) or normalize_name(foods[fid].nama_makanan)
+                for k in _suffixes(new.names[fid]):
+                    bisect.insort(new.entries, (k, fid))
+                    touched.add(k)
+        # Semua awalan dari akhiran yang berubah, yang terdalam dulu (anaknya
+        # harus sudah benar sebelum induknya digabung).
+        prefixes = {k[:n] for k in touched for n in range(len(k) + 1)}
+        for p in sorted(prefixes, key=len, reverse=True):
+            new.top.pop(p, None)
+            new._compute(p, *new._range(p))
+        return new
+
+
+class FoodAutocomplete:
+    def __init__(self, user_cache: int = AUTOCOMPLETE_USER_CACHE):
+        self._global     = None
+        self._lock       = threading.Lock()
+        self._private    = OrderedDict()   # user_id → (stamp, PrefixIndex)
+        self._user_lock  = threading.Lock()
+        self._user_cache = user_cache
+
+    def global_index(self) -> PrefixIndex:
+        """Index makanan global untuk versi snapshot katalog terbaru (butuh app context)."""
+        snap  = food_catalog.get()
+        index = self._global
+        if index is not None and index.version == snap.version:
+            return index
+        # Thread lain sedang memperbarui → pakai index lama dulu.
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            index = self._global
+            if index is not None and index.version == snap.version:
+                return index
+            started = time.perf_counter()
+            new     = index.patched(snap.by_id, snap.norm) if index is not None else None
+            mode    = 'patch' if new is not None else 'full'
+            if new is None:
+                new = PrefixIndex(snap.foods, snap.norm)
+            new.version  = snap.version
+            self._global = new
+            metrics.inc('food_autocomplete_rebuild_total', mode=mode)
+            logger.info('[FoodAutocomplete] versi %s (%s): %d makanan, %d awalan top-N (%.0f ms)',
+                        snap.version, mode, len(new.items), len(new.top), (time.perf_counter() - started) * 1000)
+            return new
+        finally:
+            self._lock.release()
+
+    def private_index(self, user_id: int) -> PrefixIndex:
+        """
+        Index makanan pribadi user. Paling sering sekali per
+        AUTOCOMPLETE_PRIVATE_CHECK_SECONDS dicek (jumlah + updated_at
+        terakhir) dan dibangun ulang kalau berubah; perubahan di worker ini
+        langsung lewat invalidate_user().
+        """
+        now = time.monotonic()
+        with self._user_lock:
+            cached = self._private.get(user_id)
+            if cached is not None:
+                self._private.move_to_end(user_id)
+                if now - cached[2] < AUTOCOMPLETE_PRIVATE_CHECK_SECONDS:
+                    return cached[1]
+        stamp = tuple(db.session.query(db.func.count(Food.id), db.func.max(Food.updated_at))
+                      .filter(Food.user_id == user_id).one())
+        if cached is not None and cached[0] == stamp:
+            index = cached[1]
+        else:
+            index = PrefixIndex(db.session.query(Food.id, Food.nama_makanan, Food.kalori).filter(
+                Food.user_id == user_id, Food.deleted_at.is_(None),
+            ).all())
+        with self._user_lock:
+            self._private[user_id] = (stamp, index, now)
+            while len(self._private) > self._user_cache:
+                self._private.popitem(last=False)
+        return index
+
+    def invalidate_user(self, user_id: int):
+        """Makanan pribadi user berubah di worker ini → cek ulang di akses berikutnya."""
+        with self._user_lock:
+            self._private.pop(user_id, None)
+
+    def snapshot(self) -> dict:
+        index = self._global
+        return {
+            'version':      index.version if index else None,
+            'size':         len(index.items) if index else 0,
+            'top_prefixes': len(index.top) if index else 0,
+            'users_cached': len(self._private),
+        }
+
+
+food_autocomplete = FoodAutocomplete()
+
+
+def _sql_autocomplete(user_id: int, q: str, limit: int) -> list:
+    name = db.func.lower(Food.nama_makanan)
+    esc  = escape_like(q)
+    rank = db.case((name == q, 0), (name.like(f'{esc}%', escape=LIKE_ESCAPE), 1), else_=2)
+    rows = db.session.query(Food.id, Food.nama_makanan, Food.kalori).filter(
+        Food.deleted_at.is_(None),
+        db.or_(Food.user_id.is_(None), Food.user_id == user_id),
+        db.or_(name.like(f'{esc}%', escape=LIKE_ESCAPE), name.like(f'% {esc}%', escape=LIKE_ESCAPE)),
+    ).order_by(rank, db.func.length(Food.nama_makanan), Food.id.desc()).limit(limit).all()
+    return [{'id': r.id, 'nama_makanan': r.nama_makanan, 'kalori': r.kalori} for r in rows]
+
+
+def autocomplete(user_id: int, q: str, limit: int = 10) -> list:
+    """Top `limit` makanan (global + milik user) yang nama/katanya berawalan q: [{id, nama_makanan, kalori}]."""
+    q     = normalize_name(q)
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX))
+    if not q:
+        return []
+    if not FOOD_CATALOG_CACHE:
+        return _sql_autocomplete(user_id, q, limit)
+
+    glob    = food_autocomplete.global_index()
+    private = food_autocomplete.private_index(user_id)
+    hits    = heapq.nsmallest(limit, [(k, fid, glob) for k, fid in glob.search(q, limit)]
+                              + [(k, fid, private) for k, fid in private.search(q, limit)], key=lambda h: h[0])
+    return [
+        {'id': fid, 'nama_makanan': index.items[fid][0], 'kalori': index.items[fid][1]}
+        for _, fid, index in hits
+    ]
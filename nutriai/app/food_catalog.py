@@ -0,0 +1,254 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Food, CatalogVersion, now_utc
+from app.ai_metrics import metrics
+from app.food_matcher import FoodMatcher, LIKE_ESCAPE, escape_like, normalize_name, surface_terms
+
+logger = logging.getLogger('nutriai.food')
+
+
+# ─────────────────────────────────────────────────────────
+#  SNAPSHOT KATALOG MAKANAN GLOBAL (IN-MEMORY, BERVERSI)
+# ─────────────────────────────────────────────────────────
+# Makanan global (user_id NULL) cuma berubah lewat CRUD admin
+# (admin_routes.py), tapi dibaca terus-menerus: pencarian /api/foods,
+# kandidat & resolusi makanan Jarvis, cek duplikat, pembuatan template.
+# Di sini seluruh katalog global dimuat sekali per worker jadi snapshot
+# read-only (namedtuple, aman dipakai lintas request/thread):
+#   - CRUD admin memanggil bump_catalog_version() di transaksi yang sama
+#     dengan perubahannya → catalog_version.version naik. Sesudah commit
+#     berhasil, food_catalog.invalidate() → worker itu langsung memuat
+#     ulang (bukan sebelum commit: bisa memuat data lama lalu dianggap
+#     sudah versi terbaru, atau ikut basi kalau commit-nya gagal).
+#   - Tiap worker mengecek versi itu paling sering sekali per
+#     FOOD_CATALOG_CHECK_SECONDS (1 query PK kecil); kalau beda, snapshot
+#     dimuat ulang (1 query). Jadi perubahan admin terlihat di semua
+#     worker paling lambat ~FOOD_CATALOG_CHECK_SECONDS kemudian.
+#   - Makanan pribadi user TIDAK masuk snapshot — tetap dibaca dari DB
+#     (sedikit per user, pakai index ix_food_user_id).
+#   - Tiap snapshot sekalian membawa index pencocokan nama (FoodMatcher,
+#     app/food_matcher.py) — dibangun sekali per versi, bukan per request.
+# FOOD_CATALOG_CACHE=0 → semua pembacaan kembali langsung ke DB.
+#
+# Memori: ~600 byte per makanan termasuk index nama (100k makanan ≈ 60 MB
+# per worker).
+
+FOOD_CATALOG_CACHE         = os.environ.get('FOOD_CATALOG_CACHE', '1') == '1'
+FOOD_CATALOG_CHECK_SECONDS = float(os.environ.get('FOOD_CATALOG_CHECK_SECONDS', 5))
+CATALOG_NAME               = 'food'
+
+_FIELDS = ('id', 'user_id', 'nama_makanan', 'protein', 'kalori', 'karbo', 'lemak',
+           'serat', 'gram_per_porsi', 'image', 'is_verified', 'sync_id')
+
+
+class CatalogFood(namedtuple('CatalogFood', _FIELDS)):
+    """Salinan read-only 1 baris Food global — nama atribut sama dengan Food."""
+    __slots__ = ()
+    to_dict   = Food.to_dict
+
+
+class CatalogSnapshot:
+    def __init__(self, version: int, foods: tuple):
+        self.version   = version
+        self.foods     = foods                     # urut id naik
+        self.ids       = [f.id for f in foods]
+        self.by_id     = {f.id: f for f in foods}
+        self.names     = [normalize_name(f.nama_makanan) for f in foods]   # sejajar foods
+        self.norm      = dict(zip(self.ids, self.names))                    # id → nama ternormalisasi
+        self.matcher   = FoodMatcher(foods, self.names)
+        self.loaded_at = time.time()
+        # Semua nama ternormalisasi disambung jadi 1 string: cari substring
+        # pakai str.find (jalan di C), bukan loop Python per baris.
+        self._starts, pos = [], 0
+        for name in self.names:
+            self._starts.append(pos)
+            pos += len(name) + 1
+        self._blob = '\n'.join(self.names)
+
+    def containing(self, term: str) -> list:
+        """Makanan yang namanya mengandung `term` (hasil normalize_name), urut id naik."""
+        if not term or '\n' in term:
+            return []
+        out, i = [], self._blob.find(term)
+        while i >= 0:
+            idx = bisect.bisect_right(self._starts, i) - 1
+            out.append(self.foods[idx])
+            nxt = idx + 1
+            if nxt >= len(self._starts):
+                break
+            i = self._blob.find(term, self._starts[nxt])
+        return out
+
+
+def _current_version() -> int:
+    return db.session.query(CatalogVersion.version).filter_by(name=CATALOG_NAME).scalar() or 0
+
+
+def _load_snapshot(version: int) -> CatalogSnapshot:
+    columns = [getattr(Food, name) for name in _FIELDS]
+    rows    = db.session.query(*columns).filter(
+        Food.user_id.is_(None),
+        Food.deleted_at.is_(None),
+    ).order_by(Food.id).all()
+    return CatalogSnapshot(version, tuple(CatalogFood(*row) for row in rows))
+
+
+class FoodCatalog:
+    def __init__(self, check_seconds: float = FOOD_CATALOG_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._snapshot     = None
+        self._checked_at   = 0.0
+        self._stale        = False
+        self._lock         = threading.Lock()
+
+    def get(self) -> CatalogSnapshot:
+        """Snapshot katalog global terbaru (butuh app context)."""
+        snap = self._snapshot
+        if snap is not None and not self._stale and time.monotonic() - self._checked_at < self.check_seconds:
+            return snap
+        # Thread lain sedang mengecek/memuat ulang → pakai snapshot lama dulu.
+        if not self._lock.acquire(blocking=snap is None):
+            return snap
+        try:
+            snap = self._snapshot
+            if snap is not None and not self._stale and time.monotonic() - self._checked_at < self.check_seconds:
+                return snap
+            version = _current_version()
+            if snap is None or self._stale or version != snap.version:
+                started = time.perf_counter()
+                self._stale    = False
+                snap           = _load_snapshot(version)
+                self._snapshot = snap
+                metrics.inc('food_catalog_reload_total')
+                metrics.set_gauge('food_catalog_size', len(snap.foods))
+                logger.info('[FoodCatalog] versi %s dimuat: %d makanan (%.0f ms)',
+                            version, len(snap.foods), (time.perf_counter() - started) * 1000)
+            self._checked_at = time.monotonic()
+            return snap
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Paksa cek + muat ulang di akses berikutnya (worker ini)."""
+        self._stale = True
+
+    def snapshot(self) -> dict:
+        snap = self._snapshot
+        return {
+            'enabled': FOOD_CATALOG_CACHE,
+            'version': snap.version if snap else None,
+            'size':    len(snap.foods) if snap else 0,
+            'age_s':   round(time.time() - snap.loaded_at) if snap else None,
+        }
+
+
+food_catalog = FoodCatalog()
+
+
+def init_food_catalog(app):
+    """Pastikan baris versi katalog ada (supaya bump cukup UPDATE)."""
+    with app.app_context():
+        if db.session.get(CatalogVersion, CATALOG_NAME) is None:
+            db.session.add(CatalogVersion(name=CATALOG_NAME, version=0))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()   # worker lain duluan
+        db.session.remove()
+
+
+def bump_catalog_version():
+    """
+    Naikkan versi katalog global. Panggil di transaksi yang sama dengan
+    perubahan makanan master, sebelum commit (commit oleh pemanggil) —
+    lalu food_catalog.invalidate() sesudah commit berhasil.
+    """
+    updated = db.session.execute(
+        db.update(CatalogVersion)
+        .where(CatalogVersion.name == CATALOG_NAME)
+        .values(version=CatalogVersion.version + 1, updated_at=now_utc())
+    ).rowcount
+    if not updated:
+        db.session.add(CatalogVersion(name=CATALOG_NAME, version=1))
+
+
+# ─────────────────────────────────────────────────────────
+#  PEMBACAAN MAKANAN YANG BOLEH DILIHAT USER
+#  Global dari snapshot, pribadi dari DB.
+# ─────────────────────────────────────────────────────────
+
+def _private_foods(user_id: int):
+    return Food.query.filter(Food.user_id == user_id, Food.deleted_at.is_(None))
+
+
+def _visible_foods(user_id: int):
+    return Food.query.filter(
+        Food.deleted_at.is_(None),
+        db.or_(Food.user_id.is_(None), Food.user_id == user_id),
+    )
+
+
+def visible_food(user_id: int, food_id):
+    """Food/CatalogFood dengan id ini kalau boleh dilihat user, else None."""
+    try:
+        food_id = int(food_id)
+    except (TypeError, ValueError):
+        return None
+    if not FOOD_CATALOG_CACHE:
+        return _visible_foods(user_id).filter(Food.id == food_id).first()
+    return food_catalog.get().by_id.get(food_id) or _private_foods(user_id).filter(Food.id == food_id).first()
+
+
+def visible_foods_by_ids(user_id: int, ids) -> dict:
+    """{id: Food/CatalogFood} untuk id yang boleh dilihat user."""
+    ids = set(ids)
+    if not ids:
+        return {}
+    if not FOOD_CATALOG_CACHE:
+        return {f.id: f for f in _visible_foods(user_id).filter(Food.id.in_(ids))}
+    by_id = food_catalog.get().by_id
+    found = {i: by_id[i] for i in ids if i in by_id}
+    rest  = ids - set(found)
+    if rest:
+        found.update({f.id: f for f in _private_foods(user_id).filter(Food.id.in_(rest))})
+    return found
+
+
+def _same_name(query, nama: str):
+    """
+    Makanan pertama (id terkecil) dari `query` yang kunci kanoniknya sama
+    dengan `nama` ("Nasi Putih" = "nasi", "Es Teh Manis" = "es teh"). DB
+    cuma menyaring kandidat lewat ILIKE per kata; keputusan di FoodMatcher.
+    """
+    terms = surface_terms(nama)
+    if not terms:
+        return None
+    rows  = query.filter(
+        db.or_(*[Food.nama_makanan.ilike(f'%{escape_like(t)}%', escape=LIKE_ESCAPE) for t in terms]),
+    ).order_by(Food.id).all()
+    return FoodMatcher(rows).find_key(nama)
+
+
+def find_global_by_name(nama: str):
+    """Cek duplikat makanan master (global) berdasarkan kunci kanonik nama."""
+    if not normalize_name(nama):
+        return None
+    if not FOOD_CATALOG_CACHE:
+        return _same_name(Food.query.filter(Food.user_id.is_(None), Food.deleted_at.is_(None)), nama)
+    return food_catalog.get().matcher.find_key(nama)
+
+
+def find_visible_by_name(user_id: int, nama: str):
+    """Cek duplikat: makanan (global / milik sendiri) yang namanya sama setelah dinormalisasi."""
+    if not normalize_name(nama):
+        return None
+    if not FOOD_CATALOG_CACHE:
+        return _same_name(_visible_foods(user_id), nama)
+    return food_catalog.get().matcher.find_key(nama) or _same_name(_private_foods(user_id), nama)
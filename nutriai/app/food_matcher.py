@@ -0,0 +1,235 @@
+import re
+import heapq
+import bisect
+import unicodedata
+from collections import Counter
+
+
+# ─────────────────────────────────────────────────────────
+#  PENCOCOKAN NAMA MAKANAN (BAHASA INDONESIA)
+# ─────────────────────────────────────────────────────────
+# Dulu tiap tempat punya cara sendiri: add_food voice pakai ILIKE
+# '%nama%' lalu ambil yang terpendek, delete_food ILIKE ke kolom yang
+# salah, cek duplikat pakai ILIKE nama persis. "Nasi putih", "telor
+# ceplok", "es teh manis", "rica2" atau "Crème" tidak pernah ketemu
+# padanannya di katalog. Semua pencocokan sekarang lewat modul ini:
+#
+#   normalize_name  huruf kecil, aksen dibuang (é → e), tanda baca jadi
+#                   spasi, spasi dirapikan, "rica2"/"rica-rica" → "rica rica"
+#   canonical_tokens  + ejaan varian per kata (telor → telur, mi → mie),
+#                   kata pengisi dibuang (porsi, sepiring, pakai, ...), dan
+#                   sinonim frasa (nasi putih → nasi, es teh manis → es teh)
+#   canonical_key   kunci cek duplikat: "Nasi Putih" dan "nasi" = sama
+#   FoodMatcher     index in-memory (kunci kanonik, kata → makanan, kosakata
+#                   terurut untuk awalan/typo) + skor 0..1 per kandidat
+#
+# FoodMatcher untuk katalog global dibangun sekali per snapshot katalog
+# (app/food_catalog.py); untuk makanan pribadi / log harian dibangun
+# on-the-fly (isinya sedikit).
+
+# Ejaan varian per kata → bentuk baku.
+_VARIANTS = {
+    'telor': 'telur', 'mi': 'mie', 'mee': 'mie', 'bakmi': 'bakmie', 'satai': 'sate',
+    'krupuk': 'kerupuk', 'kripik': 'keripik', 'tempeh': 'tempe', 'tauge': 'toge', 'taoge': 'toge',
+    'sayuran': 'sayur', 'avokad': 'alpukat', 'avocado': 'alpukat', 'nugget': 'nuget',
+    'capcay': 'capcai', 'kwetiaw': 'kwetiau', 'kwetiauw': 'kwetiau', 'bihon': 'bihun',
+    'sop': 'sup', 'soup': 'sup', 'juice': 'jus', 'pecal': 'pecel', 'ayamnya': 'ayam', 'nasinya': 'nasi',
+}
+
+# Kata yang tidak membedakan makanan (satuan, takaran, kata sambung).
+_FILLERS = {
+    'porsi', 'seporsi', 'piring', 'sepiring', 'mangkok', 'mangkuk', 'semangkok', 'semangkuk', 'gelas',
+    'segelas', 'sebuah', 'sebutir', 'butir', 'sebiji', 'sepotong', 'bungkus', 'sebungkus',
+    'pakai', 'pake', 'dan', 'yang', 'dengan', 'plus', 'pcs', 'gram', 'gr',
+}
+
+# Sinonim frasa (sesudah varian & pengisi) → nama baku di katalog.
+_SYNONYMS = {
+    'nasi putih':        'nasi',
+    'nasi putih hangat': 'nasi',
+    'es teh manis':      'es teh',
+    'teh manis dingin':  'es teh',
+    'teh es':            'es teh',
+    'air putih':         'air mineral',
+    'aqua':              'air mineral',
+    'kopi hitam':        'kopi',
+    'telur ceplok':      'telur mata sapi',
+    'telur goreng':      'telur mata sapi',
+    'indomie':           'mie instan',
+    'indomie goreng':    'mie goreng instan',
+    'ayam krispi':       'ayam crispy',
+    'susu sapi':         'susu',
+}
+
+_SYNONYM_WORDS  = max(len(k.split()) for k in _SYNONYMS)
+MIN_MATCH_SCORE = 0.5
+LIKE_ESCAPE     = '\\'   # karakter escape untuk escape_like()
+
+
+def normalize_name(text: str) -> str:
+    """Huruf kecil, tanpa aksen & tanda baca, spasi rapi. Dipakai juga untuk pencarian substring."""
+    s = unicodedata.normalize('NFKD', text or '')
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r'\b([a-z]{3,})2\b', r'\1 \1', s)        # "rica2" → "rica rica"
+    s = re.sub(r'[^\w%]+|_', ' ', s)                    # "rica-rica", "nasi,telur" → spasi
+    return ' '.join(s.split())
+
+
+def escape_like(term: str) -> str:
+    """
+    Escape \\, % dan _ untuk pola LIKE/ILIKE — selalu pasangkan dengan
+    escape=LIKE_ESCAPE. Wajib untuk hasil normalize_name (tanda % sengaja
+    dipertahankan, "susu 2%") maupun query mentah dari user.
+    """
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def canonical_tokens(text: str, normalized: bool = False) -> tuple:
+    """Token kanonik nama (normalized=True → `text` sudah hasil normalize_name)."""
+    tokens = [_VARIANTS.get(t, t) for t in (text if normalized else normalize_name(text)).split()]
+    tokens = [t for t in tokens if t not in _FILLERS and not t.isdigit()] or tokens
+    phrase = ' '.join(tokens)
+    # Sinonim: frasa terpanjang yang cocok di awal nama.
+    for n in range(min(len(tokens), _SYNONYM_WORDS), 0, -1):
+        head = ' '.join(tokens[:n])
+        if head in _SYNONYMS:
+            phrase = ' '.join([_SYNONYMS[head]] + tokens[n:])
+            break
+    return tuple(phrase.split())
+
+
+def canonical_key(text: str) -> str:
+    """Kunci cek duplikat nama makanan."""
+    return ' '.join(canonical_tokens(text))
+
+
+def surface_terms(text: str) -> set:
+    """
+    Kata yang mungkin tertulis di nama makanan yang cocok dengan `text`:
+    kata aslinya, bentuk bakunya, ejaan variannya, dan kata asal sinonim.
+    Dipakai untuk menyaring kandidat pakai ILIKE di DB sebelum diskor.
+    """
+    raw   = set(normalize_name(text).split())
+    canon = set(canonical_tokens(text))
+    terms = raw | canon | {k for k, v in _VARIANTS.items() if v in canon}
+    key   = ' '.join(canonical_tokens(text))
+    for src, dst in _SYNONYMS.items():
+        if key == dst or key.startswith(dst + ' '):
+            terms.update(src.split())
+    return {t for t in terms if len(t) >= 2} - _FILLERS
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Jarak edit (sisip/hapus/ganti/tukar) ≤ 1 — typo ringan."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:])
+    return a[i:] == b[i + 1:]
+
+
+def score_tokens(query: tuple, name: tuple) -> float:
+    """Skor 0..1 seberapa cocok nama (token kanonik) dengan query (token kanonik)."""
+    if not query or not name:
+        return 0.0
+    if query == name:
+        return 1.0
+    if name[:len(query)] == query:
+        return max(0.9 - 0.03 * (len(name) - len(query)), 0.75)
+
+    names   = set(name)
+    matched = 0.0
+    for t in query:
+        if t in names:
+            matched += 1
+        elif len(t) >= 3 and any(n.startswith(t) for n in names):
+            matched += 0.7   # kata belum selesai diketik / bentuk pendek
+        elif len(t) >= 4 and any(_within_one_edit(t, n) for n in names):
+            matched += 0.8   # typo ringan
+    if not matched:
+        return 0.0
+    coverage  = matched / len(query)
+    precision = min(matched, len(name)) / len(name)
+    bonus     = 0.05 if name[0] == query[0] else 0.0
+    return round(min(0.6 * coverage + 0.3 * precision + bonus, 0.89), 4)
+
+
+class FoodMatcher:
+    """
+    Index pencocokan untuk sekumpulan makanan (objek ber-atribut id &
+    nama_makanan — Food, CatalogFood, atau WaktuMakan).
+    """
+
+    def __init__(self, foods, names: list = None):
+        self.foods = list(foods)
+        if names is None:   # names = hasil normalize_name per makanan, kalau sudah ada
+            self.tokens = [canonical_tokens(f.nama_makanan) for f in self.foods]
+        else:
+            self.tokens = [canonical_tokens(n, normalized=True) for n in names]
+        self.by_key = {}
+        postings    = {}
+        for i, toks in enumerate(self.tokens):
+            self.by_key.setdefault(' '.join(toks), i)
+            for t in set(toks):
+                postings.setdefault(t, []).append(i)
+        self.postings = postings
+        self.vocab    = sorted(postings)
+
+    def find_key(self, text: str):
+        """Makanan dengan kunci kanonik sama (cek duplikat), atau None."""
+        i = self.by_key.get(canonical_key(text))
+        return self.foods[i] if i is not None else None
+
+    def _expand(self, token: str) -> list:
+        """Kata di index yang bisa dimaksud `token`: persis, awalan, atau typo ringan."""
+        words = [token] if token in self.postings else []
+        if len(token) >= 3:
+            lo = bisect.bisect_left(self.vocab, token)
+            hi = bisect.bisect_left(self.vocab, token + '￿')
+            words += [w for w in self.vocab[lo:min(hi, lo + 50)] if w != token]
+        if len(token) >= 4 and not words:
+            words = [w for w in self.vocab if w[0] == token[0] and _within_one_edit(token, w)]
+        return words
+
+    def match(self, text: str, limit: int = 10, min_score: float = MIN_MATCH_SCORE) -> list:
+        """[(skor, makanan)] terbaik dulu; seri → nama lebih pendek, id lebih kecil."""
+        query = canonical_tokens(text)
+        if not query:
+            return []
+        hits = Counter()
+        for t in query:
+            for i in {i for w in self._expand(t) for i in self.postings[w]}:
+                hits[i] += 1
+        # Kandidat diskor dari yang kena kata query paling banyak. Nama yang
+        # cuma kena n dari k kata skornya ≤ 0.6·n/k + 0.35 — kalau itu sudah
+        # di bawah hasil ke-`limit`, sisa kandidat tidak perlu diskor.
+        groups = {}
+        for i, n in hits.items():
+            groups.setdefault(n, []).append(i)
+        scored = []
+        for n in sorted(groups, reverse=True):
+            if limit and len(scored) >= limit and n < len(query):
+                floor = heapq.nlargest(limit, (sf[0] for sf in scored))[-1]
+                if min(0.6 * n / len(query) + 0.35, 0.89) < max(floor, min_score):
+                    break
+            for i in groups[n]:
+                s = score_tokens(query, self.tokens[i])
+                if s >= min_score:
+                    scored.append((s, self.foods[i]))
+        key = lambda sf: (-sf[0], len(sf[1].nama_makanan or ''), sf[1].id)
+        return heapq.nsmallest(limit, scored, key=key) if limit else sorted(scored, key=key)
+
+    def best(self, text: str, min_score: float = MIN_MATCH_SCORE):
+        """(skor, makanan) terbaik atau None. Kunci kanonik sama persis = 1.0 tanpa perlu diskor."""
+        exact = self.find_key(text)
+        if exact is not None:
+            return 1.0, exact
+        found = self.match(text, limit=1, min_score=min_score)
+        return found[0] if found else None
@@ -0,0 +1,212 @@
+import os
+import re
+from collections import Counter
+from datetime import timedelta
+
+from app.models import db, Food, WaktuMakan, MealTemplate, MealTemplateItem, now_wib_date
+from app.food_catalog import FOOD_CATALOG_CACHE, food_catalog, visible_foods_by_ids
+from app.food_matcher import FoodMatcher, LIKE_ESCAPE, escape_like, normalize_name, surface_terms
+
+
+# ─────────────────────────────────────────────────────────
+#  RETRIEVAL KANDIDAT MAKANAN UNTUK PROMPT JARVIS
+# ─────────────────────────────────────────────────────────
+# Sebelumnya voice-command menempelkan SELURUH tabel food (termasuk
+# makanan pribadi user lain!) ke system prompt di setiap request, jadi
+# ukuran prompt & latency naik linear dengan jumlah baris katalog. Di sini
+# cuma diambil beberapa puluh kandidat yang paling mungkin dimaksud user:
+#   1. makanan yang namanya cocok dengan kata-kata di ucapan/riwayat chat,
+#   2. makanan yang sering dicatat user ini belakangan,
+#   3. makanan yang ada di meal template user.
+# Semuanya dibatasi ke scope yang memang boleh dilihat user (global +
+# milik sendiri). Makanan global dibaca dari snapshot katalog in-memory
+# (app/food_catalog.py), yang pribadi dari DB. Makanan yang tidak masuk kandidat tetap bisa dicatat —
+# server mencocokkan nama dari AI ke database lengkap (lihat add_food di
+# ai_voice_command).
+
+VOICE_FOOD_TOP_K       = int(os.environ.get('VOICE_FOOD_TOP_K', 40))
+RECENT_FOOD_DAYS       = 14
+MAX_TERM_MATCH_ROWS    = 300   # batas baris hasil ILIKE sebelum di-ranking lokal
+VOICE_MATCH_MIN_SCORE  = float(os.environ.get('VOICE_MATCH_MIN_SCORE', 0.7))
+
+# Kata-kata yang sering muncul di perintah makan tapi bukan nama makanan.
+_STOPWORDS = {
+    'aku', 'saya', 'gue', 'gw', 'ku', 'kamu', 'jarvis', 'tolong', 'dong', 'deh', 'ya', 'yah', 'nih',
+    'tadi', 'barusan', 'sudah', 'udah', 'habis', 'abis', 'baru', 'lagi', 'juga', 'aja', 'saja',
+    'makan', 'minum', 'sarapan', 'siang', 'sore', 'malam', 'pagi', 'catat', 'input', 'tambah',
+    'tambahkan', 'masukin', 'masukkan', 'pakai', 'pake', 'sama', 'dan', 'dengan', 'yang', 'di',
+    'ke', 'dari', 'buat', 'untuk', 'porsi', 'piring', 'mangkok', 'gelas', 'potong', 'biji', 'buah',
+    'setengah', 'satu', 'dua', 'tiga', 'empat', 'lima', 'hari', 'ini', 'itu', 'berapa', 'kalori',
+    'data', 'database', 'hapus', 'batalkan', 'template', 'menu',
+}
+
+
+def food_visible_filter(user_id: int):
+    """Scope makanan yang boleh dilihat user: global (user_id NULL) + milik sendiri."""
+    return db.and_(
+        Food.deleted_at.is_(None),
+        db.or_(Food.user_id.is_(None), Food.user_id == user_id),
+    )
+
+
+def extract_terms(*texts) -> list:
+    """Kata kunci makanan dari teks, plus ejaan bakunya/variannya (telor ↔ telur)."""
+    terms = []
+    for text in texts:
+        for tok in re.findall(r'[a-z]+', normalize_name(text)):
+            if len(tok) < 3 or tok in _STOPWORDS:
+                continue
+            for t in [tok] + sorted(surface_terms(tok) - {tok}):
+                if len(t) >= 3 and t not in terms:
+                    terms.append(t)
+    return terms
+
+
+def _recent_food_counts(user_id: int) -> Counter:
+    since = now_wib_date() - timedelta(days=RECENT_FOOD_DAYS)
+    rows  = db.session.query(WaktuMakan.food_id, db.func.count(WaktuMakan.id)).filter(
+        WaktuMakan.user_id == user_id,
+        WaktuMakan.tanggal >= since,
+        WaktuMakan.food_id.isnot(None),
+    ).group_by(WaktuMakan.food_id).all()
+    return Counter({fid: n for fid, n in rows})
+
+
+def _template_food_ids(user_id: int) -> set:
+    rows = db.session.query(MealTemplateItem.food_id)\
+        .join(MealTemplate, MealTemplate.id == MealTemplateItem.template_id)\
+        .filter(MealTemplate.user_id == user_id).all()
+    return {fid for (fid,) in rows}
+
+
+def _name_matches(user_id: int, names, limit: int = None) -> list:
+    """Makanan terlihat yang namanya mengandung salah satu `names` (ternormalisasi), terpendek dulu."""
+    names = list(names)
+    if not FOOD_CATALOG_CACHE:
+        query = Food.query.filter(
+            food_visible_filter(user_id),
+            db.or_(*[Food.nama_makanan.ilike(f'%{escape_like(n)}%', escape=LIKE_ESCAPE) for n in names]),
+        ).order_by(db.func.length(Food.nama_makanan), Food.id)
+        return (query.limit(limit) if limit else query).all()
+
+    snap  = food_catalog.get()
+    found = {f.id: f for n in names for f in snap.containing(n)}
+    found.update({f.id: f for f in Food.query.filter(
+        Food.user_id == user_id,
+        Food.deleted_at.is_(None),
+        db.or_(*[Food.nama_makanan.ilike(f'%{escape_like(n)}%', escape=LIKE_ESCAPE) for n in names]),
+    )})
+    return sorted(found.values(), key=lambda f: (len(f.nama_makanan or ''), f.id))[:limit]
+
+
+def _term_score(name: str, terms: list) -> float:
+    name  = normalize_name(name)
+    words = set(name.split())
+    score = 0.0
+    for t in terms:
+        if t in words:
+            score += 3
+        elif t in name:
+            score += 1
+    # nama yang lebih pendek = lebih "pas" (mis. "Nasi" vs "Nasi Goreng Seafood")
+    return score - 0.05 * len(words) if score else 0.0
+
+
+def retrieve_food_candidates(user_id: int, *texts, limit: int = VOICE_FOOD_TOP_K) -> list:
+    """
+    Return list Food (maks `limit`) yang paling relevan untuk ucapan user.
+    `texts` = teks perintah dan/atau riwayat percakapan terbaru (boleh kosong,
+    mis. input audio tanpa transkrip — kandidat lalu diambil dari riwayat
+    makan & template user saja).
+    """
+    terms       = extract_terms(*texts)
+    recent      = _recent_food_counts(user_id)
+    template_id = _template_food_ids(user_id)
+
+    candidates = {}
+    if terms:
+        candidates.update({f.id: f for f in _name_matches(user_id, terms, MAX_TERM_MATCH_ROWS)})
+    candidates.update(visible_foods_by_ids(user_id, (set(recent) | template_id) - set(candidates)))
+
+    def score(f):
+        return (
+            _term_score(f.nama_makanan or '', terms) * 10
+            + min(recent.get(f.id, 0), 10)
+            + (3 if f.id in template_id else 0)
+        )
+
+    ranked = sorted(candidates.values(), key=lambda f: (-score(f), f.nama_makanan or ''))
+    return ranked[:limit]
+
+
+# ─────────────────────────────────────────────────────────
+#  RESOLUSI ITEM add_food (BATCH)
+# ─────────────────────────────────────────────────────────
+# Dulu tiap item dicari sendiri-sendiri: 1 query food_id, lalu kalau
+# meleset 1 query ILIKE lagi — perintah "nasi, telur, tempe, sayur, teh"
+# = sampai 10 query berurutan. Sekarang semua food_id diambil dengan 1
+# query IN, dan nama yang tidak ketemu lewat id dicocokkan oleh
+# FoodMatcher (app/food_matcher.py): "nasi putih" → "Nasi", "telor
+# ceplok" → "Telur Mata Sapi", typo ringan tetap ketemu. Kandidat dengan
+# skor tertinggi menang (seri → nama terpendek); di bawah
+# VOICE_MATCH_MIN_SCORE dianggap tidak ada di database. Dengan snapshot
+# katalog (app/food_catalog.py) bagian global memakai index yang sudah
+# dibangun per versi katalog — cuma makanan pribadi user yang di-query.
+
+def _best(matchers: list, name: str):
+    found = [hit for hit in (m.best(name, VOICE_MATCH_MIN_SCORE) for m in matchers) if hit]
+    if not found:
+        return None
+    return min(found, key=lambda sf: (-sf[0], len(sf[1].nama_makanan or ''), sf[1].id))[1]
+
+
+def resolve_voice_items(user_id: int, items: list) -> list:
+    """
+    Return list Food/None sejajar dengan `items` (dict berisi food_id
+    dan/atau nama_makanan dari hasil Gemini).
+    """
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item.get('food_id')))
+        except (TypeError, ValueError):
+            pass
+
+    by_id = visible_foods_by_ids(user_id, ids)
+
+    def lookup_id(item):
+        try:
+            return by_id.get(int(item.get('food_id')))
+        except (TypeError, ValueError):
+            return None
+
+    resolved = [lookup_id(item) for item in items]
+    names    = {
+        normalize_name(item.get('nama_makanan'))
+        for item, food in zip(items, resolved) if food is None
+    } - {''}
+    if not names:
+        return resolved
+
+    terms = set().union(*(surface_terms(n) for n in names))
+    if FOOD_CATALOG_CACHE:
+        private  = Food.query.filter(
+            Food.user_id == user_id,
+            Food.deleted_at.is_(None),
+            db.or_(*[Food.nama_makanan.ilike(f'%{escape_like(t)}%', escape=LIKE_ESCAPE) for t in terms]),
+        ).all() if terms else []
+        matchers = [food_catalog.get().matcher, FoodMatcher(private)]
+        by_name  = {n: _best(matchers, n) for n in names}
+    else:
+        rows    = _name_matches(user_id, terms, MAX_TERM_MATCH_ROWS) if terms else []
+        by_name = {n: _best([FoodMatcher(rows)], n) for n in names}
+        # Jarang: hasil OR-ILIKE kepotong limit (kata yang sangat umum
+        # memenuhi MAX_TERM_MATCH_ROWS). Cari ulang per nama.
+        if len(rows) >= MAX_TERM_MATCH_ROWS:
+            for n in [n for n, f in by_name.items() if f is None]:
+                by_name[n] = _best([FoodMatcher(_name_matches(user_id, surface_terms(n), MAX_TERM_MATCH_ROWS))], n)
+
+    return [
+        food or by_name.get(normalize_name(item.get('nama_makanan')))
+        for item, food in zip(items, resolved)
+    ]
@@ -0,0 +1,246 @@
+import os
+import re
+import heapq
+import bisect
+import logging
+import itertools
+
+from app.models import db, Food
+from app.pagination import InvalidCursorError, encode_cursor, decode_cursor, keyset_page
+from app.food_catalog import food_catalog
+from app.food_matcher import FoodMatcher, LIKE_ESCAPE, escape_like, normalize_name, canonical_key, surface_terms
+
+logger = logging.getLogger('nutriai.food')
+
+
+# ─────────────────────────────────────────────────────────
+#  PENCARIAN MAKANAN (TRIGRAM + RANKING)
+# ─────────────────────────────────────────────────────────
+# /api/foods dan /api/admin/foods dulu pakai nama_makanan ILIKE '%q%' lalu
+# ORDER BY id — ILIKE dengan wildcard di depan tidak bisa pakai B-tree,
+# jadi tiap ketikan di kotak pencarian = seq scan seluruh tabel food, dan
+# "nasi" bisa muncul di bawah "kue nasi bakar" cuma karena id-nya lebih kecil.
+#
+# Sekarang:
+#   - Nama dinormalisasi jadi lower(nama_makanan); di PostgreSQL ada index
+#     GIN pg_trgm di ekspresi itu (ix_food_nama_trgm), jadi LIKE '%q%' dan
+#     operator kemiripan % bisa pakai index.
+#   - Hasil diurutkan: sama persis → awalan nama → awalan kata → mengandung
+#     → mirip (typo, cuma di PostgreSQL), lalu kemiripan trigram, nama
+#     terpendek, id terbaru.
+#   - Scope tidak diubah di sini: pemanggil tetap memfilter global + milik
+#     sendiri (routes.py) atau global saja (admin_routes.py).
+#   - Halaman berikutnya lewat cursor (keyset di kunci relevansi yang sama,
+#     lihat food_cursor_page) — page/limit lama tetap jalan.
+#   - /api/foods membaca makanan global dari snapshot katalog in-memory
+#     (catalog_food_page, app/food_catalog.py) dengan ranking yang sama,
+#     nama & query dinormalisasi (aksen, tanda baca — app/food_matcher.py).
+#     Kalau query memakai ejaan varian/sinonim ("telor", "nasi putih") atau
+#     tidak ada yang mengandungnya (typo), hasil FoodMatcher ditambahkan
+#     sebagai rank 4+ (urut skor). Versi SQL di atas dipakai admin dan saat
+#     FOOD_CATALOG_CACHE=0.
+#
+# Index dibuat otomatis saat start (init_food_search) kalau
+# FOOD_SEARCH_AUTO_INDEX=1. Kalau role DB tidak boleh CREATE EXTENSION,
+# jalankan manual di SQL Editor Supabase:
+#     CREATE EXTENSION IF NOT EXISTS pg_trgm;
+#     CREATE INDEX IF NOT EXISTS ix_food_nama_trgm
+#         ON food USING gin (lower(nama_makanan) gin_trgm_ops);
+#     CREATE INDEX IF NOT EXISTS ix_food_user_id ON food (user_id) WHERE user_id IS NOT NULL;
+# Di SQLite (dev) pencarian tetap jalan dengan ranking yang sama, tanpa
+# index dan tanpa pencocokan typo.
+
+FOOD_SEARCH_AUTO_INDEX = os.environ.get('FOOD_SEARCH_AUTO_INDEX', '1') == '1'
+FOOD_SEARCH_FUZZY      = os.environ.get('FOOD_SEARCH_FUZZY', '1') == '1'
+MIN_FUZZY_LEN          = 3   # trigram dari query < 3 huruf tidak selektif
+MATCHER_HITS           = 50  # maks hasil tambahan FoodMatcher per sumber (global / pribadi)
+
+FOOD_INDEX_DDL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_food_nama_trgm ON food USING gin (lower(nama_makanan) gin_trgm_ops)',
+    # makanan pribadi per user (global dibaca dari snapshot katalog)
+    'CREATE INDEX IF NOT EXISTS ix_food_user_id ON food (user_id) WHERE user_id IS NOT NULL',
+)
+
+_NAME = db.func.lower(Food.nama_makanan)
+
+
+def init_food_search(app):
+    """Pasang extension pg_trgm + index pencarian makanan (PostgreSQL saja)."""
+    if not FOOD_SEARCH_AUTO_INDEX:
+        return
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            return
+        try:
+            with db.engine.begin() as conn:
+                for ddl in FOOD_INDEX_DDL:
+                    conn.exec_driver_sql(ddl)
+        except Exception as e:
+            # Jangan gagalkan start: pencarian tetap benar, cuma tanpa index.
+            logger.warning('[FoodSearch] index pencarian gagal dibuat (%s) — jalankan DDL manual', e)
+
+
+def normalize_query(q: str) -> str:
+    return re.sub(r'\s+', ' ', (q or '').strip().lower())
+
+
+def _fuzzy(q: str) -> bool:
+    return FOOD_SEARCH_FUZZY and len(q) >= MIN_FUZZY_LEN and db.session.get_bind().dialect.name == 'postgresql'
+
+
+def food_search_filter(q: str):
+    """Kondisi WHERE untuk query pencarian q (sudah/belum dinormalisasi)."""
+    q    = normalize_query(q)
+    cond = _NAME.like(f'%{escape_like(q)}%', escape=LIKE_ESCAPE)
+    if _fuzzy(q):
+        cond = db.or_(cond, _NAME.op('%')(q))
+    return cond
+
+
+def food_search_keys(q: str) -> list:
+    """
+    Kunci urutan hasil pencarian sebagai [(ekspresi, desc)] — paling relevan
+    dulu, q kosong → terbaru dulu. Selalu diakhiri id supaya unik (dipakai
+    juga sebagai kunci keyset pagination, lihat app/pagination.py).
+    """
+    q = normalize_query(q)
+    if not q:
+        return [(Food.id, True)]
+    esc  = escape_like(q)
+    rank = db.case(
+        (_NAME == q,                                    0),
+        (_NAME.like(f'{esc}%', escape=LIKE_ESCAPE),     1),
+        (_NAME.like(f'% {esc}%', escape=LIKE_ESCAPE),   2),
+        (_NAME.like(f'%{esc}%', escape=LIKE_ESCAPE),    3),
+        else_=4,
+    )
+    keys = [(rank, False)]
+    if _fuzzy(q):
+        # Dibulatkan ke integer (per mil): nilai float4 dari cursor tidak
+        # bisa dibandingkan "=" dengan aman.
+        keys.append((db.cast(db.func.similarity(_NAME, q) * 1000, db.Integer), True))
+    return keys + [(db.func.length(Food.nama_makanan), False), (Food.id, True)]
+
+
+def food_search_order(q: str) -> list:
+    """ORDER BY hasil pencarian (lihat food_search_keys)."""
+    return [expr.desc() if desc else expr for expr, desc in food_search_keys(q)]
+
+
+def food_cursor_page(query, q: str, limit: int, cursor: str, scope: str, with_total: bool = False) -> dict:
+    """
+    Body JSON 1 halaman keyset untuk daftar makanan. query sudah di-scope &
+    difilter pencarian; cursor '' = halaman pertama. scope membedakan
+    daftar (mis. user / admin) supaya cursor tidak bisa dipakai silang.
+    Raise InvalidCursorError kalau cursor tidak valid.
+    """
+    scope              = f'{scope}:{normalize_query(q)}'
+    after              = decode_cursor(cursor, scope) if cursor else None
+    foods, next_values = keyset_page(query, food_search_keys(q), limit, after)
+
+    body = {
+        'data':        [f.to_dict() for f in foods],
+        'limit':       limit,
+        'next_cursor': encode_cursor(next_values, scope) if next_values else None,
+    }
+    if with_total:
+        body['total'] = query.count()   # opsional: COUNT(*) tetap mahal di katalog besar
+    return body
+
+
+# ─────────────────────────────────────────────────────────
+#  PENCARIAN DARI SNAPSHOT KATALOG (global in-memory + pribadi dari DB)
+# ─────────────────────────────────────────────────────────
+
+def _rank(name: str, q: str) -> int:
+    """Sama dengan CASE di food_search_keys (4 = cuma cocok lewat FoodMatcher)."""
+    if name == q:
+        return 0
+    if name.startswith(q):
+        return 1
+    if f' {q}' in name:
+        return 2
+    return 3 if q in name else 4
+
+
+def _sort_key(values: list) -> tuple:
+    return (values[0], values[1], -values[2]) if len(values) == 3 else (-values[0],)
+
+
+def _ranked_visible(user_id: int, q: str, after: list = None) -> tuple:
+    """
+    (iterator (nilai_kunci, food) urut relevansi, total). nilai_kunci =
+    [rank, panjang nama, id] — bentuk yang sama dengan food_search_keys
+    di SQLite — atau [id] kalau q kosong. q sudah normalize_name. after =
+    nilai kunci dari cursor.
+    """
+    if after is not None and len(after) != (3 if q else 1):
+        raise InvalidCursorError('cursor tidak cocok dengan pencarian ini')
+    snap    = food_catalog.get()
+    private = Food.query.filter(Food.user_id == user_id, Food.deleted_at.is_(None))
+    if not q:
+        # Terbaru dulu. Snapshot sudah urut id naik → dibaca mundur dari
+        # posisi cursor, digabung dengan makanan pribadi tanpa menyusun
+        # ulang seluruh katalog.
+        private = [([f.id], f) for f in private.order_by(Food.id.desc())]
+        total   = len(snap.foods) + len(private)
+        end     = len(snap.ids) if after is None else bisect.bisect_left(snap.ids, after[0])
+        glob    = (([snap.foods[i].id], snap.foods[i]) for i in range(end - 1, -1, -1))
+        if after is not None:
+            private = [kf for kf in private if kf[0][0] < after[0]]
+        return heapq.merge(glob, private, key=lambda kf: _sort_key(kf[0])), total
+
+    items  = [([_rank(snap.norm[f.id], q), len(f.nama_makanan), f.id], f) for f in snap.containing(q)]
+    items += [([_rank(normalize_name(f.nama_makanan), q), len(f.nama_makanan), f.id], f)
+              for f in private.filter(food_search_filter(q))]
+    if not items or canonical_key(q) != q:
+        # Ejaan varian / sinonim / typo: rank 4 + (1 - skor) → tetap integer
+        # (aman untuk cursor), makin mirip makin atas. Makanan pribadi
+        # disaring dulu di DB per kata (termasuk ejaan variannya).
+        terms  = [t for t in surface_terms(q) if len(t) >= 3]
+        mine   = private.filter(
+            db.or_(*[_NAME.like(f'%{escape_like(t)}%', escape=LIKE_ESCAPE) for t in terms]),
+        ).all() if terms else []
+        seen   = {f.id for _, f in items}
+        hits   = snap.matcher.match(q, MATCHER_HITS) + FoodMatcher(mine).match(q, MATCHER_HITS)
+        items += [([4 + round((1 - score) * 100), len(f.nama_makanan), f.id], f)
+                  for score, f in hits if f.id not in seen]
+    items.sort(key=lambda kf: _sort_key(kf[0]))
+    total = len(items)
+    if after is not None:
+        items = itertools.dropwhile(lambda kf: _sort_key(kf[0]) <= _sort_key(after), items)
+    return iter(items), total
+
+
+def catalog_food_page(user_id: int, q: str, limit: int, page: int = 1, cursor: str = None,
+                      with_total: bool = False) -> dict:
+    """
+    Body JSON /api/foods dari snapshot katalog: mode cursor kalau `cursor`
+    tidak None ('' = halaman pertama), selain itu page/limit lama.
+    """
+    q     = normalize_name(q)
+    limit = max(limit, 1)
+
+    if cursor is None:
+        items, total = _ranked_visible(user_id, q)
+        foods        = [f for _, f in itertools.islice(items, (page - 1) * limit, page * limit)]
+        return {
+            'data':        [f.to_dict() for f in foods],
+            'total':       total,
+            'page':        page,
+            'limit':       limit,
+            'total_pages': (total + limit - 1) // limit,
+        }
+
+    scope        = f'foods:{user_id}:{q}'
+    items, total = _ranked_visible(user_id, q, decode_cursor(cursor, scope) if cursor else None)
+    rows         = list(itertools.islice(items, limit + 1))
+    body         = {
+        'data':        [f.to_dict() for _, f in rows[:limit]],
+        'limit':       limit,
+        'next_cursor': encode_cursor(rows[limit - 1][0], scope) if len(rows) > limit else None,
+    }
+    if with_total:
+        body['total'] = total
+    return body
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import queue
+import socket
+import http.client
+from urllib.parse import urlsplit
+
+
+# ─────────────────────────────────────────────────────────
+#  GEMINI HTTP CLIENT (keep-alive + connection pool)
+# ─────────────────────────────────────────────────────────
+# Sebelumnya tiap panggilan (termasuk tiap retry) pakai urlopen() baru,
+# jadi SETIAP request AI bayar handshake TCP+TLS penuh ke
+# generativelanguage.googleapis.com. Di sini koneksi HTTPS disimpan di
+# pool per-proses dan dipakai ulang (HTTP/1.1 keep-alive).
+#
+# Pool-nya thread-safe (queue.LifoQueue) dan TIDAK memblokir: kalau semua
+# koneksi idle sedang dipakai, request baru tetap buka koneksi sementara,
+# dan koneksi itu ditutup saat dikembalikan kalau pool sudah penuh
+# (semantik sama seperti urllib3 dengan block=False).
+
+# Bisa diarahkan ke server tiruan lokal untuk load test (tanpa API key asli).
+GEMINI_BASE_URL        = os.environ.get('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com')
+GEMINI_POOL_SIZE       = int(os.environ.get('GEMINI_POOL_SIZE', 8))
+GEMINI_TIMEOUT         = float(os.environ.get('GEMINI_TIMEOUT', 55))
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get('GEMINI_CONNECT_TIMEOUT', 10))
+# Koneksi idle lebih lama dari ini dibuang (server Google biasanya menutup
+# koneksi idle duluan — daripada kena error di request berikutnya).
+GEMINI_POOL_IDLE_SECONDS = float(os.environ.get('GEMINI_POOL_IDLE_SECONDS', 60))
+
+# Error di koneksi yang DIPAKAI ULANG sebelum response diterima hampir pasti
+# karena server sudah menutup socket idle — aman dicoba sekali lagi di koneksi baru.
+_STALE_CONN_ERRORS = (
+    http.client.RemoteDisconnected, http.client.BadStatusLine,
+    ConnectionResetError, BrokenPipeError,
+)
+
+
+class GeminiHTTPError(RuntimeError):
+    """Gemini membalas dengan status HTTP >= 400."""
+
+    def __init__(self, code: int, body: str, headers: dict = None):
+        super().__init__(f'HTTP error {code}: {body[:300]}')
+        self.code    = code
+        self.body    = body
+        self.headers = headers or {}
+
+
+class GeminiConnectionError(RuntimeError):
+    """Gagal konek / timeout / koneksi putus ke Gemini."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class GeminiClient:
+    def __init__(self, base_url: str = GEMINI_BASE_URL, pool_size: int = GEMINI_POOL_SIZE,
+                 timeout: float = GEMINI_TIMEOUT, connect_timeout: float = GEMINI_CONNECT_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.base_url        = base_url.rstrip('/')
+        self.timeout         = timeout
+        self.connect_timeout = connect_timeout
+        self._https          = parts.scheme == 'https'
+        self._host           = parts.hostname
+        self._port           = parts.port or (443 if self._https else 80)
+        self._prefix         = parts.path.rstrip('/')
+        self._idle           = queue.LifoQueue(maxsize=max(pool_size, 1))
+
+    # ── pool ────────────────────────────────────────────
+    def _new_conn(self):
+        cls  = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        conn = cls(self._host, self._port, timeout=self.connect_timeout)
+        conn.connect()
+        return conn
+
+    def _acquire(self):
+        """Ambil koneksi idle yang masih segar, atau buka baru. Return (conn, reused)."""
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_conn(), False
+            if time.monotonic() - last_used <= GEMINI_POOL_IDLE_SECONDS and conn.sock is not None:
+                return conn, True
+            conn.close()
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait((conn, time.monotonic()))
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    # ── request ─────────────────────────────────────────
+    def request(self, method: str, path: str, body: bytes = None, timeout: float = None,
+                headers: dict = None) -> tuple:
+        """
+        Kirim 1 request lewat pool. Return (status, headers, body_bytes).
+        Tidak ada retry di sini selain 1x ulang untuk koneksi idle yang basi —
+        kebijakan retry untuk error 429/5xx tetap urusan pemanggil.
+        """
+        timeout = timeout or self.timeout
+        hdrs    = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        hdrs.update(headers or {})
+
+        for attempt in range(2):
+            try:
+                conn, reused = self._acquire()
+            except (OSError, http.client.HTTPException) as e:
+                raise GeminiConnectionError(f'Tidak bisa konek ke Gemini: {e}')
+            try:
+                conn.sock.settimeout(timeout)
+                conn.request(method, self._prefix + path, body=body, headers=hdrs)
+                resp = conn.getresponse()
+                data = resp.read()
+            except _STALE_CONN_ERRORS as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise GeminiConnectionError(f'Koneksi ke Gemini terputus: {e}')
+            except socket.timeout:
+                conn.close()
+                raise GeminiConnectionError(f'Timeout {timeout:g}s menunggu Gemini')
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise GeminiConnectionError(str(e))
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, dict(resp.getheaders()), data
+
+    def _json(self, method: str, path: str, payload: dict = None, timeout: float = None) -> dict:
+        body = json.dumps(payload).encode() if payload is not None else None
+        status, headers, data = self.request(method, path, body=body, timeout=timeout)
+        if status >= 400:
+            raise GeminiHTTPError(status, data.decode('utf-8', errors='replace'), headers)
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise GeminiConnectionError(f'Response Gemini bukan JSON: {data[:200]!r}')
+
+    def post_json(self, path: str, payload: dict, timeout: float = None) -> dict:
+        return self._json('POST', path, payload, timeout)
+
+    def get_json(self, path: str, timeout: float = None) -> dict:
+        return self._json('GET', path, None, timeout)
+
+    # ── endpoint Gemini ─────────────────────────────────
+    def generate_content(self, model: str, api_ver: str, payload: dict, api_key: str,
+                         timeout: float = None) -> dict:
+        path = f'/{api_ver}/models/{model}:generateContent?key={api_key}'
+        return self.post_json(path, payload, timeout)
+
+    def stream_generate_content(self, model: str, api_ver: str, payload: dict, api_key: str,
+                                timeout: float = None):
+        """
+        streamGenerateContent (alt=sse) — generator yang yield tiap chunk JSON
+        begitu datang dari Gemini. timeout berlaku per-baca, bukan total.
+        """
+        path    = f'{self._prefix}/{api_ver}/models/{model}:streamGenerateContent?alt=sse&key={api_key}'
+        timeout = timeout or self.timeout
+        try:
+            conn, _ = self._acquire()
+        except (OSError, http.client.HTTPException) as e:
+            raise GeminiConnectionError(f'Tidak bisa konek ke Gemini: {e}')
+
+        reusable = False
+        try:
+            try:
+                conn.sock.settimeout(timeout)
+                conn.request('POST', path, body=json.dumps(payload).encode(), headers={
+                    'Content-Type': 'application/json', 'Accept': 'text/event-stream',
+                    'Connection': 'keep-alive',
+                })
+                resp = conn.getresponse()
+                if resp.status >= 400:
+                    data     = resp.read()
+                    reusable = not resp.will_close
+                    raise GeminiHTTPError(resp.status, data.decode('utf-8', errors='replace'),
+                                          dict(resp.getheaders()))
+                while True:
+                    line = resp.readline()
+                    if not line:
+                        break
+                    line = line.strip()
+                    if not line.startswith(b'data:'):
+                        continue
+                    try:
+                        yield json.loads(line[5:])
+                    except ValueError:
+                        raise GeminiConnectionError(f'Chunk stream Gemini bukan JSON: {line[:200]!r}')
+                reusable = not resp.will_close
+            except socket.timeout:
+                raise GeminiConnectionError(f'Timeout {timeout:g}s menunggu Gemini')
+            except (OSError, http.client.HTTPException) as e:
+                raise GeminiConnectionError(str(e))
+        finally:
+            # Stream yang berhenti di tengah (client putus / error) menyisakan
+            # sisa body di socket — koneksinya dibuang, bukan dikembalikan ke pool.
+            if reusable:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def list_models(self, api_key: str, api_ver: str = 'v1beta', timeout: float = None) -> dict:
+        return self.get_json(f'/{api_ver}/models?key={api_key}', timeout)
+
+
+# Satu client per proses (tiap worker gunicorn punya pool sendiri).
+gemini_client = GeminiClient()
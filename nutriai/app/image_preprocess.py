@@ -0,0 +1,77 @@
+import io
+import os
+import logging
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  PREPROCESS FOTO SEBELUM DIKIRIM KE GEMINI
+# ─────────────────────────────────────────────────────────
+# Foto HP 4–12 MB dulu dikirim apa adanya (resolusi penuh, base64, selalu
+# dilabeli image/jpeg). Untuk mengenali makanan, sisi terpanjang ~1024px
+# sudah lebih dari cukup — jadi foto di-decode, diputar sesuai EXIF,
+# diperkecil, lalu di-encode ulang (JPEG/WebP, kualitas dibatasi) dengan
+# MIME yang benar. Payload upstream turun jauh, latency ikut turun.
+
+AI_IMAGE_PREPROCESS = os.environ.get('AI_IMAGE_PREPROCESS', '1') == '1'
+AI_IMAGE_MAX_EDGE   = int(os.environ.get('AI_IMAGE_MAX_EDGE', 1024))
+AI_IMAGE_FORMAT     = os.environ.get('AI_IMAGE_FORMAT', 'JPEG').upper()           # JPEG | WEBP
+AI_IMAGE_QUALITY    = max(40, min(int(os.environ.get('AI_IMAGE_QUALITY', 80)), 95))
+# Batas piksel saat decode — cegah "decompression bomb" dari upload iseng.
+AI_IMAGE_MAX_PIXELS = int(os.environ.get('AI_IMAGE_MAX_PIXELS', 50_000_000))
+
+_MIME = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif', 'HEIF': 'image/heif'}
+
+# Ikut masuk key cache analisis foto: setting berubah = hasil lama tidak dipakai.
+PREPROCESS_TAG = (f'{AI_IMAGE_MAX_EDGE}{AI_IMAGE_FORMAT[0]}{AI_IMAGE_QUALITY}'
+                  if AI_IMAGE_PREPROCESS else 'raw')
+
+Image.MAX_IMAGE_PIXELS = AI_IMAGE_MAX_PIXELS
+
+
+class InvalidImageError(ValueError):
+    """Upload bukan gambar yang bisa dibaca Pillow."""
+
+
+def preprocess_image(data: bytes) -> tuple:
+    """
+    Return (bytes, mime_type) siap kirim ke Gemini.
+    Raise InvalidImageError kalau data bukan gambar.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        src_format = img.format
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f'File bukan gambar yang valid: {e}')
+
+    if not AI_IMAGE_PREPROCESS:
+        return data, _MIME.get(src_format, 'image/jpeg')
+
+    orientation = img.getexif().get(0x0112, 1)   # tag EXIF Orientation
+    needs_resize = max(img.size) > AI_IMAGE_MAX_EDGE
+    # Foto yang sudah kecil, tegak & formatnya didukung Gemini tidak perlu
+    # di-encode ulang (encode ulang malah bisa bikin lebih besar).
+    if not needs_resize and orientation == 1 and src_format in ('JPEG', 'WEBP', 'PNG'):
+        return data, _MIME[src_format]
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        bg  = Image.new('RGB', img.size, (255, 255, 255))
+        bg.paste(img, mask=img.getchannel('A'))
+        img = bg
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    if needs_resize:
+        img.thumbnail((AI_IMAGE_MAX_EDGE, AI_IMAGE_MAX_EDGE), Image.LANCZOS)
+
+    fmt = AI_IMAGE_FORMAT if AI_IMAGE_FORMAT in ('JPEG', 'WEBP') else 'JPEG'
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=AI_IMAGE_QUALITY, optimize=fmt == 'JPEG')
+    result = out.getvalue()
+    logger.info('[ImagePrep] %s %dB → %s %dx%d %dB', src_format, len(data), fmt, img.width, img.height, len(result))
+    return result, _MIME[fmt]
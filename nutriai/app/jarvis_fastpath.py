@@ -0,0 +1,147 @@
+import re
+
+
+# ─────────────────────────────────────────────────────────
+#  FAST-PATH LOKAL UNTUK PERINTAH JARVIS SEDERHANA
+# ─────────────────────────────────────────────────────────
+# Banyak input teks voice-command sebenarnya berpola tetap ("minum 2
+# gelas", "berat 70.5 kilo", "rekap hari ini"). Parser ini menangani
+# kasus yang PASTI untuk add_water, add_weight, check_today, check_water
+# dan check_nutrition langsung di server tanpa ke Gemini. Polanya sengaja
+# ketat (full-match setelah normalisasi): kalau ada kata lain yang tidak
+# dikenal, parse_fast_intent() return None dan request tetap ke Gemini.
+
+_FILLERS = {
+    'dong', 'ya', 'yah', 'yuk', 'nih', 'deh', 'sih', 'ah', 'kak', 'bro', 'jarvis', 'tolong',
+    'please', 'coba', 'dulu', 'aja', 'saja', 'tuh',
+}
+
+_NUMBER_WORDS = {
+    'setengah': 0.5, 'satu': 1, 'dua': 2, 'tiga': 3, 'empat': 4, 'lima': 5,
+    'enam': 6, 'tujuh': 7, 'delapan': 8, 'sembilan': 9, 'sepuluh': 10,
+}
+
+# Sama dengan konversi di prompt Jarvis: gelas=250ml, botol=600ml, liter=1000ml.
+_WATER_UNIT_ML = {
+    'gelas': 250, 'botol': 600, 'liter': 1000, 'l': 1000,
+    'ml': 1, 'mili': 1, 'mililiter': 1, 'cc': 1,
+}
+
+_SUBJ = r'(?:(?:aku|saya|gue|gw) )?'
+_WHEN = r'(?: (?:hari ini|hr ini|sekarang))?'
+_NUM  = r'(?P<qty>\d+(?:\.\d+)?|' + '|'.join(_NUMBER_WORDS) + r')'
+
+_WATER_RE = re.compile(
+    r'^' + _SUBJ + r'(?:(?:udah|sudah|baru|barusan|tadi|habis|abis) )?'
+    r'(?:minum|catat minum|catat air|tambah air|input air)'
+    r'(?P<air> air(?: putih| mineral)?)?'
+    r'(?: ' + _NUM + r')?'
+    r'(?: ?(?P<unit>' + '|'.join(_WATER_UNIT_ML) + r'))?'
+    r'(?P<air2> air(?: putih| mineral)?)?$'
+)
+
+_WEIGHT_RE = re.compile(
+    r'^(?:(?:catat|input|update|simpan) )?'
+    r'(?:berat(?: badan)?|bb|timbang(?:an)?)'
+    r'(?: (?:aku|saya|gue|gw|ku))?'
+    r'(?: (?:sekarang|hari ini|tadi|pagi ini))?'
+    r'(?: (?:jadi|adalah|tadi))?'
+    r' (?P<berat>\d{2,3}(?:\.\d+)?) ?(?:kilo|kg|kilogram)?$'
+)
+
+_CHECK_PATTERNS = [
+    ('check_today', re.compile(r'^(?:rekap|ringkasan)(?: makan(?:an)?)?' + _WHEN + r'$')),
+    ('check_today', re.compile(r'^(?:hari ini )?' + _SUBJ + r'(?:udah|sudah) makan apa(?: aja| saja)?' + _WHEN + r'$')),
+    ('check_today', re.compile(r'^(?:cek|lihat|liat) (?:makanan|log makan(?:an)?|catatan makan(?:an)?)' + _WHEN + r'$')),
+    ('check_water', re.compile(r'^(?:(?:cek|lihat|liat) )?(?:progress|progres) (?:air|minum)(?: air)?' + _WHEN + r'$')),
+    ('check_water', re.compile(r'^' + _SUBJ + r'(?:(?:udah|sudah) )?minum(?: air)? berapa(?: banyak)?' + _WHEN + r'$')),
+    ('check_water', re.compile(r'^(?:cek |total |jumlah )?air minum(?: aku| saya)?' + _WHEN + r'(?: berapa)?$')),
+    ('check_nutrition', re.compile(
+        r'^(?:(?:cek|lihat|liat) )?(?:progress|progres|sisa|status|total)'
+        r'(?: (?:kalori|protein|nutrisi|gizi|makan))+(?: (?:aku|saya|ku))?' + _WHEN + r'(?: berapa)?$'
+    )),
+    ('check_nutrition', re.compile(r'^(?:kalori|protein) ' + _SUBJ + r'(?:hari ini )?(?:(?:udah|sudah) )?berapa$')),
+    ('check_nutrition', re.compile(r'^gimana progress(?:ku| ku| aku| saya)?' + _WHEN + r'$')),
+]
+
+
+def normalize_command(text: str) -> str:
+    s = (text or '').lower().strip()
+    s = re.sub(r'(\d),(\d)', r'\1.\2', s)                     # "70,5" → "70.5"
+    s = re.sub(r'\bse(gelas|botol|liter)\b', r'1 \1', s)      # "segelas" → "1 gelas"
+    s = re.sub(r'(\d)(?=[a-z])', r'\1 ', s)                   # "600ml" → "600 ml"
+    s = re.sub(r'[^\w\s.]|(?<!\d)\.|\.(?!\d)', ' ', s)        # buang tanda baca, kecuali titik desimal
+    return ' '.join(w for w in s.split() if w not in _FILLERS)
+
+
+def _to_number(token: str):
+    if token in _NUMBER_WORDS:
+        return _NUMBER_WORDS[token]
+    return float(token)
+
+
+def parse_fast_intent(text: str) -> dict | None:
+    """
+    Return {'intent': ..., 'params': {...}} kalau perintah PASTI dipahami,
+    atau None kalau harus diserahkan ke Gemini.
+    """
+    s = normalize_command(text)
+    if not s:
+        return None
+
+    m = _WATER_RE.match(s)
+    if m and (m.group('air') or m.group('unit')) and not (m.group('air') and m.group('air2')):
+        qty  = _to_number(m.group('qty')) if m.group('qty') else 1
+        unit = m.group('unit') or ('ml' if m.group('qty') and qty >= 50 else 'gelas')
+        ml   = int(round(qty * _WATER_UNIT_ML[unit]))
+        if ml <= 0:
+            return None
+        return {'intent': 'add_water', 'params': {'jumlah_ml': ml}}
+
+    m = _WEIGHT_RE.match(s)
+    if m:
+        return {'intent': 'add_weight', 'params': {'berat': float(m.group('berat'))}}
+
+    for intent, pattern in _CHECK_PATTERNS:
+        if pattern.match(s):
+            return {'intent': intent, 'params': {}}
+    return None
+
+
+def _fmt(n) -> str:
+    return f'{int(round(n or 0)):,}'.replace(',', '.')
+
+
+def compose_fast_reply(intent: str, action_result: dict, username: str) -> str:
+    """Balasan natural untuk hasil fast-path (pengganti 'reply' yang biasanya dibuat Gemini)."""
+    r = action_result
+    if intent == 'add_water':
+        sisa = r.get('sisa_ml', 0)
+        tail = f"Sisa {_fmt(sisa)}ml lagi ya." if sisa else 'Target minum hari ini sudah tercapai, mantap!'
+        return (f"Sip {username}, {_fmt(r.get('added_ml'))}ml air sudah dicatat 💧 "
+                f"Total hari ini {_fmt(r.get('total_ml'))}ml dari target {_fmt(r.get('target_ml'))}ml. {tail}")
+
+    if intent == 'add_weight':
+        if r.get('status') != 'saved':
+            return f"Hmm, angka berat badannya kurang pas (harus 30–300 kg). Coba sebutkan lagi ya, {username}."
+        return f"Oke {username}, berat {r.get('berat')}kg sudah dicatat. Target kalori harianmu ikut diperbarui."
+
+    if intent == 'check_today':
+        entries = r.get('entries') or []
+        if not entries:
+            return f"Kamu belum mencatat makanan apa pun hari ini, {username}. Mau catat sekarang?"
+        names = ', '.join(f"{e['nama']} ({e['waktu']})" for e in entries)
+        return (f"Hari ini kamu sudah makan {names}. Totalnya {_fmt(r.get('total_kalori'))} kcal dan "
+                f"{_fmt(r.get('total_protein'))}g protein, sisa {_fmt(r.get('sisa_kalori'))} kcal lagi.")
+
+    if intent == 'check_water':
+        sisa = r.get('sisa_ml', 0)
+        tail = f"Kurang {_fmt(sisa)}ml lagi, yuk minum 💧" if sisa else 'Target minum hari ini sudah tercapai 🎉'
+        return f"Hari ini kamu sudah minum {_fmt(r.get('total_ml'))}ml dari target {_fmt(r.get('target_ml'))}ml. {tail}"
+
+    if intent == 'check_nutrition':
+        return (f"Progress hari ini, {username}: {_fmt(r.get('total_kalori'))} dari {_fmt(r.get('target_kalori'))} kcal "
+                f"({r.get('progress_kalori', 0)}%) dan {_fmt(r.get('total_protein'))} dari "
+                f"{_fmt(r.get('target_protein'))}g protein ({r.get('progress_protein', 0)}%). "
+                f"Sisa {_fmt(r.get('sisa_kalori'))} kcal dan {_fmt(r.get('sisa_protein'))}g protein.")
+    return ''
@@ -0,0 +1,207 @@
+import os
+import time
+import logging
+import threading
+import statistics
+from collections import deque, namedtuple
+
+from app.gemini_client import GeminiHTTPError, GeminiConnectionError
+from app.upstream_policy import (
+    AI_UPSTREAM_DEADLINE, MIN_ATTEMPT_SECONDS, RETRYABLE_STATUS,
+    CircuitOpenError, DeadlineExhaustedError,
+)
+from app.ai_metrics import metrics
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  ROUTING MODEL GEMINI PER ENDPOINT
+# ─────────────────────────────────────────────────────────
+# Dulu model cuma GEMINI_MODEL dari env, dan default-nya beda-beda:
+# call_gemini & stream pakai gemini-2.5-flash-preview-04-17 / v1alpha,
+# voice-command pakai gemini-2.5-flash / v1beta. Sekarang semua endpoint
+# lewat router ini:
+#   - Tiap endpoint masuk 1 kelas (ENDPOINT_CLASS). Tiap kelas punya daftar
+#     model berurutan: utama lalu cadangan — env AI_MODELS_FAST /
+#     AI_MODELS_STANDARD / AI_MODELS_VISION, format "model[@api_ver],...".
+#     GEMINI_MODEL (kalau diset) tetap jadi model utama semua kelas.
+#   - Statistik bergulir per model (AI_ROUTER_WINDOW panggilan terakhir,
+#     maks AI_ROUTER_WINDOW_SECONDS): error rate & median latency.
+#   - Model dengan error rate ≥ AI_ROUTER_MAX_ERROR_RATE digeser ke
+#     belakang. Setelah jendela statistiknya lewat tanpa panggilan, model
+#     itu dicoba lagi seperti biasa.
+#   - Kelas 'fast' (tugas pendek & murah: Jarvis, ringkasan memori, saran
+#     menu) diurutkan dari model yang median latency-nya paling kecil.
+#   - Failover di dalam 1 request: kalau model pertama gagal karena model
+#     tidak ada (404) atau upstream error setelah semua retry, sisa
+#     deadline dipakai untuk mencoba model berikutnya. Model pertama
+#     cuma boleh memakai (1 - AI_FAILOVER_RESERVE) dari deadline.
+# Circuit breaker tetap satu untuk semua model (lihat upstream_policy.py):
+# kalau breaker OPEN, tidak ada failover — Gemini dianggap down total.
+
+FAST, STANDARD, VISION = 'fast', 'standard', 'vision'
+
+ENDPOINT_CLASS = {
+    'voice-command':          FAST,
+    'conversation-summary':   FAST,
+    'meal-suggestion':        FAST,
+    'meal-suggestion/stream': FAST,
+    'analyze-image':          VISION,
+}   # endpoint lain → STANDARD
+
+AI_ROUTER_WINDOW         = int(os.environ.get('AI_ROUTER_WINDOW', 50))
+AI_ROUTER_WINDOW_SECONDS = float(os.environ.get('AI_ROUTER_WINDOW_SECONDS', 300))
+AI_ROUTER_MIN_SAMPLES    = int(os.environ.get('AI_ROUTER_MIN_SAMPLES', 5))
+AI_ROUTER_MAX_ERROR_RATE = float(os.environ.get('AI_ROUTER_MAX_ERROR_RATE', 0.5))
+AI_FAILOVER_RESERVE      = float(os.environ.get('AI_FAILOVER_RESERVE', 0.35))
+
+DEFAULT_API_VER = os.environ.get('GEMINI_API_VER', 'v1beta')
+DEFAULT_MODELS  = {
+    FAST:     'gemini-2.5-flash-lite,gemini-2.5-flash',
+    STANDARD: 'gemini-2.5-flash,gemini-2.5-flash-lite',
+    VISION:   'gemini-2.5-flash,gemini-2.5-flash-lite',
+}
+
+ModelRoute = namedtuple('ModelRoute', 'model api_ver')
+
+
+def parse_routes(spec: str) -> list:
+    """'gemini-2.5-flash@v1beta,gemini-2.5-flash-lite' → [ModelRoute, ...] (tanpa duplikat)."""
+    routes = []
+    for item in (spec or '').split(','):
+        model, _, api_ver = item.strip().partition('@')
+        route = ModelRoute(model, api_ver or DEFAULT_API_VER)
+        if model and route not in routes:
+            routes.append(route)
+    return routes
+
+
+def _configured_routes(cls: str) -> list:
+    routes  = parse_routes(os.environ.get(f'AI_MODELS_{cls.upper()}') or DEFAULT_MODELS[cls])
+    primary = os.environ.get('GEMINI_MODEL')
+    if primary and not os.environ.get(f'AI_MODELS_{cls.upper()}'):
+        route  = ModelRoute(primary, DEFAULT_API_VER)
+        routes = [route] + [r for r in routes if r != route]
+    return routes
+
+
+class ModelStats:
+    """Hasil panggilan terakhir 1 model: deque (waktu, ok, latency_ms)."""
+
+    def __init__(self, window: int = AI_ROUTER_WINDOW, window_seconds: float = AI_ROUTER_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._calls         = deque(maxlen=window)
+
+    def add(self, ok: bool, latency_ms: float):
+        self._calls.append((time.monotonic(), ok, latency_ms))
+
+    def _recent(self) -> list:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+        return list(self._calls)
+
+    def summary(self) -> dict:
+        calls = self._recent()
+        ok    = [ms for _, success, ms in calls if success]
+        return {
+            'samples':     len(calls),
+            'error_rate':  round(1 - len(ok) / len(calls), 3) if calls else 0.0,
+            'p50_ms':      round(statistics.median(ok)) if ok else None,
+        }
+
+
+def should_failover(exc: BaseException) -> bool:
+    """Error yang mungkin khusus model ini — model berikutnya layak dicoba."""
+    if isinstance(exc, DeadlineExhaustedError):
+        return False   # waktunya yang habis, bukan modelnya
+    if isinstance(exc, GeminiConnectionError):
+        return True
+    return isinstance(exc, GeminiHTTPError) and (exc.code == 404 or exc.code in RETRYABLE_STATUS)
+
+
+class ModelRouter:
+    def __init__(self, routes: dict = None):
+        self.routes = routes or {cls: _configured_routes(cls) for cls in DEFAULT_MODELS}
+        self._stats = {}
+        self._lock  = threading.Lock()
+
+    def _stats_for(self, route: ModelRoute) -> ModelStats:
+        stats = self._stats.get(route)
+        if stats is None:
+            stats = self._stats[route] = ModelStats()
+        return stats
+
+    def record(self, route: ModelRoute, ok: bool, latency_ms: float):
+        with self._lock:
+            self._stats_for(route).add(ok, latency_ms)
+
+    def select(self, endpoint: str) -> list:
+        """Urutan model yang dicoba untuk endpoint ini (utama dulu)."""
+        return self._ordered(ENDPOINT_CLASS.get(endpoint, STANDARD))
+
+    def _ordered(self, cls: str) -> list:
+        with self._lock:
+            summaries = {r: self._stats_for(r).summary() for r in self.routes[cls]}
+
+        def unhealthy(r):
+            s = summaries[r]
+            return s['samples'] >= AI_ROUTER_MIN_SAMPLES and s['error_rate'] >= AI_ROUTER_MAX_ERROR_RATE
+
+        def rank(item):
+            i, r = item
+            s    = summaries[r]
+            if cls == FAST and s['samples'] >= AI_ROUTER_MIN_SAMPLES and s['p50_ms'] is not None:
+                return unhealthy(r), s['p50_ms'], i
+            # Belum cukup data latency → urutan konfigurasi, di belakang model yang sudah terukur.
+            return unhealthy(r), float('inf') if cls == FAST else 0, i
+
+        return [r for _, r in sorted(enumerate(self.routes[cls]), key=rank)]
+
+    def primary(self, endpoint: str) -> ModelRoute:
+        return self.select(endpoint)[0]
+
+    def run(self, endpoint: str, call, fn):
+        """
+        fn(route, deadline) → hasil, dicoba di model pilihan lalu cadangannya.
+        call.model diisi model yang sedang dicoba (label metrik pemakaian).
+        """
+        routes = self.select(endpoint)
+        end    = time.monotonic() + AI_UPSTREAM_DEADLINE
+        for i, route in enumerate(routes):
+            last      = i == len(routes) - 1
+            remaining = end - time.monotonic()
+            call.model = route.model
+            started    = time.perf_counter()
+            try:
+                result = fn(route, remaining if last else remaining * (1 - AI_FAILOVER_RESERVE))
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                # Error yang bukan salah model (4xx dari request itu sendiri,
+                # bug lokal, deadline habis) tidak mengubah kesehatan model.
+                if not should_failover(e):
+                    raise
+                self.record(route, False, (time.perf_counter() - started) * 1000)
+                if last or end - time.monotonic() < MIN_ATTEMPT_SECONDS:
+                    raise
+                metrics.inc('ai_model_failover_total', endpoint=endpoint,
+                            from_model=route.model, to_model=routes[i + 1].model)
+                logger.warning('[ModelRouter] %s: %s gagal (%s), pindah ke %s',
+                               endpoint, route.model, e, routes[i + 1].model)
+                continue
+            self.record(route, True, (time.perf_counter() - started) * 1000)
+            return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = {f'{r.model}@{r.api_ver}': self._stats_for(r).summary()
+                     for routes in self.routes.values() for r in routes}
+        return {
+            'classes': {cls: [f'{r.model}@{r.api_ver}' for r in self._ordered(cls)] for cls in self.routes},
+            'models':  stats,
+        }
+
+
+model_router = ModelRouter()
@@ -350,4 +350,125 @@ class StreakLog(db.Model):
 
     __table_args__ = (db.UniqueConstraint('user_id', 'tanggal', name='uq_streak_user_date'),)
 
-    user = db.relationship('User', backref='streak_logs', lazy=True)
\ No newline at end of file
+    user = db.relationship('User', backref='streak_logs', lazy=True)
+
+
+class WeeklyAnalysis(db.Model):
+    """
+    Tabel: weekly_analysis — hasil /api/ai/weekly-analysis yang sudah jadi
+    (diisi job terjadwal di app/scheduler.py atau saat on-demand).
+    Tabel baru, dibuat otomatis oleh db.create_all() saat start.
+    last_laporan_id = id Laporan terbaru yang ikut dianalisis; kalau ada
+    Laporan dengan id lebih besar, hasil ini dianggap basi.
+    """
+    __tablename__ = 'weekly_analysis'
+
+    id              = db.Column(db.Integer, primary_key=True)
+    user_id         = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    analysis        = db.Column(db.Text,    nullable=False)
+    tts_text        = db.Column(db.Text,    nullable=False, default='')
+    stats           = db.Column(db.JSON,    nullable=False, default=dict)
+    last_laporan_id = db.Column(db.Integer, nullable=False, default=0)
+    generated_at    = db.Column(db.DateTime(timezone=True), default=now_utc, onupdate=now_utc)
+
+    user = db.relationship('User', backref=db.backref('weekly_analysis', uselist=False), lazy=True)
+
+    def to_dict(self):
+        return {
+            'analysis':     self.analysis,
+            'tts_text':     self.tts_text or '',
+            'stats':        self.stats or {},
+            'generated_at': self.generated_at.strftime('%Y-%m-%dT%H:%M:%S') if self.generated_at else '',
+        }
+
+
+class AIUsageDaily(db.Model):
+    """
+    Tabel: ai_usage_daily — ringkasan pemakaian Gemini per user, per hari
+    (WIB), per endpoint. Diisi app/ai_usage.py setiap panggilan upstream
+    selesai. Beda dengan metrik in-memory, angka ini tahan restart dan
+    dijumlah dari semua worker.
+    """
+    __tablename__ = 'ai_usage_daily'
+
+    id            = db.Column(db.Integer,    primary_key=True)
+    user_id       = db.Column(db.Integer,    db.ForeignKey('users.id'), nullable=False)
+    tanggal       = db.Column(db.Date,       nullable=False)
+    endpoint      = db.Column(db.String(40), nullable=False)
+    calls         = db.Column(db.Integer,    nullable=False, default=0)
+    errors        = db.Column(db.Integer,    nullable=False, default=0)
+    attempts      = db.Column(db.Integer,    nullable=False, default=0)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    output_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    latency_ms    = db.Column(db.BigInteger, nullable=False, default=0)   # total, bagi dengan calls untuk rata-rata
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'tanggal', 'endpoint', name='uq_ai_usage_user_date_endpoint'),)
+
+    def to_dict(self):
+        return {
+            'user_id':        self.user_id,
+            'tanggal':        self.tanggal.isoformat() if self.tanggal else '',
+            'endpoint':       self.endpoint,
+            'calls':          self.calls,
+            'errors':         self.errors,
+            'attempts':       self.attempts,
+            'prompt_tokens':  self.prompt_tokens,
+            'output_tokens':  self.output_tokens,
+            'avg_latency_ms': round(self.latency_ms / self.calls) if self.calls else 0,
+        }
+
+
+class Conversation(db.Model):
+    """
+    Tabel: ai_conversation — memori percakapan server-side per user per
+    channel ('chat' = /api/ai/chat, 'jarvis' = /api/ai/voice-command).
+    turns   = pesan terakhir apa adanya [{role, text}, ...]
+    summary = ringkasan berjalan untuk pesan yang lebih lama (lihat
+              app/conversation_memory.py).
+    """
+    __tablename__ = 'ai_conversation'
+
+    id         = db.Column(db.Integer,    primary_key=True)
+    user_id    = db.Column(db.Integer,    db.ForeignKey('users.id'), nullable=False)
+    channel    = db.Column(db.String(20), nullable=False)
+    summary    = db.Column(db.Text,       nullable=False, default='')
+    turns      = db.Column(db.JSON,       nullable=False, default=list)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_utc, onupdate=now_utc)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'channel', name='uq_conversation_user_channel'),)
+
+    def to_dict(self):
+        return {
+            'channel':    self.channel,
+            'summary':    self.summary or '',
+            'turns':      self.turns or [],
+            'updated_at': self.updated_at.strftime('%Y-%m-%dT%H:%M:%S') if self.updated_at else '',
+        }
+
+
+class CatalogVersion(db.Model):
+    """
+    Tabel: catalog_version — nomor versi data yang di-cache in-memory per
+    worker. Baris 'food' naik setiap admin menambah/mengubah/menghapus
+    makanan master; worker yang versinya beda memuat ulang snapshot
+    katalog (lihat app/food_catalog.py).
+    """
+    __tablename__ = 'catalog_version'
+
+    name       = db.Column(db.String(40), primary_key=True)
+    version    = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_utc, onupdate=now_utc)
+
+
+class DayDataVersion(db.Model):
+    """
+    Tabel: day_data_version — nomor versi data "hari ini" per user (log
+    makan, air, template, streak). Naik setiap ada tulisan; worker yang
+    menyimpan snapshot dengan versi lain membangunnya ulang (lihat
+    app/day_snapshot.py).
+    """
+    __tablename__ = 'day_data_version'
+
+    user_id    = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version    = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=now_utc, onupdate=now_utc)
@@ -0,0 +1,79 @@
+import json
+import base64
+import hashlib
+
+from app.models import db
+
+
+# ─────────────────────────────────────────────────────────
+#  KEYSET PAGINATION (CURSOR)
+# ─────────────────────────────────────────────────────────
+# COUNT(*) + OFFSET (page - 1) * limit makin lambat makin dalam halaman
+# yang di-scroll (DB tetap harus menyusun & membuang semua baris sebelum
+# offset) dan tiap halaman = 2 query. Keyset: halaman berikutnya dimulai
+# SETELAH kunci urutan baris terakhir halaman ini, jadi biayanya sama di
+# halaman 1 maupun 500, dan baris yang ditambah/dihapus di tengah scroll
+# tidak membuat data dobel/loncat.
+#
+# keys = daftar (ekspresi, desc) yang sama persis dengan ORDER BY, dan
+# kombinasinya harus unik (selalu akhiri dengan id). Nilai kunci baris
+# terakhir dibungkus jadi cursor opaque (base64 JSON) + sidik scope, supaya
+# cursor dari pencarian lain ditolak, bukan diam-diam memberi hasil aneh.
+
+
+class InvalidCursorError(ValueError):
+    """Cursor rusak atau dibuat untuk query/scope lain."""
+
+
+def _fingerprint(scope: str) -> str:
+    return hashlib.sha1(scope.encode()).hexdigest()[:10]
+
+
+def encode_cursor(values: list, scope: str) -> str:
+    raw = json.dumps({'k': list(values), 's': _fingerprint(scope)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, scope: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values, fp = data['k'], data['s']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursorError('cursor tidak valid')
+    if fp != _fingerprint(scope) or not isinstance(values, list):
+        raise InvalidCursorError('cursor tidak cocok dengan pencarian ini')
+    # Kunci yang dipakai sekarang semuanya angka (id, rank, panjang nama) —
+    # nilai lain = cursor hasil utak-atik, jangan sampai jadi error SQL.
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        raise InvalidCursorError('cursor tidak valid')
+    return values
+
+
+def keyset_order(keys: list) -> list:
+    return [expr.desc() if desc else expr.asc() for expr, desc in keys]
+
+
+def keyset_after(keys: list, values: list):
+    """WHERE "baris sesudah kunci `values`" untuk urutan `keys` (arah campur boleh)."""
+    if len(values) != len(keys):
+        raise InvalidCursorError('cursor tidak cocok dengan pencarian ini')
+    clauses = []
+    for i, (expr, desc) in enumerate(keys):
+        same = [k == v for (k, _), v in zip(keys[:i], values[:i])]
+        clauses.append(db.and_(*same, expr < values[i] if desc else expr > values[i]))
+    return db.or_(*clauses)
+
+
+def keyset_page(query, keys: list, limit: int, after: list = None) -> tuple:
+    """
+    1 halaman dari query (belum di-order). Return (items, next_values) —
+    next_values None kalau ini halaman terakhir.
+    """
+    limit = max(limit, 1)
+    if after is not None:
+        query = query.filter(keyset_after(keys, after))
+    rows  = query.add_columns(*[expr for expr, _ in keys]).order_by(*keyset_order(keys)).limit(limit + 1).all()
+    items = [row[0] for row in rows[:limit]]
+    if len(rows) <= limit:
+        return items, None
+    return items, list(rows[limit - 1][1:])
@@ -0,0 +1,108 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+
+from app.gemini_client import gemini_client, GeminiHTTPError, GeminiConnectionError
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  CONTEXT CACHING GEMINI UNTUK PREFIX PROMPT STATIS
+# ─────────────────────────────────────────────────────────
+# Instruksi statis (panduan intent, skema JSON, aturan) di-upload SEKALI
+# ke API cachedContents Gemini, lalu tiap generateContent cuma mengirim
+# nama cache-nya + konteks per-user yang kecil. Token prefix yang sudah
+# di-cache ditagih jauh lebih murah dan tidak perlu diproses ulang.
+#
+# Fallback lokal: kalau API caching tidak tersedia (model/versi API tidak
+# mendukung, prompt di bawah minimum token, kuota, dsb), prefix yang sama
+# dikirim inline sebagai system_instruction — teksnya tetap cuma dibangun
+# sekali saat startup, jadi tidak ada f-string raksasa per request.
+
+GEMINI_CONTEXT_CACHE     = os.environ.get('GEMINI_CONTEXT_CACHE', '1') == '1'
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', 3600))
+_REFRESH_MARGIN          = 120    # detik — buat ulang cache sebelum benar-benar kedaluwarsa
+_FAILURE_BACKOFF         = 600    # detik — setelah gagal, pakai fallback inline dulu selama ini
+
+
+class ContextCache:
+    def __init__(self, client=gemini_client):
+        self._client   = client
+        self._lock     = threading.Lock()
+        self._entries  = {}      # (model, api_ver, digest) -> (cache_name, expires_at)
+        self._failed   = {}      # (model, api_ver, digest) -> retry_after
+        self._creating = set()   # key yang cachedContents-nya sedang dibuat thread lain
+
+    @staticmethod
+    def _key(model: str, api_ver: str, static_text: str) -> tuple:
+        return model, api_ver, hashlib.sha256(static_text.encode()).hexdigest()[:16]
+
+    def get_name(self, model: str, api_ver: str, static_text: str, api_key: str,
+                 timeout: float = 20) -> str | None:
+        """
+        Nama cachedContents untuk prefix ini, atau None kalau harus pakai
+        fallback inline. timeout = sisa budget pemanggil untuk POST-nya.
+        """
+        if not GEMINI_CONTEXT_CACHE:
+            return None
+        key = self._key(model, api_ver, static_text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] - _REFRESH_MARGIN > now:
+                return entry[0]
+            if self._failed.get(key, 0) > now:
+                return None
+            # Cuma 1 thread yang membuat cache; request paralel tidak ikut
+            # menunggu POST-nya — pakai nama lama yang masih berlaku, atau
+            # fallback inline.
+            if key in self._creating:
+                return entry[0] if entry and entry[1] > now else None
+            self._creating.add(key)
+
+        # POST di luar lock: upstream lambat tidak menahan request lain.
+        try:
+            created = self._client.post_json(f'/{api_ver}/cachedContents?key={api_key}', {
+                'model':             f'models/{model}',
+                'systemInstruction': {'parts': [{'text': static_text}]},
+                'ttl':               f'{GEMINI_CONTEXT_CACHE_TTL}s',
+            }, timeout=timeout)
+            name = created['name']
+        except (GeminiHTTPError, GeminiConnectionError, KeyError) as e:
+            logger.warning('[ContextCache] cachedContents gagal untuk %s (%s), pakai fallback inline', model, e)
+            with self._lock:
+                self._failed[key] = time.time() + _FAILURE_BACKOFF
+                self._entries.pop(key, None)
+            return None
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+        with self._lock:
+            self._entries[key] = (name, now + GEMINI_CONTEXT_CACHE_TTL)
+        return name
+
+    def invalidate(self, model: str, api_ver: str, static_text: str):
+        """Dipanggil kalau Gemini bilang cache-nya sudah tidak ada (kedaluwarsa / dihapus)."""
+        with self._lock:
+            self._entries.pop(self._key(model, api_ver, static_text), None)
+
+    def build_payload(self, model: str, api_ver: str, static_text: str, api_key: str,
+                      contents: list, generation_config: dict, inline: bool = False,
+                      timeout: float = 20) -> tuple:
+        """
+        Return (payload, used_cache). Pemanggil yang dapat GeminiHTTPError 400/403/404
+        dengan used_cache=True sebaiknya invalidate() lalu kirim ulang payload inline.
+        """
+        name = None if inline else self.get_name(model, api_ver, static_text, api_key, timeout)
+        payload = {'contents': contents, 'generationConfig': generation_config}
+        if name:
+            payload['cachedContent'] = name
+        else:
+            payload['system_instruction'] = {'parts': [{'text': static_text}]}
+        return payload, bool(name)
+
+
+context_cache = ContextCache()
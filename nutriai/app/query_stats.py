@@ -0,0 +1,48 @@
+import os
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+from app.models import db
+from app.ai_metrics import metrics
+
+
+# ─────────────────────────────────────────────────────────
+#  JUMLAH QUERY DB PER REQUEST
+# ─────────────────────────────────────────────────────────
+# Tiap statement SQL yang jalan selama request dihitung, lalu dicatat ke
+# histogram db_queries_per_request{endpoint} (lihat /api/admin/metrics).
+# Berguna untuk menangkap pola N+1 — mis. add_food Jarvis yang dulu
+# mencari tiap item dengan query terpisah.
+#
+# Mati secara default (listener jalan di SETIAP statement):
+#   DB_QUERY_STATS=1  → hitung & catat ke histogram
+#   DB_QUERY_HEADER=1 → juga kirim jumlahnya di header X-DB-Queries
+#                       (untuk benchmark / debugging, jangan di production)
+# Tes jumlah query add_food ada di tests/test_voice_add_food.py.
+
+DB_QUERY_HEADER  = os.environ.get('DB_QUERY_HEADER', '0') == '1'
+DB_QUERY_STATS   = os.environ.get('DB_QUERY_STATS', '0') == '1' or DB_QUERY_HEADER
+QUERY_BUCKETS    = (1, 2, 3, 5, 8, 13, 20, 30, 50, 100)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._db_queries = g.get('_db_queries', 0) + 1
+
+
+def _record_queries(response):
+    n = g.pop('_db_queries', 0)
+    if request.endpoint:
+        metrics.observe('db_queries_per_request', n, buckets=QUERY_BUCKETS, endpoint=request.endpoint)
+    if DB_QUERY_HEADER:
+        response.headers['X-DB-Queries'] = str(n)
+    return response
+
+
+def init_query_stats(app):
+    if not DB_QUERY_STATS:
+        return
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _count_query)
+    app.after_request(_record_queries)
@@ -18,6 +18,11 @@ from app.models import (
     WeightHistory, WaterLog, MealTemplate, MealTemplateItem,
     StreakLog, now_utc, now_wib_date, safe_int, safe_float,
 )
+from app.day_snapshot import invalidate_day_snapshot
+from app.food_search import food_search_filter, food_search_order, food_cursor_page, catalog_food_page
+from app.pagination import InvalidCursorError
+from app.food_catalog import FOOD_CATALOG_CACHE, visible_food, find_visible_by_name
+from app.food_autocomplete import autocomplete, food_autocomplete
 
 main_bp = Blueprint('main', __name__)
 logger  = logging.getLogger('nutriai.security')
@@ -151,6 +156,7 @@ def record_streak(user_id: int, tanggal):
         if not StreakLog.query.filter_by(user_id=user_id, tanggal=tanggal).first():
             db.session.add(StreakLog(user_id=user_id, tanggal=tanggal))
             db.session.commit()
+            invalidate_day_snapshot(user_id)
     except Exception:
         db.session.rollback()
 
@@ -465,23 +471,36 @@ def update_profile_picture():
 @main_bp.route('/api/foods', methods=['GET'])
 @jwt_required()
 def get_foods():
-    user  = get_current_user()
-    q     = request.args.get('q', '').strip()
-    page  = max(int(request.args.get('page',  1)), 1)
-    limit = min(int(request.args.get('limit', 20)), 100)
+    user       = get_current_user()
+    q          = request.args.get('q', '').strip()
+    page       = max(int(request.args.get('page',  1)), 1)
+    limit      = min(int(request.args.get('limit', 20)), 100)
+    # cursor=... (kosong = halaman pertama) → keyset pagination, tanpa COUNT
+    # kecuali with_total=1. Tanpa cursor → page/limit lama (app versi lama).
+    cursor     = request.args.get('cursor')
+    with_total = request.args.get('with_total') == '1'
 
     # Tampilkan makanan global (user_id NULL, dilihat semua orang) DAN
     # makanan pribadi milik user yang login sendiri — tidak menampilkan
-    # makanan pribadi milik user lain.
-    query = Food.query.filter(
-        Food.deleted_at.is_(None),
-        db.or_(Food.user_id.is_(None), Food.user_id == user.id),
-    )
-    if q:
-        query = query.filter(Food.nama_makanan.ilike(f'%{q}%'))
+    # makanan pribadi milik user lain. Global dibaca dari snapshot katalog
+    # in-memory (app/food_catalog.py), pribadi dari DB.
+    try:
+        if FOOD_CATALOG_CACHE:
+            return jsonify(catalog_food_page(user.id, q, limit, page, cursor, with_total)), 200
+
+        query = Food.query.filter(
+            Food.deleted_at.is_(None),
+            db.or_(Food.user_id.is_(None), Food.user_id == user.id),
+        )
+        if q:
+            query = query.filter(food_search_filter(q))
+        if cursor is not None:
+            return jsonify(food_cursor_page(query, q, limit, cursor, f'foods:{user.id}', with_total)), 200
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
 
     total = query.count()
-    foods = query.order_by(Food.id.desc()).offset((page - 1) * limit).limit(limit).all()
+    foods = query.order_by(*food_search_order(q)).offset((page - 1) * limit).limit(limit).all()
 
     return jsonify({
         'data':        [f.to_dict() for f in foods],
@@ -492,6 +511,16 @@ def get_foods():
     }), 200
 
 
+@main_bp.route('/api/foods/autocomplete', methods=['GET'])
+@jwt_required()
+def autocomplete_foods():
+    # Dipanggil tiap ketikan di kotak pencarian: cuma id, nama & kalori dari
+    # index awalan in-memory (app/food_autocomplete.py), tanpa COUNT/to_dict.
+    user  = get_current_user()
+    limit = safe_int(request.args.get('limit'), 10)
+    return jsonify({'data': autocomplete(user.id, request.args.get('q', ''), limit)}), 200
+
+
 @main_bp.route('/api/foods', methods=['POST'])
 @jwt_required()
 def add_food():
@@ -504,11 +533,7 @@ def add_food():
     # sendiri) — jangan blokir gara-gara nama yang sama persis kebetulan
     # dipakai user lain di makanan pribadi mereka (yang tidak kelihatan
     # olehnya juga, jadi pesan "sudah ada" akan membingungkan).
-    existing = Food.query.filter(
-        Food.nama_makanan.ilike(nama_makanan),
-        Food.deleted_at.is_(None),
-        db.or_(Food.user_id.is_(None), Food.user_id == user.id),
-    ).first()
+    existing = find_visible_by_name(user.id, nama_makanan)
     if existing:
         return jsonify({'error': 'Makanan dengan nama ini sudah ada di database'}), 409
 
@@ -540,6 +565,7 @@ def add_food():
     )
     db.session.add(food)
     db.session.commit()
+    food_autocomplete.invalidate_user(user.id)
     return jsonify(food.to_dict()), 201
 
 
@@ -576,6 +602,7 @@ def update_food(food_id):
                 food.image = new_url
 
     db.session.commit()
+    food_autocomplete.invalidate_user(user.id)
     return jsonify(food.to_dict()), 200
 
 
@@ -592,6 +619,7 @@ def delete_food(food_id):
 
     food.deleted_at = now_utc()
     db.session.commit()
+    food_autocomplete.invalidate_user(user.id)
     return jsonify({'status': 'success'}), 200
 
 
@@ -709,6 +737,7 @@ def submit_daily():
         added += 1
 
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     record_streak(user.id, today)
     return jsonify({'status': 'success', 'added': added}), 200
 
@@ -732,6 +761,7 @@ def delete_daily(waktu_makan_id):
     if food:
         db.session.delete(food)
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify({'status': 'success'}), 200
 
 
@@ -753,6 +783,7 @@ def edit_daily(waktu_makan_id):
         entry.catatan = data['catatan']
 
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify(entry.to_dict()), 200
 
 
@@ -927,6 +958,7 @@ def reset_and_report():
         db.session.delete(w)
 
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify({'status': 'success', 'laporan': laporan.to_dict()}), 200
 
 
@@ -1019,6 +1051,7 @@ def add_water():
 
     db.session.add(WaterLog(user_id=user.id, jumlah_ml=int(ml)))
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify({'status': 'success', 'ml': int(ml)}), 201
 
 
@@ -1068,11 +1101,7 @@ def create_template():
         # OWNERSHIP FIX: sebelumnya bisa pakai food_id milik siapa saja
         # (termasuk makanan pribadi user lain yang seharusnya tidak
         # kelihatan). Sekarang dibatasi ke makanan yang memang bisa dia lihat.
-        food = Food.query.filter(
-            Food.id == item.get('food_id'),
-            Food.deleted_at.is_(None),
-            db.or_(Food.user_id.is_(None), Food.user_id == user.id),
-        ).first()
+        food = visible_food(user.id, item.get('food_id'))
         if food:
             db.session.add(MealTemplateItem(
                 template_id=template.id, food_id=food.id,
@@ -1080,6 +1109,7 @@ def create_template():
             ))
 
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify(template.to_dict()), 201
 
 
@@ -1099,6 +1129,7 @@ def delete_template(template_id):
 
     db.session.delete(template)
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     return jsonify({'status': 'success'}), 200
 
 
@@ -1127,18 +1158,11 @@ def use_template(template_id):
         src   = titem.food
         porsi = titem.porsi or 1
 
-        # FIX: Food model tidak punya kolom 'porsi' — sebelumnya dikirim ke
-        # sini dan menyebabkan TypeError setiap kali template dipakai.
-        food_log = Food(
-            nama_makanan = src.nama_makanan,
-            protein      = (src.protein or 0) * porsi,
-            kalori       = (src.kalori  or 0) * porsi,
-            karbo        = (src.karbo   or 0) * porsi,
-            lemak        = (src.lemak   or 0) * porsi,
-            image        = src.image or '',
-        )
-        db.session.add(food_log)
-        db.session.flush()
+        # FIX: dulu di sini dibuat baris Food BARU (user_id NULL = makanan
+        # global!) untuk setiap item tiap kali template dipakai — katalog
+        # global bertambah sampah yang terlihat semua user, di luar CRUD
+        # admin. food_id sekarang langsung menunjuk makanan sumbernya, sama
+        # seperti use_template di Jarvis (ai_routes.py).
 
         # FIX: WaktuMakan sebelumnya dibuat tanpa 'user_id' (kolom wajib) dan
         # tanpa nilai nutrisi denormalized (protein/kalori/karbo/lemak/porsi),
@@ -1147,7 +1171,7 @@ def use_template(template_id):
         db.session.add(WaktuMakan(
             user_id      = user.id,
             waktu_makan  = waktu_makan,
-            food_id      = food_log.id,
+            food_id      = src.id,
             nama_makanan = src.nama_makanan,
             protein      = (src.protein or 0) * porsi,
             kalori       = (src.kalori  or 0) * porsi,
@@ -1159,5 +1183,6 @@ def use_template(template_id):
         added += 1
 
     db.session.commit()
+    invalidate_day_snapshot(user.id)
     record_streak(user.id, today)
     return jsonify({'status': 'success', 'added': added}), 200
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import time
+import fcntl
+import logging
+from datetime import timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from app.models import db, User, Laporan, WeeklyAnalysis, WIB, now_utc
+from app.ai_gateway import AIGatewayBusy
+from app.upstream_policy import CircuitOpenError
+
+logger = logging.getLogger('nutriai.scheduler')
+
+
+# ─────────────────────────────────────────────────────────
+#  JOB TERJADWAL (APScheduler)
+# ─────────────────────────────────────────────────────────
+# Analisis mingguan disiapkan tiap malam (jam sepi, WIB) untuk user yang
+# punya Laporan baru sejak analisis terakhirnya, supaya
+# /api/ai/weekly-analysis tinggal menyajikan hasil tersimpan.
+# Dijalankan dalam batch kecil dengan jeda antar panggilan — job ini tidak
+# boleh menghabiskan kuota Gemini / slot ai_gateway milik request interaktif.
+#
+# Gunicorn menjalankan beberapa worker: hanya proses yang berhasil memegang
+# file lock SCHEDULER_LOCK_FILE yang menjalankan scheduler (1 per mesin).
+
+SCHEDULER_ENABLED      = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+SCHEDULER_LOCK_FILE    = os.environ.get('SCHEDULER_LOCK_FILE', '/tmp/nutriai-scheduler.lock')
+WEEKLY_ANALYSIS_HOUR   = int(os.environ.get('WEEKLY_ANALYSIS_HOUR', 2))          # jam WIB
+WEEKLY_ANALYSIS_BATCH  = int(os.environ.get('WEEKLY_ANALYSIS_BATCH', 20))
+WEEKLY_ANALYSIS_RPM    = float(os.environ.get('WEEKLY_ANALYSIS_RPM', 10))        # panggilan Gemini / menit
+WEEKLY_ANALYSIS_PAUSE  = float(os.environ.get('WEEKLY_ANALYSIS_BATCH_PAUSE', 60))  # detik antar batch
+
+_scheduler = None
+_lock_fd   = None
+
+
+def stale_weekly_user_ids() -> list:
+    """User dengan Laporan 7 hari terakhir yang analisisnya belum ada / basi."""
+    latest = db.session.query(
+        Laporan.user_id, db.func.max(Laporan.id).label('latest_id'),
+    ).filter(
+        Laporan.tanggal >= now_utc() - timedelta(days=7),
+    ).group_by(Laporan.user_id).subquery()
+
+    rows = db.session.query(latest.c.user_id).outerjoin(
+        WeeklyAnalysis, WeeklyAnalysis.user_id == latest.c.user_id,
+    ).filter(
+        db.or_(WeeklyAnalysis.id.is_(None), WeeklyAnalysis.last_laporan_id < latest.c.latest_id),
+    ).order_by(latest.c.user_id).all()
+    return [r[0] for r in rows]
+
+
+def precompute_weekly_analyses(app):
+    # Import di sini: app.ai_routes ikut mengimpor banyak modul, dan job ini
+    # baru jalan jauh setelah app selesai dibuat.
+    from app.ai_routes import refresh_weekly_analysis
+
+    with app.app_context():
+        user_ids = stale_weekly_user_ids()
+        logger.info('[Scheduler] weekly-analysis: %d user perlu diperbarui', len(user_ids))
+        done = failed = 0
+        for start in range(0, len(user_ids), WEEKLY_ANALYSIS_BATCH):
+            if start:
+                time.sleep(WEEKLY_ANALYSIS_PAUSE)
+            for user_id in user_ids[start:start + WEEKLY_ANALYSIS_BATCH]:
+                user = db.session.get(User, user_id)
+                if not user or user.deleted_at:
+                    continue
+                try:
+                    refresh_weekly_analysis(user)
+                    done += 1
+                except CircuitOpenError:
+                    logger.warning('[Scheduler] Gemini sedang down, sisa %d user ditunda ke run berikutnya',
+                                   len(user_ids) - done - failed)
+                    return
+                except AIGatewayBusy:
+                    failed += 1   # slot dipakai request interaktif — coba lagi run berikutnya
+                except Exception as e:
+                    db.session.rollback()
+                    failed += 1
+                    logger.error('[Scheduler] weekly-analysis user=%s gagal: %s', user_id, e)
+                finally:
+                    db.session.remove()
+                time.sleep(60 / WEEKLY_ANALYSIS_RPM)
+        logger.info('[Scheduler] weekly-analysis selesai: %d ok, %d gagal', done, failed)
+
+
+def _acquire_lock() -> bool:
+    global _lock_fd
+    try:
+        _lock_fd = open(SCHEDULER_LOCK_FILE, 'w')
+        fcntl.flock(_lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        if _lock_fd:
+            _lock_fd.close()
+        _lock_fd = None
+        return False
+
+
+def init_scheduler(app):
+    """Start scheduler background (sekali per mesin). Dipanggil dari main.py."""
+    global _scheduler
+    if not SCHEDULER_ENABLED or _scheduler is not None:
+        return None
+    if not _acquire_lock():
+        logger.info('[Scheduler] sudah jalan di proses lain, skip')
+        return None
+
+    _scheduler = BackgroundScheduler(timezone=WIB, daemon=True)
+    _scheduler.add_job(
+        precompute_weekly_analyses, 'cron', args=[app],
+        id='weekly_analysis', hour=WEEKLY_ANALYSIS_HOUR, minute=0,
+        max_instances=1, coalesce=True, misfire_grace_time=3600,
+    )
+    _scheduler.start()
+    logger.info('[Scheduler] aktif — weekly-analysis tiap jam %02d:00 WIB', WEEKLY_ANALYSIS_HOUR)
+    return _scheduler
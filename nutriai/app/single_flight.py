@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+
+from app.ai_gateway import AIUserBusy, AI_QUEUE_TIMEOUT
+
+
+# ─────────────────────────────────────────────────────────
+#  SINGLE-FLIGHT (gabungkan request AI identik yang sedang jalan)
+# ─────────────────────────────────────────────────────────
+# App mobile me-retry request yang kena timeout di sisi client, padahal
+# request pertama masih menunggu Gemini di server. Tanpa ini retry-nya ikut
+# memanggil Gemini lagi (biaya dobel) dan action Jarvis (add_food,
+# add_water, ...) bisa tercatat dua kali.
+#
+# Request dengan key sama (user, endpoint, input yang dinormalisasi) yang
+# datang saat request pertama masih jalan cukup MENUNGGU hasil request
+# pertama. Hasil sukses juga disimpan sebentar (AI_DEDUPE_WINDOW detik)
+# untuk retry yang datang tepat setelah request pertama selesai.
+# Hasil gagal tidak disimpan — retry setelah error tetap dicoba ulang.
+#
+# Request yang menunggu tidak memegang slot ai_gateway, jadi tidak boleh
+# menunggu lebih lama dari antrean gateway (AI_QUEUE_TIMEOUT): lewat dari
+# itu dijawab 429 seperti request yang tidak kebagian slot. Retry-After-nya
+# lebih pendek dari AI_DEDUPE_WINDOW, jadi retry berikutnya masih sempat
+# memakai hasil request pertama (action Jarvis tetap tidak dobel).
+#
+# Per proses (seperti ai_gateway): retry yang kebetulan masuk ke worker
+# gunicorn lain tidak ikut tergabung.
+
+AI_DEDUPE_WINDOW = float(os.environ.get('AI_DEDUPE_WINDOW', 5))
+
+
+class DuplicateInFlight(AIUserBusy):
+    """Request identik milik user ini masih diproses."""
+    retry_after = 2
+
+
+class _Flight:
+    __slots__ = ('event', 'result', 'error', 'done_at')
+
+    def __init__(self):
+        self.event   = threading.Event()
+        self.result  = None
+        self.error   = None
+        self.done_at = None
+
+
+class SingleFlight:
+    def __init__(self, window: float = AI_DEDUPE_WINDOW, wait_timeout: float = AI_QUEUE_TIMEOUT):
+        self.window       = window
+        self.wait_timeout = wait_timeout
+        self._flights     = {}
+        self._lock        = threading.Lock()
+
+    def _prune(self, now: float):
+        expired = [k for k, f in self._flights.items() if f.done_at is not None and now - f.done_at >= self.window]
+        for k in expired:
+            del self._flights[k]
+
+    def do(self, key, fn, remember=None) -> tuple:
+        """
+        Jalankan fn() sekali untuk key ini. Return (hasil, shared) — shared=True
+        kalau hasilnya milik request lain. remember(hasil) → False supaya hasil
+        itu tidak disimpan untuk retry berikutnya.
+        """
+        with self._lock:
+            self._prune(time.monotonic())
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                raise DuplicateInFlight('Permintaan yang sama masih diproses, coba lagi sebentar lagi')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        keep = False
+        try:
+            flight.result = fn()
+            keep          = self.window > 0 and (remember is None or remember(flight.result))
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.done_at = time.monotonic()
+                if not keep and self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
+
+
+ai_single_flight = SingleFlight()
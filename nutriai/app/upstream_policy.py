@@ -0,0 +1,203 @@
+import os
+import time
+import random
+import logging
+import threading
+
+from app.gemini_client import GeminiHTTPError, GeminiConnectionError, GEMINI_TIMEOUT
+from app.ai_metrics import metrics
+
+logger = logging.getLogger('nutriai.ai')
+
+
+# ─────────────────────────────────────────────────────────
+#  KEBIJAKAN PANGGILAN UPSTREAM AI (retry + deadline + circuit breaker)
+# ─────────────────────────────────────────────────────────
+# Satu kebijakan untuk SEMUA panggilan Gemini (call_gemini, Jarvis, stream):
+#   - Deadline total per request (AI_UPSTREAM_DEADLINE): semua percobaan +
+#     jeda retry harus muat di sini. Timeout tiap percobaan ikut dipotong
+#     ke sisa budget, jadi 1 request tidak bisa lagi makan >3 menit.
+#   - Backoff eksponensial dengan full jitter: jeda = acak(0, min(cap, base·2^n)),
+#     supaya retry dari banyak request tidak serentak menghantam Gemini.
+#   - 429 dengan header Retry-After: tunggu sesuai header kalau masih muat
+#     di budget; kalau tidak muat, langsung menyerah (tidak ada gunanya).
+#   - Circuit breaker bersama (per proses): setelah AI_BREAKER_THRESHOLD
+#     request berturut-turut gagal (retry-nya sudah habis), breaker OPEN
+#     dan semua panggilan langsung gagal (CircuitOpenError) selama
+#     AI_BREAKER_COOLDOWN detik; endpoint menjawab versi "degraded" tanpa
+#     menunggu. Setelah itu 1 request percobaan (half-open) menentukan
+#     breaker tutup lagi atau tidak.
+# Error 4xx selain 429 bukan salah upstream: tidak di-retry dan tidak
+# dihitung breaker.
+
+AI_UPSTREAM_DEADLINE  = float(os.environ.get('AI_UPSTREAM_DEADLINE', 60))
+AI_RETRY_ATTEMPTS     = int(os.environ.get('AI_RETRY_ATTEMPTS', 3))
+AI_RETRY_BASE         = float(os.environ.get('AI_RETRY_BASE', 1))
+AI_RETRY_CAP          = float(os.environ.get('AI_RETRY_CAP', 10))
+AI_BREAKER_THRESHOLD  = int(os.environ.get('AI_BREAKER_THRESHOLD', 5))
+AI_BREAKER_COOLDOWN   = float(os.environ.get('AI_BREAKER_COOLDOWN', 30))
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+# Percobaan dengan sisa waktu kurang dari ini tidak akan sempat selesai.
+MIN_ATTEMPT_SECONDS = 3
+
+
+class CircuitOpenError(RuntimeError):
+    """Breaker sedang OPEN — Gemini dianggap down, panggilan tidak dikirim."""
+
+
+class DeadlineExhaustedError(GeminiConnectionError):
+    """Sisa deadline < MIN_ATTEMPT_SECONDS — percobaan tidak dikirim sama sekali."""
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, GeminiConnectionError):
+        return True
+    return isinstance(exc, GeminiHTTPError) and exc.code in RETRYABLE_STATUS
+
+
+def retry_after_seconds(exc: Exception) -> float | None:
+    """Nilai header Retry-After (detik) dari response 429, kalau ada."""
+    if not isinstance(exc, GeminiHTTPError) or exc.code != 429:
+        return None
+    for k, v in exc.headers.items():
+        if k.lower() == 'retry-after':
+            try:
+                return max(float(v), 0)
+            except (TypeError, ValueError):
+                return None   # format HTTP-date tidak dipakai Gemini
+    return None
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, threshold: int = AI_BREAKER_THRESHOLD, cooldown: float = AI_BREAKER_COOLDOWN):
+        self.name       = name
+        self.threshold  = threshold
+        self.cooldown   = cooldown
+        self._state     = self.CLOSED
+        self._failures  = 0
+        self._opened_at = 0.0
+        self._probing   = False
+        self._lock      = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Boleh kirim panggilan? Saat half-open cuma 1 panggilan percobaan yang lolos."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info('[Breaker:%s] upstream pulih, breaker CLOSED', self.name)
+            self._state    = self.CLOSED
+            self._failures = 0
+            self._probing  = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing   = False
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.threshold):
+                self._state     = self.OPEN
+                self._opened_at = time.monotonic()
+                metrics.inc('ai_breaker_opened_total', breaker=self.name)
+                logger.warning('[Breaker:%s] %d kegagalan berturut-turut, breaker OPEN %gs',
+                               self.name, self._failures, self.cooldown)
+
+    def release_probe(self):
+        """Panggilan percobaan berakhir tanpa vonis (mis. error 4xx dari request itu sendiri)."""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                'name':                 self.name,
+                'state':                state,
+                'consecutive_failures': self._failures,
+                'open_for_seconds':     round(time.monotonic() - self._opened_at, 1) if state != self.CLOSED else 0,
+                'threshold':            self.threshold,
+                'cooldown':             self.cooldown,
+            }
+
+
+class RetryPolicy:
+    def __init__(self, breaker: CircuitBreaker, attempts: int = AI_RETRY_ATTEMPTS,
+                 deadline: float = AI_UPSTREAM_DEADLINE, base: float = AI_RETRY_BASE, cap: float = AI_RETRY_CAP):
+        self.breaker  = breaker
+        self.attempts = attempts
+        self.deadline = deadline
+        self.base     = base
+        self.cap      = cap
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+    def call(self, fn, deadline: float = None):
+        """
+        Panggil fn(timeout) sesuai kebijakan; timeout = sisa budget untuk 1
+        percobaan. Return hasil fn, atau raise error terakhir dari upstream.
+        """
+        if not self.breaker.allow():
+            metrics.inc('ai_breaker_rejected_total', breaker=self.breaker.name)
+            raise CircuitOpenError('Layanan AI sedang gangguan, coba lagi beberapa saat lagi')
+
+        end = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(self.attempts):
+            remaining = end - time.monotonic()
+            if remaining < MIN_ATTEMPT_SECONDS:
+                # Budget habis (mis. jeda retry molor, atau sisa deadline dari
+                # pemanggil memang kecil) — jangan mulai percobaan yang pasti
+                # melewati deadline. Bukan vonis untuk upstream.
+                self.breaker.release_probe()
+                metrics.inc('ai_deadline_exhausted_total')
+                raise DeadlineExhaustedError(f'deadline habis ({remaining:.1f}s tersisa), percobaan tidak dimulai')
+            try:
+                result = fn(min(GEMINI_TIMEOUT, remaining))
+            except (GeminiHTTPError, GeminiConnectionError) as e:
+                if not is_retryable(e):
+                    self.breaker.release_probe()
+                    raise
+
+                wait      = retry_after_seconds(e)
+                wait      = self.backoff(attempt) if wait is None else wait
+                remaining = end - time.monotonic()
+                if (attempt == self.attempts - 1 or remaining - wait < MIN_ATTEMPT_SECONDS
+                        or not self.breaker.allow()):
+                    # Breaker menghitung REQUEST yang gagal, bukan tiap
+                    # percobaan — kalau tidak, 2 request yang masing-masing
+                    # retry 3× sudah cukup membuka breaker.
+                    self.breaker.record_failure()
+                    raise
+                metrics.inc('ai_upstream_retries_total', reason=str(getattr(e, 'code', 'connection')))
+                logger.info('[Retry] percobaan %d gagal (%s), ulang dalam %.1fs', attempt + 1, e, wait)
+                time.sleep(wait)
+                continue
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+gemini_breaker = CircuitBreaker('gemini')
+gemini_policy  = RetryPolicy(gemini_breaker)
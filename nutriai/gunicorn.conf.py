@@ -0,0 +1,20 @@
+import os
+
+# ─────────────────────────────────────────────────────────
+#  KONFIGURASI GUNICORN (dibaca otomatis dari working directory)
+# ─────────────────────────────────────────────────────────
+# Worker 'gthread': tiap proses melayani banyak request paralel lewat
+# thread. Panggilan Gemini yang lambat cuma memakan maksimal
+# AI_MAX_INFLIGHT thread per proses (lihat app/ai_gateway.py), jadi
+# selalu ada thread sisa untuk endpoint non-AI seperti /api/dashboard.
+# Dengan worker 'sync' (default gunicorn), 1 request AI yang lagi nunggu
+# retry Gemini = 1 worker full terblokir.
+
+bind         = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers      = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads      = int(os.environ.get('GUNICORN_THREADS', 16))
+# Harus lebih besar dari AI_REQUEST_DEADLINE, kalau tidak worker bisa
+# di-kill gunicorn duluan saat AI masih dalam batas waktunya.
+timeout      = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive    = 5
@@ -13,6 +13,10 @@ from app.models import db
 from app.routes import main_bp
 from app.ai_routes import ai_bp
 from app.admin_routes import admin_bp
+from app.scheduler import init_scheduler
+from app.query_stats import init_query_stats
+from app.food_search import init_food_search
+from app.food_catalog import init_food_catalog
 
 
 # ─────────────────────────────────────────────────────────
@@ -64,6 +68,37 @@ with app.app_context():
     print("Database ready ✓")
 
 
+# ─────────────────────────────────────────────────────────
+#  STATISTIK QUERY
+#  Jumlah query DB per request → /api/admin/metrics (DB_QUERY_STATS=1).
+#  Lihat app/query_stats.py.
+# ─────────────────────────────────────────────────────────
+init_query_stats(app)
+
+
+# ─────────────────────────────────────────────────────────
+#  INDEX PENCARIAN MAKANAN
+#  pg_trgm + index GIN lower(nama_makanan) untuk /api/foods?q=.
+#  Lihat app/food_search.py.
+# ─────────────────────────────────────────────────────────
+init_food_search(app)
+
+
+# ─────────────────────────────────────────────────────────
+#  KATALOG MAKANAN GLOBAL (snapshot in-memory per worker)
+#  Lihat app/food_catalog.py.
+# ─────────────────────────────────────────────────────────
+init_food_catalog(app)
+
+
+# ─────────────────────────────────────────────────────────
+#  SCHEDULER
+#  Job background (analisis mingguan tiap malam). Matikan dengan
+#  SCHEDULER_ENABLED=0 — lihat app/scheduler.py.
+# ─────────────────────────────────────────────────────────
+init_scheduler(app)
+
+
 # ─────────────────────────────────────────────────────────
 #  ERROR HANDLERS
 # ─────────────────────────────────────────────────────────
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, 'tools'))
+
+from gemini_standin import start_standin   # noqa: E402
+
+
+# ─────────────────────────────────────────────────────────
+#  APP TES: SQLite sementara + Gemini stand-in (tools/gemini_standin.py)
+# ─────────────────────────────────────────────────────────
+# Env harus diisi SEBELUM main diimpor (config dibaca di level modul).
+ADMIN_KEY = 'test-admin-key'
+UPSTREAM  = start_standin()
+DB_FILE   = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+
+os.environ.update(
+    DATABASE_URL        = f'sqlite:///{DB_FILE}',
+    JWT_SECRET_KEY      = 'test-secret-test-secret-test-secret',
+    GEMINI_API_KEY      = 'test-key',
+    GEMINI_BASE_URL     = UPSTREAM.base_url,
+    ADMIN_SECRET_KEY    = ADMIN_KEY,
+    AI_IMAGE_CACHE_SIZE = '0',
+    AI_IMAGE_CACHE_DIR  = '',
+    SCHEDULER_ENABLED   = '0',
+)
+
+
+@pytest.fixture(scope='session')
+def app():
+    import main
+    yield main.app
+    UPSTREAM.shutdown()
+    os.unlink(DB_FILE)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def standin():
+    """Stand-in Gemini; tes boleh menyisipkan fixture balasan sendiri di depan."""
+    fixtures = list(UPSTREAM.standin.fixtures)
+    yield UPSTREAM.standin
+    UPSTREAM.standin.fixtures = fixtures
+
+
+@pytest.fixture
+def register(client):
+    """register(username) → header Authorization user baru."""
+    def _register(username):
+        r = client.post('/api/register', json={
+            'username': username, 'password': 'abcdefg1', 'umur': 25, 'tb': 170, 'bb': 65,
+            'gender': 'laki_laki', 'aktivitas': 'aktivitas_sedang', 'tujuan': 'maintain',
+            'body_type': 'mesomorph',
+        })
+        assert r.status_code == 201, r.get_json()
+        return {'Authorization': 'Bearer ' + r.get_json()['token']}
+    return _register
@@ -0,0 +1,51 @@
+import pytest
+
+from app import ai_cache
+from app.ai_cache import LRUTTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Jam palsu untuk ai_cache: clock.now bisa dimajukan manual."""
+    class Clock:
+        now = 1_000_000.0
+    monkeypatch.setattr(ai_cache.time, 'time', lambda: Clock.now)
+    return Clock
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = LRUTTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1      # 'a' jadi yang terbaru dipakai
+    cache.set('c', 3)               # → 'b' yang dibuang
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    cache.set('a', {'kalori': 100})
+    clock.now += 59
+    assert cache.get('a') == {'kalori': 100}
+    clock.now += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_disk_tier_survives_memory_eviction_until_ttl(clock, tmp_path):
+    cache = LRUTTLCache(maxsize=1, ttl=60, disk_dir=str(tmp_path))
+    cache.set('aa11', 1)
+    cache.set('bb22', 2)            # 'aa11' keluar dari memori, masih ada di disk
+    assert cache.get('aa11') == 1
+    clock.now += 61
+    assert cache.get('aa11') is None
+    assert not (tmp_path / 'aa' / 'aa11.json').exists()
+
+
+def test_zero_size_disables_memory_tier(clock):
+    cache = LRUTTLCache(maxsize=0, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
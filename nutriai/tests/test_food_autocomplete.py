@@ -0,0 +1,94 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app import food_autocomplete
+from app.food_autocomplete import PrefixIndex, AUTOCOMPLETE_MAX, _suffixes
+from app.food_matcher import normalize_name
+
+
+WORDS   = ['nasi', 'ayam', 'goreng', 'bakar', 'sop', 'es', 'teh', 'manis', 'rica', 'tempe',
+           'tahu', 'sambal', 'mie', 'kuah', 'telur', 'sate', 'bakso', 'soto']
+QUERIES = ['n', 'na', 'nasi', 'nasi a', 'a', 'ay', 'ayam', 'ayam g', 's', 'so', 'sop', 'g',
+           'go', 'goreng', 'es', 'es t', 'x', 'ri', 'rica r', 'te', 'tel', 'b', 'bak']
+
+
+@pytest.fixture(autouse=True)
+def small_scan_limit(monkeypatch):
+    # Katalog tes kecil — turunkan batas scan supaya jalur top-N ikut teruji.
+    monkeypatch.setattr(food_autocomplete, '_SCAN_LIMIT', 8)
+
+
+def _food(fid: int, nama: str):
+    return SimpleNamespace(id=fid, nama_makanan=nama, kalori=fid)
+
+
+def _random_name(rnd: random.Random) -> str:
+    name = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3)))
+    return name.title() if rnd.random() < 0.5 else name
+
+
+def _brute(foods: dict, q: str, limit: int) -> list:
+    found = []
+    for f in foods.values():
+        name = normalize_name(f.nama_makanan)
+        if any(k.startswith(q) for k in _suffixes(name)):
+            rank = 0 if name == q else 1 if name.startswith(q) else 2
+            found.append(((rank, len(name), -f.id), f.id))
+    return sorted(found)[:limit]
+
+
+def _assert_same(patched: PrefixIndex, full: PrefixIndex):
+    assert patched.names   == full.names
+    assert patched.items   == full.items
+    assert patched.entries == full.entries
+    assert patched.top     == full.top
+
+
+def test_search_matches_brute_force():
+    rnd   = random.Random(7)
+    foods = {i: _food(i, _random_name(rnd)) for i in range(1, 400)}
+    index = PrefixIndex(foods.values())
+    assert index.top   # jalur top-N benar-benar terpakai
+    for q in QUERIES:
+        for limit in (5, AUTOCOMPLETE_MAX):
+            assert index.search(q, limit) == _brute(foods, q, limit), q
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_patched_equals_full_rebuild(seed):
+    rnd   = random.Random(seed)
+    foods = {i: _food(i, _random_name(rnd)) for i in range(1, 600)}
+    index = PrefixIndex(foods.values())
+
+    for _ in range(3):   # patch berturut-turut di atas hasil patch sebelumnya
+        foods = dict(foods)
+        for fid in rnd.sample(sorted(foods), 10):                 # dihapus
+            del foods[fid]
+        for fid in rnd.sample(sorted(foods), 10):                 # diganti nama
+            foods[fid] = _food(fid, _random_name(rnd))
+        for _ in range(10):                                       # ditambah
+            fid        = max(foods) + 1
+            foods[fid] = _food(fid, _random_name(rnd))
+
+        patched = index.patched(foods)
+        assert patched is not None
+        _assert_same(patched, PrefixIndex(foods.values()))
+        for q in QUERIES:
+            assert patched.search(q, AUTOCOMPLETE_MAX) == _brute(foods, q, AUTOCOMPLETE_MAX), q
+        index = patched
+
+
+def test_patched_uses_snapshot_normalized_names():
+    foods = {1: _food(1, 'Nasi Goreng'), 2: _food(2, 'Es Teh')}
+    index = PrefixIndex(foods.values())
+    foods = {**foods, 3: _food(3, 'Crème Brûlée')}
+    norm  = {fid: normalize_name(f.nama_makanan) for fid, f in foods.items()}
+    _assert_same(index.patched(foods, norm), PrefixIndex(foods.values(), norm))
+
+
+def test_large_change_falls_back_to_full_rebuild():
+    foods = {i: _food(i, f'nasi {i}') for i in range(1, 300)}
+    index = PrefixIndex(foods.values())
+    assert index.patched({i: _food(i, f'ayam {i}') for i in foods}) is None
@@ -0,0 +1,67 @@
+import pytest
+
+from app import routes
+from app.models import db, Food, User
+from app.food_catalog import food_catalog
+from conftest import ADMIN_KEY
+
+
+Q = 'kerupuk uji'
+
+# Sengaja banyak seri: nama sama persis (rank & panjang sama, beda id
+# saja), nama beda dengan panjang sama, dan makanan pribadi yang namanya
+# sama dengan makanan global.
+GLOBAL_NAMES  = ['Kerupuk Uji', 'Kerupuk Uji', 'Kerupuk Uji A', 'Kerupuk Uji B', 'Kerupuk Uji A',
+                 'Kerupuk Uji C', 'Sambal Kerupuk Uji', 'Sambal Kerupuk Uji', 'Nasikerupuk Uji']
+PRIVATE_NAMES = ['Kerupuk Uji', 'Kerupuk Uji B', 'Sambal Kerupuk Uji']
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    client  = app.test_client()
+    r       = client.post('/api/register', json={
+        'username': 'keyset_user', 'password': 'abcdefg1', 'umur': 25, 'tb': 170, 'bb': 65,
+        'gender': 'laki_laki', 'aktivitas': 'aktivitas_sedang', 'tujuan': 'maintain', 'body_type': 'mesomorph',
+    })
+    headers = {'Authorization': 'Bearer ' + r.get_json()['token']}
+    with app.app_context():
+        user_id = User.query.filter_by(username='keyset_user').one().id
+        db.session.add_all([Food(nama_makanan=n, kalori=100, protein=5) for n in GLOBAL_NAMES])
+        db.session.add_all([Food(user_id=user_id, nama_makanan=n, kalori=100, protein=5) for n in PRIVATE_NAMES])
+        db.session.commit()
+    food_catalog.invalidate()
+    return headers
+
+
+def _walk(client, url: str, headers: dict, limit: int) -> list:
+    ids, cursor = [], ''
+    for _ in range(50):
+        r = client.get(url, query_string={'q': Q, 'limit': limit, 'cursor': cursor}, headers=headers)
+        assert r.status_code == 200, r.get_json()
+        body = r.get_json()
+        assert len(body['data']) <= limit
+        ids += [f['id'] for f in body['data']]
+        cursor = body['next_cursor']
+        if not cursor:
+            return ids
+    pytest.fail('cursor tidak pernah habis')
+
+
+def _check_pages(client, url: str, headers: dict, expected: int):
+    full = _walk(client, url, headers, limit=100)
+    assert len(full) >= expected
+    for limit in (1, 2, 3, 4):
+        pages = _walk(client, url, headers, limit)
+        assert len(pages) == len(set(pages)), f'baris dobel di limit={limit}'
+        assert pages == full, f'baris hilang / urutan beda di limit={limit}'
+
+
+def test_admin_pages_do_not_skip_tied_rows(client, seeded):
+    _check_pages(client, '/api/admin/foods', {'X-Admin-Key': ADMIN_KEY}, len(GLOBAL_NAMES))
+
+
+@pytest.mark.parametrize('catalog_cache', [True, False])
+def test_user_pages_do_not_skip_tied_rows(client, seeded, monkeypatch, catalog_cache):
+    # True = snapshot katalog in-memory + makanan pribadi, False = query DB langsung.
+    monkeypatch.setattr(routes, 'FOOD_CATALOG_CACHE', catalog_cache)
+    _check_pages(client, '/api/foods', seeded, len(GLOBAL_NAMES) + len(PRIVATE_NAMES))
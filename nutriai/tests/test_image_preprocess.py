@@ -0,0 +1,77 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app import image_preprocess
+from app.image_preprocess import preprocess_image, InvalidImageError, AI_IMAGE_MAX_EDGE
+
+
+def _encode(img: Image.Image, fmt: str, orientation: int = None) -> bytes:
+    out    = io.BytesIO()
+    params = {}
+    if orientation:
+        exif           = Image.Exif()
+        exif[0x0112]   = orientation
+        params['exif'] = exif.tobytes()
+    img.save(out, format=fmt, **params)
+    return out.getvalue()
+
+
+def _half_red_half_blue(w: int, h: int) -> Image.Image:
+    img = Image.new('RGB', (w, h), (0, 0, 255))
+    img.paste((255, 0, 0), (0, 0, w // 2, h))
+    return img
+
+
+def _opened(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def test_exif_orientation_is_applied(monkeypatch):
+    monkeypatch.setattr(image_preprocess, 'AI_IMAGE_FORMAT', 'JPEG')
+    # Orientation 6 = kamera diputar 90° — tampilnya harus diputar searah jarum jam.
+    data      = _encode(_half_red_half_blue(80, 40), 'JPEG', orientation=6)
+    out, mime = preprocess_image(data)
+    img       = _opened(out)
+
+    assert mime == 'image/jpeg' and img.format == 'JPEG'
+    assert img.size == (40, 80)
+    assert img.getexif().get(0x0112, 1) == 1
+    top, bottom = img.getpixel((20, 5)), img.getpixel((20, 75))
+    assert top[0] > 200 and top[2] < 60          # sisi kiri (merah) pindah ke atas
+    assert bottom[2] > 200 and bottom[0] < 60
+
+
+@pytest.mark.parametrize('fmt, mime', [('JPEG', 'image/jpeg'), ('WEBP', 'image/webp')])
+def test_mime_matches_encoded_format(monkeypatch, fmt, mime):
+    monkeypatch.setattr(image_preprocess, 'AI_IMAGE_FORMAT', fmt)
+    data      = _encode(_half_red_half_blue(AI_IMAGE_MAX_EDGE * 2, AI_IMAGE_MAX_EDGE), 'PNG')
+    out, got  = preprocess_image(data)
+    img       = _opened(out)
+
+    assert got == mime
+    assert img.format == fmt
+    assert max(img.size) == AI_IMAGE_MAX_EDGE
+
+
+def test_small_upright_image_is_sent_as_is():
+    data      = _encode(_half_red_half_blue(64, 32), 'PNG')
+    out, mime = preprocess_image(data)
+    assert out == data
+    assert mime == 'image/png'
+
+
+def test_unsupported_format_is_reencoded(monkeypatch):
+    monkeypatch.setattr(image_preprocess, 'AI_IMAGE_FORMAT', 'JPEG')
+    data      = _encode(_half_red_half_blue(64, 32).convert('P'), 'GIF')
+    out, mime = preprocess_image(data)
+    assert mime == 'image/jpeg'
+    assert _opened(out).format == 'JPEG'
+
+
+def test_non_image_is_rejected():
+    with pytest.raises(InvalidImageError):
+        preprocess_image(b'bukan gambar')
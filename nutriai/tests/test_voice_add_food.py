@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db, WaktuMakan
+from conftest import ADMIN_KEY
+
+
+FOODS = ('Nasi Putih', 'Ayam Goreng', 'Tempe Goreng', 'Sambal Terasi', 'Es Teh Manis')
+
+
+def _voice_fixture(marker: str, names) -> dict:
+    reply = 'Oke, sudah dicatat!'
+    return {
+        'name':  f'add-food-{marker}',
+        'match': [marker],
+        'text':  json.dumps({
+            'intent': 'add_food', 'reply': reply, 'tts_text': reply, 'answer': '', 'confidence': 'high',
+            'unclear_reason': '', 'params': {'items': [
+                {'nama_makanan': n, 'porsi': 1, 'waktu_makan': 'Siang'} for n in names
+            ]},
+        }),
+    }
+
+
+@pytest.fixture
+def foods(client):
+    for i, nama in enumerate(FOODS):
+        r = client.post('/api/admin/foods', headers={'X-Admin-Key': ADMIN_KEY},
+                        data={'nama_makanan': nama, 'kalori': 100 + i, 'protein': 5})
+        assert r.status_code in (201, 409), r.get_json()
+    return FOODS
+
+
+def _count_statements(app, fn):
+    seen = []
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _on_execute)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', _on_execute)
+    return result, seen
+
+
+def test_multi_item_add_food_statement_count(app, client, standin, register, foods):
+    headers = register('voice_queries')
+    texts   = {
+        'warmup': 'tolong catat menu pemanasan tadi pagi',
+        'one':    'siang ini cuma makan menu tunggal',
+        'many':   'malam barusan aku habiskan menu lengkap sekeluarga',
+    }
+    # Prompt ikut memuat giliran sebelumnya → marker giliran terbaru dicek duluan.
+    standin.fixtures[:0] = [
+        _voice_fixture('menu lengkap', foods),
+        _voice_fixture('menu tunggal', foods[:1]),
+        _voice_fixture('menu pemanasan', foods[:1]),
+    ]
+
+    def voice(text):
+        r = client.post('/api/ai/voice-command', json={'text': text}, headers=headers)
+        assert r.status_code == 200, r.get_json()
+        return r.get_json()
+
+    # Giliran pertama membuat baris streak / versi / percakapan — jangan ikut dihitung.
+    voice(texts['warmup'])
+    one,  one_sql  = _count_statements(app, lambda: voice(texts['one']))
+    many, many_sql = _count_statements(app, lambda: voice(texts['many']))
+
+    assert len(one['action_result']['added'])  == 1
+    assert len(many['action_result']['added']) == len(foods)
+    with app.app_context():
+        assert WaktuMakan.query.filter_by(nama_makanan='Sambal Terasi').count() == 1
+
+    # Tanpa N+1: 5 item = query sebanyak 1 item (1 IN/ILIKE untuk semua
+    # item, 1 executemany INSERT untuk semua baris).
+    assert len(many_sql) == len(one_sql), '\n'.join(many_sql)
+    assert len(many_sql) <= 20, '\n'.join(many_sql)
+    assert sum(s.lstrip().upper().startswith('INSERT INTO WAKTU_MAKAN') for s in many_sql) == 1
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from app.models import WaterLog, User
+
+
+_ADD_WATER = json.dumps({
+    'intent': 'add_water', 'reply': 'Oke, 500 ml dicatat!', 'tts_text': 'Oke, 500 ml dicatat!',
+    'answer': '', 'confidence': 'high', 'unclear_reason': '', 'params': {'jumlah_ml': 500},
+})
+
+REPLIES = {
+    # Cuma perlu diperbaiki lokal — isinya utuh, action tetap jalan.
+    'fenced':   (f'```json\n{_ADD_WATER}\n```', 1),
+    'trailing': (_ADD_WATER[:-1] + ',}', 1),
+    # Kepotong di tengah angka — jumlah_ml belum tentu 500, jangan ditulis.
+    'truncated': (_ADD_WATER[:_ADD_WATER.index('"params"')] + '"params": {"jumlah_ml": 5', 0),
+}
+
+
+@pytest.mark.parametrize('case', sorted(REPLIES))
+def test_add_water_runs_unless_reply_truncated(app, client, standin, register, case):
+    text, rows = REPLIES[case]
+    username   = f'json_repair_{case}'
+    headers    = register(username)
+    marker     = f'catatan hidrasi {case}'
+    standin.fixtures.insert(0, {'name': marker, 'match': [marker], 'text': text})
+
+    r = client.post('/api/ai/voice-command', json={'text': f'tolong simpan {marker} barusan'}, headers=headers)
+    assert r.status_code == 200, r.get_json()
+    body = r.get_json()
+
+    with app.app_context():
+        user_id = User.query.filter_by(username=username).one().id
+        logged  = [w.jumlah_ml for w in WaterLog.query.filter_by(user_id=user_id)]
+    assert logged == [500] * rows
+    assert body['action_result']['status'] == ('ok' if rows else 'incomplete')
@@ -0,0 +1,225 @@
+"""
+Benchmark campuran trafik AI (chat, voice, foto, weekly-analysis) lewat
+Gemini stand-in (tools/gemini_standin.py) — tanpa API key / kuota asli.
+
+Menjalankan backend lewat gunicorn + gunicorn.conf.py (SQLite sementara),
+mendaftarkan beberapa user, lalu N client paralel mengirim request acak
+sesuai --mix selama --duration detik. Sambil jalan, /api/admin/metrics
+di-sampling untuk melihat saturasi tiap worker (slot ai_gateway terpakai /
+antrean) dan latency request non-AI (probe) di worker yang sama.
+
+Laporan akhir:
+  - per jenis request: jumlah, status HTTP, p50/p95/p99, throughput
+  - per worker (pid): puncak in-flight vs AI_MAX_INFLIGHT, % sampel penuh,
+    puncak antrean
+  - latency probe /api/admin/metrics (indikasi thread worker tersumbat)
+  - statistik stand-in: request ke upstream, error yang disuntikkan, puncak paralel
+
+Contoh (dari folder nutriai/):
+    python tools/bench_ai_mix.py
+    python tools/bench_ai_mix.py --concurrency 48 --latency lognormal:3,0.8 --fail 503=0.05 --fail 429=0.05
+    python tools/bench_ai_mix.py --mix chat=1,voice=1 --workers 1 --ai-max-inflight 4
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import urllib.request as urlreq
+from collections import Counter, defaultdict
+
+from PIL import Image
+
+from gemini_standin import start_standin, parse_failures
+from loadtest_ai_gateway import call, wait_ready, pct
+
+HERE        = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_KEY   = 'bench-admin-key'
+CHAT_MSGS   = ['Telur rebus tiap hari aman gak?', 'Tips sarapan sehat buat diet?', 'Berapa protein di dada ayam?']
+VOICE_MSGS  = ['sarapan apa yang bagus buat diet', 'kenapa berat badanku susah turun ya', 'camilan sehat malam hari apa']
+KINDS       = ('chat', 'chat_stream', 'voice', 'image', 'weekly')
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in KINDS:
+            raise SystemExit(f'Jenis trafik tidak dikenal: {kind!r} (pilihan: {", ".join(KINDS)})')
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def small_photo(seed: int) -> str:
+    """Foto sintetis kecil (base64) — tiap seed beda isi, jadi tidak kena cache."""
+    rnd = random.Random(seed)
+    img = Image.new('RGB', (64, 48))
+    img.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(64 * 48)])
+    out = io.BytesIO()
+    img.resize((800, 600)).save(out, format='JPEG', quality=85)
+    return base64.b64encode(out.getvalue()).decode()
+
+
+def setup_user(base: str, i: int) -> str:
+    status, body, _ = call('POST', f'{base}/api/register', {
+        'username': f'mix{int(time.time())}u{i}', 'password': 'bench12345',
+        'umur': 25, 'tb': 170, 'bb': 65, 'gender': 'laki_laki',
+        'aktivitas': 'aktivitas_sedang', 'tujuan': 'maintain', 'body_type': 'mesomorph',
+    })
+    if status != 201:
+        raise SystemExit(f'Register gagal: {status} {body[:200]!r}')
+    token = json.loads(body)['token']
+    # 1 makanan + 1 laporan supaya weekly-analysis punya data.
+    call('POST', f'{base}/api/daily', [{
+        'nama_makanan': 'nasi goreng', 'porsi': 1, 'protein': 12, 'kalori': 450, 'waktu_makan': 'Siang',
+    }], token=token)
+    call('POST', f'{base}/api/laporan', {}, token=token)
+    return token
+
+
+def run_request(base: str, kind: str, token: str, seq: int) -> tuple:
+    if kind == 'chat':
+        return call('POST', f'{base}/api/ai/chat', {'message': random.choice(CHAT_MSGS)}, token=token)
+    if kind == 'chat_stream':
+        return call('POST', f'{base}/api/ai/chat/stream', {'message': random.choice(CHAT_MSGS)}, token=token)
+    if kind == 'voice':
+        return call('POST', f'{base}/api/ai/voice-command', {'text': random.choice(VOICE_MSGS)}, token=token)
+    if kind == 'image':
+        return call('POST', f'{base}/api/ai/analyze-image', {'image_base64': small_photo(seq)}, token=token)
+    # weekly: tutup hari dulu (Laporan baru → analisis tersimpan jadi basi), lalu minta analisis.
+    call('POST', f'{base}/api/laporan', {}, token=token)
+    return call('GET', f'{base}/api/ai/weekly-analysis', token=token)
+
+
+def sample_workers(base: str, stop: threading.Event, samples: list, interval: float):
+    req = urlreq.Request(f'{base}/api/admin/metrics', headers={'X-Admin-Key': ADMIN_KEY})
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            with urlreq.urlopen(req, timeout=30) as resp:
+                body = json.loads(resp.read())
+            samples.append((body['pid'], body['ai_gateway'], (time.perf_counter() - t0) * 1000))
+        except OSError:
+            pass
+        stop.wait(interval)
+
+
+def report(results: list, duration: float, samples: list, standin_stats: dict):
+    print(f'\n{"jenis":<12} {"n":>5} {"rps":>6} {"p50":>8} {"p95":>8} {"p99":>8}  status')
+    by_kind = defaultdict(list)
+    for kind, status, ms in results:
+        by_kind[kind].append((status, ms))
+    for kind in KINDS:
+        rows = by_kind.get(kind)
+        if not rows:
+            continue
+        lat      = [ms for status, ms in rows if status == 200]
+        statuses = dict(sorted(Counter(status for status, _ in rows).items()))
+        if lat:
+            print(f'{kind:<12} {len(rows):>5} {len(rows) / duration:>6.1f} {statistics.median(lat):>7.0f}ms '
+                  f'{pct(lat, 95):>7.0f}ms {pct(lat, 99):>7.0f}ms  {statuses}')
+        else:
+            print(f'{kind:<12} {len(rows):>5} {len(rows) / duration:>6.1f} {"-":>8} {"-":>8} {"-":>8}  {statuses}')
+
+    print('\nsaturasi worker (sampling /api/admin/metrics):')
+    per_pid = defaultdict(list)
+    for pid, gw, _ in samples:
+        per_pid[pid].append(gw)
+    for pid, gws in sorted(per_pid.items()):
+        cap  = gws[0]['max_inflight']
+        full = sum(g['inflight'] >= cap for g in gws)
+        print(f'  pid {pid:<7} sampel={len(gws):<4} puncak in-flight={max(g["inflight"] for g in gws)}/{cap}  '
+              f'penuh={100 * full / len(gws):5.1f}%  puncak antre={max(g["waiting"] for g in gws)}')
+    probe = [ms for _, _, ms in samples]
+    if probe:
+        print(f'  probe latency p50={statistics.median(probe):.1f}ms  p95={pct(probe, 95):.1f}ms  max={max(probe):.1f}ms')
+
+    print(f'\nstand-in: {standin_stats["requests"]} request upstream, status={standin_stats["by_status"]}, '
+          f'puncak paralel={standin_stats["peak_inflight"]}')
+    print(f'          per fixture={standin_stats["by_fixture"]}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=5056)
+    ap.add_argument('--workers', type=int, default=2)
+    ap.add_argument('--threads', type=int, default=16)
+    ap.add_argument('--ai-max-inflight', type=int, default=8)
+    ap.add_argument('--users', type=int, default=10)
+    ap.add_argument('--concurrency', type=int, default=24, help='jumlah client paralel')
+    ap.add_argument('--duration', type=float, default=30, help='lama beban (detik)')
+    ap.add_argument('--mix', default='chat=3,chat_stream=1,voice=4,image=1,weekly=1')
+    ap.add_argument('--latency', default='lognormal:1.5,0.6', help='distribusi latency stand-in')
+    ap.add_argument('--fail', action='append', default=[], metavar='CODE=RATE', help='suntik error, mis. 503=0.05')
+    ap.add_argument('--sample-interval', type=float, default=0.25)
+    args = ap.parse_args()
+
+    mix      = parse_mix(args.mix)
+    upstream = start_standin(latency=args.latency, failures=parse_failures(args.fail))
+    db_file  = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    env = dict(
+        os.environ,
+        DATABASE_URL        = f'sqlite:///{db_file}',
+        JWT_SECRET_KEY      = 'bench-secret-bench-secret-bench-secret',
+        GEMINI_API_KEY      = 'bench-key',
+        GEMINI_BASE_URL     = upstream.base_url,
+        ADMIN_SECRET_KEY    = ADMIN_KEY,
+        AI_IMAGE_CACHE_SIZE = '0',
+        AI_IMAGE_CACHE_DIR  = '',
+        SCHEDULER_ENABLED   = '0',
+        PORT                = str(args.port),
+        WEB_CONCURRENCY     = str(args.workers),
+        GUNICORN_THREADS    = str(args.threads),
+        AI_MAX_INFLIGHT     = str(args.ai_max_inflight),
+    )
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                              cwd=HERE, env=env)
+    base   = f'http://127.0.0.1:{args.port}'
+
+    try:
+        wait_ready(base)
+        tokens = [setup_user(base, i) for i in range(args.users)]
+        upstream.standin.reset_stats()
+        print(f'{args.users} user, {args.concurrency} client paralel, {args.duration:g}s, mix={mix}, '
+              f'latency={args.latency}, fail={args.fail or "-"}')
+
+        results, samples = [], []
+        stop     = threading.Event()
+        deadline = time.monotonic() + args.duration
+        kinds, weights = zip(*mix.items())
+        seq      = iter(range(10 ** 9))
+
+        def client():
+            while time.monotonic() < deadline:
+                kind = random.choices(kinds, weights)[0]
+                status, _, ms = run_request(base, kind, random.choice(tokens), next(seq))
+                results.append((kind, status, ms))
+
+        sampler = threading.Thread(target=sample_workers, args=(base, stop, samples, args.sample_interval))
+        clients = [threading.Thread(target=client) for _ in range(args.concurrency)]
+        started = time.monotonic()
+        sampler.start()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        stop.set()
+        sampler.join()
+        report(results, time.monotonic() - started, samples, upstream.standin.stats())
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=15)
+        upstream.shutdown()
+        os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()
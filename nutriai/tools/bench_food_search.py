@@ -0,0 +1,267 @@
+"""
+Benchmark pencarian makanan (/api/foods?q=) di katalog besar.
+
+Mengisi tabel food dengan --rows makanan sintetis (default 100.000; ~5%
+makanan pribadi milik user benchmark), lalu membandingkan query yang
+dijalankan get_foods untuk beberapa kata kunci:
+  - legacy : nama_makanan ILIKE '%q%' ORDER BY id DESC (sebelum app/food_search.py)
+  - ranked : food_search_filter + food_search_order (index trigram di PostgreSQL)
+  - catalog: catalog_food_page — global dari snapshot in-memory + pribadi
+             dari DB (jalur /api/foods sejak app/food_catalog.py); query
+             ejaan varian/sinonim/typo ("ayam gorng", "es teh manis")
+             ditambah hasil FoodMatcher (app/food_matcher.py)
+Keduanya = COUNT(*) + halaman pertama (LIMIT 20) dengan scope global +
+milik sendiri, persis seperti endpoint-nya.
+
+Semua baris benchmark ditulis di dalam 1 transaksi yang di-ROLLBACK di
+akhir — aman dijalankan ke database staging; tabel & index (kalau belum
+ada) tetap dibuat seperti saat app start.
+
+Laporan: p50/p95/p99 per kata kunci per varian, jumlah hasil, 3 hasil
+teratas, dan (PostgreSQL) apakah plan query memakai ix_food_nama_trgm.
+Lalu halaman dalam (--deep-page) tanpa kata kunci & dengan 'nasi':
+COUNT + OFFSET (page/limit) vs keyset cursor (app/pagination.py).
+Terakhir autocomplete (app/food_autocomplete.py): p50/p95/p99 per ketikan
+(tiap awalan tiap kata kunci, target p99 < 10 ms), waktu bangun index
+penuh, dan waktu patch index setelah --patch-foods makanan global berubah.
+
+Contoh (dari folder nutriai/):
+    python tools/bench_food_search.py                       # SQLite sementara
+    python tools/bench_food_search.py --database-url postgresql://.../nutriai_staging
+    python tools/bench_food_search.py --rows 20000 --repeat 50 --query ayam --query "nasi goreng"
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.models import db, Food, User
+from app.food_search import init_food_search, food_search_filter, food_search_order, food_search_keys, catalog_food_page
+from app.pagination import keyset_page
+from app.food_catalog import food_catalog, bump_catalog_version
+from app.food_autocomplete import PrefixIndex, food_autocomplete, autocomplete
+from loadtest_ai_gateway import pct
+
+DEFAULT_QUERIES = ['nasi', 'ayam goreng', 'tempe', 'sop', 'rendang', 'ayam gorng', 'es teh manis', 'zz']
+PAGE_LIMIT      = 20
+
+_BASES     = ['nasi', 'mie', 'bubur', 'lontong', 'ketupat', 'roti', 'kentang', 'bihun', 'kwetiau', 'soto',
+              'sop', 'sate', 'bakso', 'pecel', 'gado gado', 'ketoprak', 'martabak', 'pisang', 'es teh', 'kopi']
+_PROTEINS  = ['ayam', 'sapi', 'kambing', 'ikan', 'udang', 'cumi', 'telur', 'tahu', 'tempe', 'bebek',
+              'lele', 'tongkol', 'kerang', 'jamur', 'rendang', 'babat', 'iga', 'usus', 'hati', 'kikil']
+_STYLES    = ['goreng', 'bakar', 'rebus', 'kukus', 'penyet', 'geprek', 'balado', 'kecap', 'rica rica', 'santan',
+              'asam manis', 'lada hitam', 'pedas', 'manis', 'original', 'spesial', 'jumbo', 'mini', 'crispy', 'madura']
+_PLACES    = ['', '', '', 'warung', 'rumahan', 'kaki lima', 'restoran', 'instan', 'frozen', 'kantin']
+
+
+def synthetic_names(n: int, seed: int = 42) -> list:
+    """n nama makanan unik bergaya katalog Indonesia (deterministik per seed)."""
+    rnd, names, seen = random.Random(seed), [], set()
+    while len(names) < n:
+        parts = [rnd.choice(_BASES), rnd.choice(_PROTEINS), rnd.choice(_STYLES), rnd.choice(_PLACES)]
+        if rnd.random() < 0.3:
+            parts = [parts[1], parts[2], parts[0], parts[3]]   # "ayam goreng nasi ..." vs "nasi ayam goreng ..."
+        name = ' '.join(p for p in parts if p)
+        if name in seen:
+            name = f'{name} {len(names)}'
+        seen.add(name)
+        names.append(name.title() if rnd.random() < 0.5 else name)
+    return names
+
+
+def seed_catalog(rows: int, seed: int = 42) -> int:
+    """Isi food dengan `rows` baris sintetis (di transaksi aktif). Return id user benchmark."""
+    user = User(username=f'bench-food-{int(time.time())}', umur=30, tb=170, bb=65, tujuan='maintain',
+                aktivitas='aktivitas_sedang', tipe_tubuh='mesomorph', gender='laki_laki')
+    db.session.add(user)
+    db.session.flush()
+
+    rnd   = random.Random(seed)
+    batch = []
+    for i, name in enumerate(synthetic_names(rows, seed)):
+        batch.append({
+            'nama_makanan': name,
+            'user_id':      user.id if rnd.random() < 0.05 else None,
+            'kalori':       rnd.uniform(20, 800),
+            'protein':      rnd.uniform(0, 40),
+            'karbo':        rnd.uniform(0, 90),
+            'lemak':        rnd.uniform(0, 40),
+        })
+        if len(batch) == 5000 or i == rows - 1:
+            db.session.execute(db.insert(Food), batch)
+            batch = []
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ANALYZE food'))
+    return user.id
+
+
+def scoped(user_id: int):
+    return Food.query.filter(
+        Food.deleted_at.is_(None),
+        db.or_(Food.user_id.is_(None), Food.user_id == user_id),
+    )
+
+
+def legacy_search(user_id: int, q: str):
+    query = scoped(user_id).filter(Food.nama_makanan.ilike(f'%{q}%'))
+    return query.count(), query.order_by(Food.id.desc()).limit(PAGE_LIMIT).all()
+
+
+def ranked_search(user_id: int, q: str):
+    query = scoped(user_id).filter(food_search_filter(q))
+    return query.count(), query.order_by(*food_search_order(q)).limit(PAGE_LIMIT).all()
+
+
+def catalog_search(user_id: int, q: str):
+    body = catalog_food_page(user_id, q, PAGE_LIMIT, with_total=True)
+    return body['total'], [SimpleNamespace(**f) for f in body['data']]
+
+
+def offset_page(user_id: int, q: str, page: int):
+    query = scoped(user_id).filter(food_search_filter(q)) if q else scoped(user_id)
+    return query.count(), query.order_by(*food_search_order(q)).offset((page - 1) * PAGE_LIMIT).limit(PAGE_LIMIT).all()
+
+
+def cursor_page(user_id: int, q: str, after: list):
+    query = scoped(user_id).filter(food_search_filter(q)) if q else scoped(user_id)
+    return keyset_page(query, food_search_keys(q), PAGE_LIMIT, after)
+
+
+def cursor_before_page(user_id: int, q: str, page: int) -> list:
+    """Nilai kunci baris terakhir halaman page-1 (= isi cursor yang dibawa client)."""
+    query = scoped(user_id).filter(food_search_filter(q)) if q else scoped(user_id)
+    keys  = food_search_keys(q)
+    row   = query.add_columns(*[e for e, _ in keys]).order_by(*food_search_order(q)) \
+                 .offset((page - 1) * PAGE_LIMIT - 1).limit(1).one()
+    return list(row[1:])
+
+
+def uses_trgm_index(user_id: int, q: str) -> bool:
+    stmt = scoped(user_id).filter(food_search_filter(q)).order_by(*food_search_order(q)).limit(PAGE_LIMIT)
+    sql  = stmt.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(db.text(f'EXPLAIN {sql}')).scalars().all()
+    return any('ix_food_nama_trgm' in line for line in plan)
+
+
+def keystrokes(queries: list) -> list:
+    """Semua awalan tiap kata kunci, seperti diketik huruf per huruf."""
+    return [q[:n] for q in queries for n in range(1, len(q) + 1)]
+
+
+def bench_autocomplete(user_id: int, queries: list, repeat: int, patch_foods: int):
+    t0 = time.perf_counter()
+    food_autocomplete.global_index()
+    print(f'\nautocomplete: index global dibangun dalam {(time.perf_counter() - t0) * 1000:.0f}ms')
+
+    prefixes = keystrokes(queries)
+    for q in prefixes:
+        autocomplete(user_id, q, 10)   # pemanasan (index pribadi user)
+    lat = []
+    for _ in range(repeat):
+        for q in prefixes:
+            t0 = time.perf_counter()
+            autocomplete(user_id, q, 10)
+            lat.append((time.perf_counter() - t0) * 1000)
+    print(f'{len(prefixes)} awalan x {repeat}: p50 {pct(lat, 50):.2f}ms p95 {pct(lat, 95):.2f}ms '
+          f'p99 {pct(lat, 99):.2f}ms (target p99 < 10ms: {"OK" if pct(lat, 99) < 10 else "GAGAL"})')
+    for q in queries[:3]:
+        print(f'  {q!r:<14} → ' + ', '.join(f['nama_makanan'] for f in autocomplete(user_id, q, 5)))
+
+    # Admin mengubah sebagian makanan global → patch index vs bangun ulang penuh.
+    old  = food_autocomplete.global_index()
+    rows = Food.query.filter(Food.user_id.is_(None)).order_by(db.func.random()).limit(patch_foods).all()
+    for i, f in enumerate(rows):
+        f.nama_makanan = f'{f.nama_makanan} edisi {i}'
+    db.session.add_all([Food(nama_makanan=f'nasi bench baru {i}', kalori=100, protein=5) for i in range(patch_foods)])
+    bump_catalog_version()
+    db.session.flush()
+    food_catalog.invalidate()
+    snap = food_catalog.get()
+    t0   = time.perf_counter()
+    new  = old.patched(snap.by_id, snap.norm)
+    t1   = time.perf_counter()
+    full = PrefixIndex(snap.foods, snap.norm)
+    t2   = time.perf_counter()
+    print(f'{2 * patch_foods} makanan berubah: patch {(t1 - t0) * 1000:.0f}ms vs bangun ulang {(t2 - t1) * 1000:.0f}ms '
+          f'| hasil sama: {new is not None and new.top == full.top and new.entries == full.entries}')
+
+
+def measure(fn, user_id: int, q: str, repeat: int) -> tuple:
+    fn(user_id, q)   # pemanasan (cache plan & halaman)
+    lat = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        total, rows = fn(user_id, q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return lat, total, rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--database-url', default=None, help='default: file SQLite sementara')
+    ap.add_argument('--rows',   type=int, default=100_000)
+    ap.add_argument('--repeat', type=int, default=30)
+    ap.add_argument('--deep-page', type=int, default=1000)
+    ap.add_argument('--patch-foods', type=int, default=50)
+    ap.add_argument('--query',  action='append', help=f'boleh berulang (default: {", ".join(DEFAULT_QUERIES)})')
+    args = ap.parse_args()
+
+    url = args.database_url or 'sqlite:///' + tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+    init_food_search(app)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        t0      = time.perf_counter()
+        user_id = seed_catalog(args.rows)
+        print(f'{dialect}: {args.rows} baris diisi dalam {time.perf_counter() - t0:.1f}s\n')
+
+        print(f'{"query":<14} {"varian":<8} {"hasil":>6} {"p50":>8} {"p95":>8} {"p99":>8}  top-3')
+        summary = {'legacy': [], 'ranked': [], 'catalog': []}
+        try:
+            for q in args.query or DEFAULT_QUERIES:
+                for variant, fn in (('legacy', legacy_search), ('ranked', ranked_search), ('catalog', catalog_search)):
+                    lat, total, rows = measure(fn, user_id, q, args.repeat)
+                    summary[variant].append(statistics.median(lat))
+                    top = ', '.join(f.nama_makanan for f in rows[:3])
+                    print(f'{q:<14} {variant:<8} {total:>6} {pct(lat, 50):>6.1f}ms {pct(lat, 95):>6.1f}ms '
+                          f'{pct(lat, 99):>6.1f}ms  {top[:70]}')
+                if dialect == 'postgresql':
+                    print(f'{"":<14} plan ranked pakai ix_food_nama_trgm: {uses_trgm_index(user_id, q)}')
+
+            print(f'\nhalaman {args.deep_page} (limit {PAGE_LIMIT}):')
+            for q in ('', 'nasi'):
+                page  = args.deep_page if not q else max(2, min(args.deep_page, 100))
+                after = cursor_before_page(user_id, q, page)
+                off, *_ = measure(lambda u, q: offset_page(u, q, page), user_id, q, args.repeat)
+                cur, *_ = measure(lambda u, q: (0, cursor_page(u, q, after)[0]), user_id, q, args.repeat)
+                same    = [f.id for f in offset_page(user_id, q, page)[1]] == [f.id for f in cursor_page(user_id, q, after)[0]]
+                print(f'{q or "(semua)":<14} page {page:<5} offset p50 {pct(off, 50):>6.1f}ms p99 {pct(off, 99):>6.1f}ms | '
+                      f'cursor p50 {pct(cur, 50):>6.1f}ms p99 {pct(cur, 99):>6.1f}ms | isi sama: {same}')
+
+            bench_autocomplete(user_id, args.query or DEFAULT_QUERIES, args.repeat, args.patch_foods)
+        finally:
+            db.session.rollback()
+
+        print('\nmedian p50 semua query: ' + ', '.join(
+            f'{variant} {statistics.median(lat):.1f}ms' for variant, lat in summary.items()))
+        if dialect != 'postgresql':
+            print('CATATAN: SQLite tidak punya index trigram — angka ini cuma cek ranking; '
+                  'ukur latency di PostgreSQL (--database-url).')
+
+
+if __name__ == '__main__':
+    main()
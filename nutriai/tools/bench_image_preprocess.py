@@ -0,0 +1,107 @@
+"""
+Benchmark: byte yang dikirim ke Gemini & latency end-to-end /api/ai/analyze-image,
+SEBELUM (foto mentah) vs SESUDAH preprocessing (app/image_preprocess.py).
+
+Gemini stand-in lokal (tools/gemini_standin.py) mensimulasikan uplink
+terbatas (--uplink-mbps) + waktu proses tetap (--upstream-delay), jadi payload besar benar-benar terasa
+seperti di jaringan asli. Foto uji dibuat sintetis (noise + gradien, JPEG
+kualitas tinggi, mirip ukuran foto HP), atau pakai file sendiri lewat --images.
+
+Contoh (dari folder nutriai/):
+    python tools/bench_image_preprocess.py
+    python tools/bench_image_preprocess.py --images foto1.jpg foto2.jpg --uplink-mbps 5
+"""
+import io
+import os
+import sys
+import time
+import base64
+import random
+import argparse
+import tempfile
+import statistics
+
+from PIL import Image
+
+from gemini_standin import start_standin
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+
+def synthetic_photo(seed: int, size=(4000, 3000)) -> bytes:
+    rnd   = random.Random(seed)
+    small = Image.new('RGB', (size[0] // 8, size[1] // 8))
+    small.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+                   for _ in range(small.width * small.height)])
+    img = small.resize(size, Image.BILINEAR)
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=95)
+    return out.getvalue()
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--images', nargs='*', help='file foto sendiri (default: 5 foto sintetis 4000x3000)')
+    ap.add_argument('--uplink-mbps', type=float, default=10.0, help='bandwidth simulasi server → Gemini')
+    ap.add_argument('--upstream-delay', type=float, default=0.8, help='detik waktu proses Gemini tiruan')
+    ap.add_argument('--rounds', type=int, default=2, help='berapa kali tiap foto dikirim per mode')
+    args = ap.parse_args()
+
+    srv      = start_standin(latency=f'fixed:{args.upstream_delay}', uplink_mbps=args.uplink_mbps)
+    received = srv.standin.request_bytes
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ.update(
+        DATABASE_URL        = f'sqlite:///{db_file}',
+        JWT_SECRET_KEY      = 'bench-secret-bench-secret-bench-secret',
+        GEMINI_API_KEY      = 'bench-key',
+        GEMINI_BASE_URL     = srv.base_url,
+        AI_IMAGE_CACHE_SIZE = '0',     # tiap request harus benar-benar ke upstream
+        AI_IMAGE_CACHE_DIR  = '',
+        SCHEDULER_ENABLED   = '0',
+    )
+    import main as nutriai_main
+    from app import image_preprocess
+
+    client = nutriai_main.app.test_client()
+    status = client.post('/api/register', json={
+        'username': f'bench{int(time.time())}', 'password': 'bench12345', 'umur': 25, 'tb': 170, 'bb': 65,
+        'gender': 'laki_laki', 'aktivitas': 'aktivitas_sedang', 'tujuan': 'maintain', 'body_type': 'mesomorph',
+    })
+    headers = {'Authorization': f"Bearer {status.get_json()['token']}"}
+
+    if args.images:
+        photos = [open(p, 'rb').read() for p in args.images]
+    else:
+        print('Membuat foto sintetis...')
+        photos = [synthetic_photo(i) for i in range(5)]
+    print(f'{len(photos)} foto, rata-rata {statistics.mean(len(p) for p in photos) / 1e6:.1f} MB, '
+          f'uplink {args.uplink_mbps:g} Mbps\n')
+
+    try:
+        for label, enabled in (('sebelum', False), ('sesudah', True)):
+            image_preprocess.AI_IMAGE_PREPROCESS = enabled
+            received.clear()
+            lat = []
+            for _ in range(args.rounds):
+                for photo in photos:
+                    t0 = time.perf_counter()
+                    r  = client.post('/api/ai/analyze-image', headers=headers,
+                                     json={'image_base64': base64.b64encode(photo).decode()})
+                    lat.append((time.perf_counter() - t0) * 1000)
+                    if r.status_code != 200:
+                        raise SystemExit(f'{label}: HTTP {r.status_code} {r.get_data(as_text=True)[:200]}')
+            print(f'{label:<8} upstream rata-rata {statistics.mean(received) / 1e6:6.2f} MB/request  '
+                  f'latency p50={statistics.median(lat):7.0f}ms  p95={pct(lat, 95):7.0f}ms')
+    finally:
+        srv.shutdown()
+        os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Server Gemini tiruan (stand-in) untuk load test / benchmark /api/ai/* tanpa
+API key, kuota berbayar, atau akses internet.
+
+Meniru endpoint yang dipakai app/gemini_client.py:
+  POST /{ver}/models/{model}:generateContent
+  POST /{ver}/models/{model}:streamGenerateContent?alt=sse
+  POST /{ver}/cachedContents
+  GET  /{ver}/models
+  GET  /_standin/stats            ← statistik stand-in (bukan bagian API Gemini)
+
+Jawaban diambil dari fixture rekaman (tools/gemini_fixtures.json): fixture
+pertama yang salah satu "match"-nya muncul di teks prompt yang dipakai,
+lengkap dengan usageMetadata perkiraan (≈4 karakter per token).
+
+Latency per request diambil dari distribusi (--latency):
+  fixed:8            selalu 8 detik
+  uniform:0.5,3      acak rata 0.5–3 detik
+  lognormal:1.5,0.6  median 1.5 detik, sigma 0.6 (ekor panjang, mirip aslinya)
+Untuk stream, latency = waktu sampai chunk pertama; chunk berikutnya dijeda
+--chunk-delay. --uplink-mbps mensimulasikan bandwidth upload ke Gemini
+(payload besar, mis. foto, jadi terasa lambat).
+
+Error bisa disuntikkan dengan peluang tertentu: --fail 429=0.05 --fail 503=0.02
+(429 ikut membawa header Retry-After, lihat --retry-after).
+
+Arahkan backend ke stand-in lewat GEMINI_BASE_URL. Contoh (dari folder nutriai/):
+    python tools/gemini_standin.py --port 8765 --latency lognormal:1.5,0.6 --fail 503=0.05
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=x python main.py
+
+Dipakai juga sebagai modul oleh tools/loadtest_ai_gateway.py, tools/bench_ai_mix.py
+dan tools/bench_image_preprocess.py (start_standin()).
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIXTURES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gemini_fixtures.json')
+
+_GENERATE_RE = re.compile(r'^/[^/]+/models/([^/:]+):(generateContent|streamGenerateContent)')
+
+
+def parse_latency(spec: str):
+    """'fixed:8' / 'uniform:a,b' / 'lognormal:median,sigma' → fungsi tanpa argumen (detik)."""
+    kind, _, args = (spec or 'fixed:0').partition(':')
+    try:
+        nums = [float(x) for x in args.split(',')] if args else []
+        if kind == 'fixed':
+            value = nums[0] if nums else 0.0
+            return lambda: value
+        if kind == 'uniform':
+            low, high = nums
+            return lambda: random.uniform(low, high)
+        if kind == 'lognormal':
+            median, sigma = nums
+            return lambda: random.lognormvariate(math.log(median), sigma)
+    except (ValueError, IndexError):
+        pass
+    raise ValueError(f'Format latency tidak dikenal: {spec!r} (contoh: fixed:8, uniform:0.5,3, lognormal:1.5,0.6)')
+
+
+def parse_failures(specs) -> dict:
+    """['429=0.05', '503=0.02'] → {429: 0.05, 503: 0.02}."""
+    out = {}
+    for spec in specs or []:
+        code, _, rate = spec.partition('=')
+        out[int(code)] = float(rate)
+    return out
+
+
+def load_fixtures(path: str = FIXTURES_FILE) -> list:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _prompt_text(payload: dict) -> str:
+    texts  = []
+    system = payload.get('systemInstruction') or payload.get('system_instruction') or {}
+    for content in payload.get('contents', []) + [system]:
+        for part in content.get('parts', []):
+            texts.append(part.get('text', ''))
+    return '\n'.join(texts)
+
+
+def _tokens(n_chars: int) -> int:
+    return max(1, n_chars // 4)
+
+
+class GeminiStandin:
+    def __init__(self, latency: str = 'fixed:0', failures: dict = None, fixtures: list = None,
+                 retry_after: float = 1.0, chunk_delay: float = 0.05, chunk_chars: int = 40,
+                 uplink_mbps: float = 0.0, seed: int = None):
+        self.latency      = parse_latency(latency)
+        self.failures     = failures or {}
+        self.fixtures     = fixtures if fixtures is not None else load_fixtures()
+        self.retry_after  = retry_after
+        self.chunk_delay  = chunk_delay
+        self.chunk_chars  = chunk_chars
+        self.uplink_mbps  = uplink_mbps
+        self.random       = random.Random(seed)
+        self._lock        = threading.Lock()
+        self.reset_stats()
+
+    # ── statistik ─────────────────────────────────────────
+    def reset_stats(self):
+        with self._lock:
+            self.requests       = Counter()   # (fixture, status) -> jumlah
+            self.request_bytes  = []
+            self.inflight       = 0
+            self.peak_inflight  = 0
+            self.cache_created  = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_fixture, by_status = Counter(), Counter()
+            for (fixture, status), n in self.requests.items():
+                by_fixture[fixture] += n
+                by_status[str(status)] += n
+            return {
+                'requests':       sum(self.requests.values()),
+                'by_fixture':     dict(by_fixture),
+                'by_status':      dict(by_status),
+                'inflight':       self.inflight,
+                'peak_inflight':  self.peak_inflight,
+                'cache_created':  self.cache_created,
+                'avg_request_kb': round(sum(self.request_bytes) / len(self.request_bytes) / 1024, 1)
+                                  if self.request_bytes else 0,
+            }
+
+    # ── perilaku ──────────────────────────────────────────
+    def pick_fixture(self, payload: dict) -> dict:
+        text = _prompt_text(payload)
+        for fx in self.fixtures:
+            if any(m in text for m in fx.get('match', [])):
+                return fx
+        return self.fixtures[-1]
+
+    def pick_failure(self) -> int | None:
+        roll = self.random.random()
+        for code, rate in self.failures.items():
+            if roll < rate:
+                return code
+            roll -= rate
+        return None
+
+    def usage(self, payload: dict, text: str) -> dict:
+        # Foto / audio inline dihitung rata 258 token per part, seperti tarif gambar Gemini.
+        media  = sum('inline_data' in part or 'inlineData' in part
+                     for content in payload.get('contents', []) for part in content.get('parts', []))
+        prompt = _tokens(len(_prompt_text(payload))) + 258 * media
+        output = _tokens(len(text))
+        return {'promptTokenCount': prompt, 'candidatesTokenCount': output, 'totalTokenCount': prompt + output}
+
+    def handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_json(self, status: int, obj: dict, headers: dict = None):
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith('/_standin/stats'):
+                    return self._send_json(200, standin.stats())
+                if re.match(r'^/[^/]+/models', self.path):
+                    return self._send_json(200, {'models': [
+                        {'name': 'models/gemini-2.5-flash', 'supportedGenerationMethods': ['generateContent']},
+                    ]})
+                self._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+
+            def do_POST(self):
+                n       = int(self.headers.get('Content-Length') or 0)
+                raw     = self.rfile.read(n)
+                payload = json.loads(raw or b'{}')
+                if '/cachedContents' in self.path:
+                    with standin._lock:
+                        standin.cache_created += 1
+                        name = f'cachedContents/standin-{standin.cache_created}'
+                    return self._send_json(200, {'name': name, 'model': payload.get('model', '')})
+
+                m = _GENERATE_RE.match(self.path)
+                if not m:
+                    return self._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+
+                with standin._lock:
+                    standin.inflight     += 1
+                    standin.peak_inflight = max(standin.peak_inflight, standin.inflight)
+                    standin.request_bytes.append(n)
+                fixture, status = '-', 200
+                try:
+                    if standin.uplink_mbps:
+                        time.sleep(n * 8 / (standin.uplink_mbps * 1_000_000))
+                    time.sleep(standin.latency())
+
+                    status = standin.pick_failure() or 200
+                    if status != 200:
+                        headers = {'Retry-After': f'{standin.retry_after:g}'} if status == 429 else {}
+                        return self._send_json(status, {'error': {
+                            'code': status, 'message': 'Injected by gemini_standin', 'status': 'UNAVAILABLE',
+                        }}, headers)
+
+                    fx      = standin.pick_fixture(payload)
+                    fixture = fx['name']
+                    if m.group(2) == 'streamGenerateContent':
+                        self._stream(fx['text'], standin.usage(payload, fx['text']))
+                    else:
+                        self._send_json(200, {
+                            'candidates':    [{'content': {'parts': [{'text': fx['text']}], 'role': 'model'},
+                                               'finishReason': 'STOP'}],
+                            'usageMetadata': standin.usage(payload, fx['text']),
+                            'modelVersion':  m.group(1),
+                        })
+                except OSError:
+                    status = 'client_closed'
+                finally:
+                    with standin._lock:
+                        standin.inflight -= 1
+                        standin.requests[(fixture, status)] += 1
+
+            def _stream(self, text: str, usage: dict):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                size   = standin.chunk_chars
+                pieces = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+                for i, piece in enumerate(pieces):
+                    chunk = {'candidates': [{'content': {'parts': [{'text': piece}], 'role': 'model'}}]}
+                    if i == len(pieces) - 1:
+                        chunk['candidates'][0]['finishReason'] = 'STOP'
+                        chunk['usageMetadata'] = usage
+                    self._write_chunk(f'data: {json.dumps(chunk)}\r\n\r\n'.encode())
+                    if i < len(pieces) - 1:
+                        time.sleep(standin.chunk_delay)
+                self._write_chunk(b'')
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def start_standin(port: int = 0, **options) -> ThreadingHTTPServer:
+    """
+    Jalankan stand-in di thread background. Return server-nya;
+    server.standin = GeminiStandin (stats(), reset_stats()),
+    server.base_url = nilai untuk GEMINI_BASE_URL.
+    """
+    standin = GeminiStandin(**options)
+    srv     = ThreadingHTTPServer(('127.0.0.1', port), standin.handler_class())
+    srv.daemon_threads = True
+    srv.standin        = standin
+    srv.base_url       = f'http://127.0.0.1:{srv.server_port}'
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=8765)
+    ap.add_argument('--latency', default='lognormal:1.5,0.6', help='distribusi latency (lihat di atas)')
+    ap.add_argument('--fail', action='append', default=[], metavar='CODE=RATE', help='suntik error, mis. 429=0.05')
+    ap.add_argument('--retry-after', type=float, default=1.0, help='nilai header Retry-After untuk 429 (detik)')
+    ap.add_argument('--chunk-delay', type=float, default=0.05, help='jeda antar chunk stream (detik)')
+    ap.add_argument('--uplink-mbps', type=float, default=0.0, help='simulasi bandwidth upload (0 = tanpa batas)')
+    ap.add_argument('--fixtures', default=FIXTURES_FILE, help='file JSON fixture jawaban')
+    args = ap.parse_args()
+
+    srv = start_standin(
+        args.port, latency=args.latency, failures=parse_failures(args.fail), fixtures=load_fixtures(args.fixtures),
+        retry_after=args.retry_after, chunk_delay=args.chunk_delay, uplink_mbps=args.uplink_mbps,
+    )
+    print(f'Gemini stand-in di {srv.base_url}  (statistik: {srv.base_url}/_standin/stats)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
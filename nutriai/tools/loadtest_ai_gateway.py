@@ -0,0 +1,155 @@
+"""
+Load test: latency endpoint non-AI (/api/dashboard) saat upstream AI lambat.
+
+Menjalankan:
+  1. Gemini stand-in (tools/gemini_standin.py) yang sengaja lambat (default
+     8 detik per request),
+  2. backend NutriAI lewat gunicorn + gunicorn.conf.py, diarahkan ke server
+     tiruan itu lewat GEMINI_BASE_URL (database SQLite sementara),
+lalu mengukur latency /api/dashboard dalam 2 fase:
+  - baseline: tanpa beban AI,
+  - beban:    sambil N request /api/ai/chat paralel menunggu upstream lambat.
+
+Contoh (dari folder nutriai/):
+    python tools/loadtest_ai_gateway.py
+    python tools/loadtest_ai_gateway.py --worker-class sync --threads 1   # pembanding: worker lama
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import urllib.request as urlreq
+
+from gemini_standin import start_standin
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def call(method, url, payload=None, token=None, timeout=120):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = json.dumps(payload).encode() if payload is not None else None
+    req  = urlreq.Request(url, data=data, headers=headers, method=method)
+    t0   = time.perf_counter()
+    try:
+        with urlreq.urlopen(req, timeout=timeout) as resp:
+            status, body = resp.status, resp.read()
+    except urlreq.HTTPError as e:
+        status, body = e.code, e.read()
+    return status, body, (time.perf_counter() - t0) * 1000
+
+
+def wait_ready(base, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            call('GET', f'{base}/', timeout=2)   # 404 JSON pun cukup, yang penting server hidup
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise SystemExit('Server tidak bisa start — cek output gunicorn di atas')
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure_dashboard(base, token, n, interval):
+    lat = []
+    for _ in range(n):
+        status, _, ms = call('GET', f'{base}/api/dashboard', token=token)
+        if status == 200:
+            lat.append(ms)
+        time.sleep(interval)
+    return lat
+
+
+def report(label, lat):
+    if not lat:
+        print(f'{label:<10} tidak ada request sukses')
+        return
+    print(f'{label:<10} n={len(lat):<4} p50={statistics.median(lat):7.1f}ms  '
+          f'p95={pct(lat, 95):7.1f}ms  max={max(lat):7.1f}ms')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=5055)
+    ap.add_argument('--upstream-delay', type=float, default=8.0, help='detik per panggilan Gemini tiruan')
+    ap.add_argument('--ai-clients', type=int, default=24, help='jumlah request AI paralel')
+    ap.add_argument('--samples', type=int, default=40, help='jumlah request dashboard per fase')
+    ap.add_argument('--worker-class', default=None, help='override worker_class gunicorn (mis. sync)')
+    ap.add_argument('--workers', type=int, default=1)
+    ap.add_argument('--threads', type=int, default=16)
+    ap.add_argument('--ai-max-inflight', type=int, default=8)
+    args = ap.parse_args()
+
+    upstream = start_standin(latency=f'fixed:{args.upstream_delay}')
+    db_file  = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    env = dict(
+        os.environ,
+        DATABASE_URL        = f'sqlite:///{db_file}',
+        JWT_SECRET_KEY      = 'loadtest-secret',
+        GEMINI_API_KEY      = 'loadtest-key',
+        GEMINI_BASE_URL     = upstream.base_url,
+        GEMINI_CONTEXT_CACHE = '0',
+        SCHEDULER_ENABLED   = '0',
+        PORT                = str(args.port),
+        WEB_CONCURRENCY     = str(args.workers),
+        GUNICORN_THREADS    = str(args.threads),
+        AI_MAX_INFLIGHT     = str(args.ai_max_inflight),
+    )
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app']
+    if args.worker_class:
+        cmd += ['-k', args.worker_class]
+    server = subprocess.Popen(cmd, cwd=HERE, env=env)
+    base   = f'http://127.0.0.1:{args.port}'
+
+    try:
+        wait_ready(base)
+        status, body, _ = call('POST', f'{base}/api/register', {
+            'username': f'loadtest{int(time.time())}', 'password': 'loadtest123',
+            'umur': 25, 'tb': 170, 'bb': 65, 'gender': 'laki_laki',
+            'aktivitas': 'aktivitas_sedang', 'tujuan': 'maintain', 'body_type': 'mesomorph',
+        })
+        if status != 201:
+            raise SystemExit(f'Register gagal: {status} {body[:200]!r}')
+        token = json.loads(body)['token']
+
+        report('baseline', measure_dashboard(base, token, args.samples, 0.05))
+
+        ai_results = []
+
+        def ai_client():
+            status, _, ms = call('POST', f'{base}/api/ai/chat', {'message': 'Tips sarapan sehat?'}, token=token)
+            ai_results.append((status, ms))
+
+        clients = [threading.Thread(target=ai_client) for _ in range(args.ai_clients)]
+        for t in clients:
+            t.start()
+        time.sleep(0.5)   # biarkan request AI menempati thread/slot dulu
+        report('beban AI', measure_dashboard(base, token, args.samples, 0.05))
+        for t in clients:
+            t.join()
+
+        by_status = {}
+        for status, _ in ai_results:
+            by_status[status] = by_status.get(status, 0) + 1
+        print(f'request AI: {by_status}  (429 = di-shed oleh ai_gateway)')
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=15)
+        upstream.shutdown()
+        os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()